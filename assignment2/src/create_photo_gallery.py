@@ -2,11 +2,16 @@
 import sys
 import os
 from photogallery.generator import gallerygenerator
+from photogallery.generator import watcher
 
 if __name__ == '__main__':
   """
   Main function for the whole application.
   """
-  generator = gallerygenerator.create_gallery_generator(sys.argv[1:],
-      os.getcwd())
-  generator.run()
+  input_data = gallerygenerator.parse_command_line_arguments(sys.argv[1:])
+  if input_data['watch']:
+    watcher.watch_and_rebuild(sys.argv[1:], os.getcwd())
+  else:
+    generator = gallerygenerator.create_gallery_generator(sys.argv[1:],
+        os.getcwd())
+    generator.run()
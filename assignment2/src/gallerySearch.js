@@ -0,0 +1,159 @@
+(function() {
+  var MAX_RESULTS, TERM_RE, byId, cache, fetchJson, form, index, input,
+    matchTerm, results, search, shardKey, showResults, terms;
+
+  MAX_RESULTS = 50;
+
+  // Splits text the way photogallery/generator/searchindex.py does.
+  TERM_RE = /[0-9a-z_\u00c0-\uffff]+/g;
+
+  cache = {};
+
+  index = null;
+
+  byId = function(id) {
+    return document.getElementById(id);
+  };
+
+  form = byId('searchForm');
+
+  input = byId('searchQuery');
+
+  results = byId('searchResults');
+
+  fetchJson = function(name, callback) {
+    var request;
+    if (name in cache) {
+      return callback(cache[name]);
+    }
+    request = new XMLHttpRequest();
+    request.open('GET', 'search/' + name);
+    request.onload = function() {
+      cache[name] = request.status === 200 ? JSON.parse(request.responseText) : null;
+      return callback(cache[name]);
+    };
+    request.onerror = function() {
+      return callback(null);
+    };
+    return request.send();
+  };
+
+  terms = function(text) {
+    var term, _i, _len, _ref, _results;
+    _ref = text.toLowerCase().match(TERM_RE) || [];
+    _results = [];
+    for (_i = 0, _len = _ref.length; _i < _len; _i++) {
+      term = _ref[_i];
+      if (term.length >= index.prefix_length) {
+        _results.push(term);
+      }
+    }
+    return _results;
+  };
+
+  shardKey = function(term) {
+    var character, key, _i, _len, _ref;
+    key = '';
+    _ref = term.slice(0, index.prefix_length);
+    for (_i = 0, _len = _ref.length; _i < _len; _i++) {
+      character = _ref.charAt(_i);
+      if (/[0-9a-z]/.test(character)) {
+        key += character;
+      } else {
+        key += '_' + character.charCodeAt(0).toString(16);
+      }
+    }
+    return key;
+  };
+
+  // The ids of the pictures with a term starting with prefix, or exactly
+  // matching it if exact is true, that are also in previous (unless it is
+  // null). The ids are stored delta encoded.
+  matchTerm = function(shard, prefix, exact, previous) {
+    var delta, id, matches, term, _i, _len, _ref;
+    matches = {};
+    for (term in shard || {}) {
+      if (term === prefix || (!exact && term.indexOf(prefix) === 0)) {
+        id = 0;
+        _ref = shard[term];
+        for (_i = 0, _len = _ref.length; _i < _len; _i++) {
+          delta = _ref[_i];
+          id += delta;
+          if (previous === null || previous[id]) {
+            matches[id] = true;
+          }
+        }
+      }
+    }
+    return matches;
+  };
+
+  // Every word of the query has to match, and the last one only has to be
+  // the start of a word, so results show up while typing.
+  search = function(query) {
+    var step, words;
+    words = terms(query);
+    if (words.length === 0) {
+      return showResults([]);
+    }
+    step = function(position, matches) {
+      var word;
+      if (input.value !== query) {
+        return;
+      }
+      if (position === words.length) {
+        return showResults(Object.keys(matches).map(Number).sort(function(a, b) {
+          return a - b;
+        }).slice(0, MAX_RESULTS));
+      }
+      word = words[position];
+      return fetchJson('terms-' + shardKey(word) + '.json', function(shard) {
+        return step(position + 1, matchTerm(shard, word,
+          position < words.length - 1, matches));
+      });
+    };
+    return step(0, null);
+  };
+
+  // Each result gets its place in the list straight away, and is filled in
+  // once its docs file has loaded.
+  showResults = function(ids) {
+    results.innerHTML = '';
+    return ids.forEach(function(id) {
+      var item, shard;
+      item = document.createElement('li');
+      results.appendChild(item);
+      shard = Math.floor(id / index.documents_per_shard);
+      return fetchJson('docs-' + shard + '.json', function(entries) {
+        var entry, image, link;
+        if (entries === null) {
+          return;
+        }
+        entry = entries[id % index.documents_per_shard];
+        link = document.createElement('a');
+        link.href = entry[0];
+        link.title = entry[2];
+        image = document.createElement('img');
+        image.src = entry[1];
+        image.alt = entry[2];
+        link.appendChild(image);
+        return item.appendChild(link);
+      });
+    });
+  };
+
+  fetchJson('index.json', function(loadedIndex) {
+    if (loadedIndex === null) {
+      return;
+    }
+    index = loadedIndex;
+    form.hidden = false;
+    form.addEventListener('submit', function(event) {
+      return event.preventDefault();
+    });
+    return input.addEventListener('input', function(event) {
+      return search(input.value);
+    });
+  });
+
+}).call(this);
@@ -0,0 +1,361 @@
+"""
+Benchmarks for the gallery generator. Run from assignment2/src with
+
+  python -m photogallery.benchmarks.harness [options] [-- pipeline options]
+
+A tree of JPEGs is synthesized in a scratch directory, then the whole
+pipeline (create_gallery_generator(...).run()) is timed, followed by each
+of its stages on their own. See print_usage for the options.
+"""
+import os
+import os.path
+import sys
+import time
+import Queue
+import getopt
+import traceback
+import shutil
+import resource
+import tempfile
+import multiprocessing
+import simplejson as json
+from ..utils.inject import assign_injectables
+from ..utils.getters import with_getters_for
+from ..generator import gallerygenerator
+from ..generator import exporter
+from ..generator.galleryitemfactory import GalleryItemFactory, is_jpeg_file
+from ..generator.templatewriter import create_template_writer
+from ..generator.scanner import FileIndex
+from ..generator.copier import CopyEngine
+from synthesizer import GalleryTreeSynthesizer, MANIFEST
+
+# The directory holding the static files, like create_photo_gallery.py's
+# working directory.
+STATIC_FILES_DIRECTORY = os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))))
+# How often to check that the full pipeline's process is still running.
+POLL_SECONDS = 1.0
+
+
+class PipelineError(Exception):
+  """ Raised when the full pipeline fails instead of finishing. """
+  pass
+
+
+def get_peak_rss_kilobytes(who=resource.RUSAGE_SELF):
+  """
+  Returns the largest resident set size of this process (or its waited-for
+  children) so far, in kilobytes.
+  """
+  peak_rss = resource.getrusage(who).ru_maxrss
+  if sys.platform == 'darwin':
+    return peak_rss // 1024 # Reported in bytes instead of kilobytes.
+  return peak_rss
+
+
+class BenchmarkResult(object):
+  """ How long one stage took, and how many items it handled. """
+  def __init__(self, name, seconds, item_count, peak_rss_kilobytes):
+    assign_injectables(self, locals())
+
+  def get_items_per_second(self):
+    if self.seconds == 0:
+      return None
+    return self.item_count / self.seconds
+
+  def as_view(self):
+    return {'name': self.name, 'seconds': self.seconds,
+        'item_count': self.item_count,
+        'items_per_second': self.get_items_per_second(),
+        'peak_rss_kilobytes': self.peak_rss_kilobytes}
+with_getters_for(BenchmarkResult, 'name', 'seconds', 'item_count',
+    'peak_rss_kilobytes')
+
+
+def run_pipeline(arguments):
+  """
+  Runs the whole pipeline, in a child process so that its peak memory use
+  is its own. This is a module level function so that it can be the target
+  of a multiprocessing.Process.
+
+  Args:
+    arguments a tuple of (command line arguments, result queue). A tuple of
+              (seconds, peak RSS in kilobytes, None) is put on the queue if
+              the pipeline finishes, and (None, None, error) if it fails,
+              even by calling sys.exit.
+  """
+  command_line_arguments, result_queue = arguments
+  start = time.time()
+  try:
+    generator = gallerygenerator.create_gallery_generator(
+        command_line_arguments, STATIC_FILES_DIRECTORY)
+    generator.run()
+  except BaseException as pipeline_error:
+    if isinstance(pipeline_error, SystemExit):
+      error = 'the pipeline exited with status %s' % (pipeline_error.code,)
+    else:
+      error = traceback.format_exc()
+    result_queue.put((None, None, error))
+    return
+  result_queue.put((time.time() - start, get_peak_rss_kilobytes(), None))
+
+
+class Benchmark(object):
+  """
+  Times the pipeline and its stages on one synthesized tree. The stages run
+  in order in this process, each one using what the one before it made, so
+  their peak memory figures are the peak so far.
+  """
+  def __init__(self, synthesizer, work_directory, pipeline_arguments=None):
+    """
+    Constructor for Benchmark.
+
+    Args:
+      synthesizer the GalleryTreeSynthesizer that writes the input tree.
+      work_directory the scratch directory for the input and output trees.
+      pipeline_arguments extra command line arguments for the full
+                         pipeline, such as ['-w', '4'].
+    """
+    assign_injectables(self, locals())
+    self.input_directory = os.path.join(work_directory, 'input')
+    self.manifest_file_name = os.path.join(work_directory, 'manifest.json')
+    self.results = []
+
+  def prepare(self):
+    """ Write the input tree and the manifest. """
+    self.synthesizer.write_tree(self.input_directory)
+    self.synthesizer.write_manifest(self.manifest_file_name)
+
+  def run(self):
+    """
+    Run every benchmark.
+
+    Returns:
+      A list of BenchmarkResults, with the full pipeline first.
+    """
+    self.results = []
+    self.time_full_pipeline()
+    self.time_stage('scan', self.scan)
+    self.time_stage('read metadata', self.read_metadata)
+    self.time_stage('render pages', self.render_pages)
+    self.time_stage('write pages', self.write_pages)
+    self.time_stage('copy files', self.copy_files)
+    return self.results
+
+  def time_full_pipeline(self):
+    output_directory = os.path.join(self.work_directory, 'output-pipeline')
+    command_line_arguments = ['-i', self.input_directory,
+        '-o', output_directory, '-m', self.manifest_file_name, '-n'] + \
+        list(self.pipeline_arguments or [])
+    result_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_pipeline,
+        args=((command_line_arguments, result_queue),))
+    process.start()
+    seconds, peak_rss_kilobytes, error = \
+        self.wait_for_pipeline(process, result_queue)
+    process.join()
+    if error is not None:
+      raise PipelineError(error)
+    self.results.append(BenchmarkResult('full pipeline', seconds,
+      self.synthesizer.count_pictures(), peak_rss_kilobytes))
+
+  def wait_for_pipeline(self, process, result_queue):
+    """
+    Helper for time_full_pipeline, waits for run_pipeline's result, and
+    gives up if its process dies without one.
+
+    Returns:
+      The tuple that run_pipeline puts on result_queue.
+    """
+    while True:
+      try:
+        return result_queue.get(timeout=POLL_SECONDS)
+      except Queue.Empty:
+        if not process.is_alive():
+          break
+    # The result may have arrived just before the process exited.
+    try:
+      return result_queue.get(timeout=POLL_SECONDS)
+    except Queue.Empty:
+      return (None, None,
+          'the pipeline died with exit code %s' % (process.exitcode,))
+
+  def time_stage(self, name, stage):
+    """
+    Time a single stage.
+
+    Args:
+      name the name to report the stage under.
+      stage a function that runs the stage and returns the number of items
+            it handled.
+    """
+    start = time.time()
+    item_count = stage()
+    seconds = time.time() - start
+    self.results.append(BenchmarkResult(name, seconds, item_count,
+      get_peak_rss_kilobytes()))
+
+  def scan(self):
+    self.input_index = FileIndex(self.input_directory)
+    self.input_index.scan()
+    return self.input_index.get_entry_count()
+
+  def read_metadata(self):
+    factory = GalleryItemFactory(MANIFEST, False,
+        list_directory=self.input_index.list_directory_contents,
+        is_directory=self.input_index.is_directory)
+    self.top_directory = factory.create_directory(self.input_directory)
+    return self.synthesizer.count_pictures()
+
+  def render_pages(self):
+    exporter.configure_exporters()
+    self.pages = exporter.create_photo_directory_exporter().export(
+        self.top_directory)
+    return len(self.pages)
+
+  def write_pages(self):
+    template_writer = create_template_writer(
+        os.path.join(self.work_directory, 'output-stages'))
+    template_writer.write_templates(self.pages)
+    return len(self.pages)
+
+  def copy_files(self):
+    return CopyEngine().copy_files(self.input_index.find_files(is_jpeg_file),
+        os.path.join(self.work_directory, 'output-stages'),
+        self.input_index.stat)
+
+
+def format_results(results, baseline=None):
+  """
+  Lay the results out as a table.
+
+  Args:
+    results a list of BenchmarkResults.
+    baseline a dict mapping stage names to the seconds they took in an
+             earlier run, to compare against, or None.
+
+  Returns:
+    A list of lines.
+  """
+  lines = ['%-16s %10s %8s %12s %12s' % ('stage', 'seconds', 'items',
+    'items/sec', 'peak RSS MB')]
+  for result in results:
+    items_per_second = result.get_items_per_second()
+    line = '%-16s %10.3f %8d %12s %12.1f' % (result.get_name(),
+        result.get_seconds(), result.get_item_count(),
+        '-' if items_per_second is None else '%.1f' % items_per_second,
+        result.get_peak_rss_kilobytes() / 1024.0)
+    if baseline is not None and baseline.get(result.get_name()):
+      change = result.get_seconds() / baseline[result.get_name()] - 1
+      line += ' %+7.1f%%' % (change * 100)
+    lines.append(line)
+  return lines
+
+
+def load_baseline(file_name):
+  """ Read the stage timings from a file written with --json. """
+  with open(file_name, 'r') as baseline_file:
+    state = json.load(baseline_file)
+  return dict((result['name'], result['seconds']) \
+      for result in state['results'])
+
+
+def parse_command_line_arguments(command_line_arguments):
+  """
+  Acceptable command line arguments are:
+  -h, --help -> Prints a help message
+  --depth -> The number of levels of albums below the top one (default 2).
+  --width -> The number of albums in each album above the bottom level
+             (default 3).
+  --pictures -> The number of JPEGs in each album (default 50).
+  --padding -> Bytes of padding to add to each JPEG (default 0).
+  --work-directory -> The scratch directory to use, a temporary one is
+                      created and removed by default.
+  --json -> A file to write the results to.
+  --compare -> A file written with --json by an earlier run, to compare
+               the timings against.
+  Anything after -- is passed on to the full pipeline.
+
+  Args:
+    command_line_arguments the command line arguments with the program
+                           name removed.
+  """
+  try:
+    options, arguments = getopt.getopt(command_line_arguments, 'h',
+        ['help', 'depth=', 'width=', 'pictures=', 'padding=',
+          'work-directory=', 'json=', 'compare='])
+  except getopt.GetoptError:
+    print_usage()
+    sys.exit(2)
+
+  input_data = {'depth': 2, 'width': 3, 'pictures': 50, 'padding': 0,
+      'work_directory': None, 'json': None, 'compare': None,
+      'pipeline_arguments': arguments}
+  for option, argument in options:
+    if option in ('-h', '--help'):
+      print_usage()
+      sys.exit(0)
+    elif option in ('--depth', '--width', '--pictures', '--padding'):
+      if argument.isdigit():
+        input_data[option[2:]] = int(argument)
+      else:
+        print argument, "isn't a number."
+        print_usage()
+        sys.exit(1)
+    elif option == '--work-directory':
+      input_data['work_directory'] = argument
+    elif option == '--json':
+      input_data['json'] = argument
+    elif option == '--compare':
+      input_data['compare'] = argument
+  return input_data
+
+
+def print_usage():
+  print "python -m photogallery.benchmarks.harness [options] " + \
+      "[-- pipeline options]"
+  print "--depth=2 Levels of albums below the top one."
+  print "--width=3 Albums in each album above the bottom level."
+  print "--pictures=50 JPEGs in each album."
+  print "--padding=0 Bytes of padding to add to each JPEG."
+  print "--work-directory=dir Keep the trees in dir instead of a " + \
+      "temporary directory."
+  print "--json=results.json Write the results to results.json."
+  print "--compare=results.json Compare the timings to an earlier run."
+  print "Anything after -- is passed to the pipeline, for example -- -w 4."
+
+
+def main(command_line_arguments):
+  input_data = parse_command_line_arguments(command_line_arguments)
+  work_directory = input_data['work_directory']
+  remove_work_directory = work_directory is None
+  if remove_work_directory:
+    work_directory = tempfile.mkdtemp(prefix='photogallery-benchmark-')
+  synthesizer = GalleryTreeSynthesizer(input_data['depth'],
+      input_data['width'], input_data['pictures'], input_data['padding'])
+  benchmark = Benchmark(synthesizer, work_directory,
+      input_data['pipeline_arguments'])
+  try:
+    benchmark.prepare()
+    results = benchmark.run()
+  except PipelineError as pipeline_error:
+    print 'The full pipeline failed:', pipeline_error
+    sys.exit(1)
+  finally:
+    if remove_work_directory:
+      shutil.rmtree(work_directory)
+  baseline = None
+  if input_data['compare'] is not None:
+    baseline = load_baseline(input_data['compare'])
+  print '\n'.join(format_results(results, baseline))
+  if input_data['json'] is not None:
+    with open(input_data['json'], 'w') as json_file:
+      json.dump({'depth': input_data['depth'], 'width': input_data['width'],
+        'pictures': input_data['pictures'],
+        'pipeline_arguments': input_data['pipeline_arguments'],
+        'results': [result.as_view() for result in results]}, json_file,
+        indent=2)
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
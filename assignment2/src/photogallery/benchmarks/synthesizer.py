@@ -0,0 +1,109 @@
+"""
+Module providing GalleryTreeSynthesizer, which writes a tree of small but
+valid JPEGs with IPTC data for the benchmarks to build galleries from.
+"""
+import os
+import os.path
+import struct
+import base64
+import simplejson as json
+from ..utils.inject import assign_injectables
+
+# An 8x8 grey baseline JPEG, so that the pictures can also be resized.
+TINY_JPEG = base64.b64decode(
+    '/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9'
+    'PDkzODdASFxOQERXRTc4UG1RV19iZ2hnPk1xeXBkeFxlZ2P/wAALCAAIAAgBAREA/8QAHwAA'
+    'AQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQR'
+    'BRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RF'
+    'RkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ip'
+    'qrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/9oACAEB'
+    'AAA/ACv/2Q==')
+
+# The manifest written next to the tree, and the values of its datasets.
+MANIFEST = {'Photographer': 80, 'City': 90, 'Country': 101,
+    'Description': 120}
+
+
+def iptc_segment(datasets):
+  """
+  Builds an APP13 segment holding IPTC data.
+
+  Args:
+    datasets a list of (dataset number, value) pairs from record 2.
+
+  Returns:
+    The bytes of the segment, marker included.
+  """
+  iim = ''.join(struct.pack('>BBBH', 0x1c, 2, number, len(value)) + value \
+      for number, value in datasets)
+  resource = '8BIM' + struct.pack('>H', 0x0404) + '\0\0' + \
+      struct.pack('>I', len(iim)) + iim
+  if len(iim) % 2:
+    resource += '\0'
+  payload = 'Photoshop 3.0\0' + resource
+  return '\xff\xed' + struct.pack('>H', len(payload) + 2) + payload
+
+
+class GalleryTreeSynthesizer(object):
+  """
+  Writes a tree of directories where every directory has the same number of
+  JPEGs and subdirectories, down to a fixed depth.
+  """
+  def __init__(self, depth, width, pictures_per_directory, padding_bytes=0):
+    """
+    Constructor for GalleryTreeSynthesizer.
+
+    Args:
+      depth the number of levels of subdirectories below the top directory.
+      width the number of subdirectories in each directory above the
+            bottom level.
+      pictures_per_directory the number of JPEGs in each directory.
+      padding_bytes the number of bytes to append to each JPEG after its
+                    image data, to make copying it cost as much as copying
+                    a real photo would.
+    """
+    assign_injectables(self, locals())
+
+  def count_pictures(self):
+    """ Returns the number of JPEGs that write_tree creates. """
+    directory_count = sum(self.width ** level \
+        for level in range(self.depth + 1))
+    return directory_count * self.pictures_per_directory
+
+  def write_tree(self, input_directory):
+    """
+    Write the tree.
+
+    Args:
+      input_directory the directory to write it into, which is created if
+                      it doesn't exist.
+
+    Effects:
+      Writes directories and JPEGs under input_directory.
+    """
+    to_write = [(input_directory, 0)]
+    while to_write:
+      directory, level = to_write.pop()
+      if not os.path.isdir(directory):
+        os.makedirs(directory)
+      for index in range(self.pictures_per_directory):
+        self.write_picture(directory, level, index)
+      if level < self.depth:
+        to_write.extend((os.path.join(directory, 'album %d' % index),
+          level + 1) for index in range(self.width))
+
+  def write_picture(self, directory, level, index):
+    """ Write a single JPEG with IPTC data. """
+    datasets = [(80, 'Photographer %d' % (index % 7)),
+        (90, 'City %d' % level), (101, 'Country'),
+        (120, 'Picture %d of %s' % (index, os.path.basename(directory)))]
+    contents = TINY_JPEG[:2] + iptc_segment(datasets) + TINY_JPEG[2:] + \
+        '\0' * self.padding_bytes
+    file_name = os.path.join(directory, 'IMG_%05d.jpg' % index)
+    with open(file_name, 'wb') as picture_file:
+      picture_file.write(contents)
+
+  def write_manifest(self, manifest_file_name):
+    """ Write the manifest describing the JPEGs' metadata. """
+    with open(manifest_file_name, 'w') as manifest_file:
+      json.dump(MANIFEST, manifest_file, indent=2)
@@ -0,0 +1,485 @@
+"""
+Module providing BuildCache, which remembers what a previous run of the
+generator did so that an unchanged archive does not have to be processed
+again. It stores the manifest metadata extracted from every JPEG, keyed by
+the file's path, modification time and size, and a fingerprint of every page
+that was rendered. A page only needs to be rendered again if its fingerprint
+changed.
+
+The cache is only saved when a build finishes, so as it goes, a build also
+appends what it has done to a BuildJournal next to the cache. A build that
+was interrupted can then be resumed from the journal instead of starting
+over.
+"""
+import os
+import os.path
+import hashlib
+import cPickle as pickle
+from ..utils.inject import assign_injectables
+from galleryitem import JpegDirectory, DirectorySummary
+from galleryitemfactory import EXTRACTED, NO_IPTC_DATA, ExtractedIptcInfo
+
+CACHE_FILE_NAME = '.photogallery-cache'
+# Bump this whenever the templates or the cache layout change, so that
+# caches written by older versions are thrown away.
+CACHE_FORMAT_VERSION = 2
+JOURNAL_SUFFIX = '.journal'
+
+
+def hash_manifest(lookup_table):
+  """
+  Compute a stable hash of the manifest's lookup table.
+
+  Args:
+    lookup_table the dict mapping attribute names to IPTC dataset numbers.
+
+  Returns:
+    A hex digest that changes whenever the lookup table does.
+  """
+  entries = sorted(lookup_table.items())
+  return hashlib.sha1(repr((CACHE_FORMAT_VERSION, entries))).hexdigest()
+
+
+def hash_parts(parts):
+  """
+  Hash a list of strings into a single fingerprint.
+
+  Args:
+    parts the strings to hash. Their order matters.
+  """
+  digest = hashlib.sha1()
+  for part in parts:
+    digest.update(str(part))
+    digest.update('\0')
+  return digest.hexdigest()
+
+
+class BuildJournal(object):
+  """
+  An append-only file of the metadata read and the pages written by a
+  build, in the order they happened. Each record is pickled separately and
+  flushed as soon as it is added, so a build that dies loses at most the
+  record it was writing.
+  """
+  def __init__(self, file_name, manifest_hash):
+    """
+    Constructor for BuildJournal.
+
+    Args:
+      file_name the file to keep the journal in.
+      manifest_hash see BuildCache. Journals written for other manifests
+                    are ignored.
+    """
+    assign_injectables(self, locals())
+    self.journal_file = None
+    self.valid_length = 0
+
+  def replay(self):
+    """
+    Read the journal left by an earlier build.
+
+    Returns:
+      A (pictures, pages) tuple of dicts like the ones BuildCache takes,
+      holding what the earlier build did. They are empty if there is no
+      usable journal.
+    """
+    pictures = {}
+    pages = {}
+    self.valid_length = 0
+    try:
+      with open(self.file_name, 'rb') as journal_file:
+        header = pickle.load(journal_file)
+        if header != ('header', CACHE_FORMAT_VERSION, self.manifest_hash):
+          return (pictures, pages)
+        self.valid_length = journal_file.tell()
+        while True:
+          record = pickle.load(journal_file)
+          if record[0] == 'picture':
+            pictures[record[1]] = record[2]
+          elif record[0] == 'page':
+            pages[record[1]] = record[2]
+          self.valid_length = journal_file.tell()
+    except (IOError, EOFError, pickle.UnpicklingError, ValueError,
+        IndexError, TypeError):
+      # The end of the journal, possibly half way through a record.
+      pass
+    return (pictures, pages)
+
+  def open(self, keep_records=False):
+    """
+    Start adding to the journal.
+
+    Args:
+      keep_records whether to keep the records that replay read, instead
+                   of starting an empty journal.
+    """
+    if keep_records and self.valid_length > 0:
+      self.journal_file = open(self.file_name, 'r+b')
+      # Cut off a record that was only half written.
+      self.journal_file.truncate(self.valid_length)
+      self.journal_file.seek(self.valid_length)
+    else:
+      self.journal_file = open(self.file_name, 'wb')
+      self.append(('header', CACHE_FORMAT_VERSION, self.manifest_hash))
+
+  def append(self, record):
+    """ Add a record to the journal, if it is open. """
+    if self.journal_file is None:
+      return
+    pickle.dump(record, self.journal_file, pickle.HIGHEST_PROTOCOL)
+    self.journal_file.flush()
+
+  def record_picture(self, full_jpeg_name, entry):
+    """
+    Note that a JPEG's metadata was read.
+
+    Args:
+      full_jpeg_name the path of the JPEG.
+      entry the (stamp, status, data) tuple that BuildCache keeps for it.
+    """
+    self.append(('picture', full_jpeg_name, entry))
+
+  def record_page(self, file_name, fingerprint):
+    """
+    Note that all the pages of a GalleryItem were written.
+
+    Args:
+      file_name the output file name of the GalleryItem.
+      fingerprint the fingerprint of its pages.
+    """
+    self.append(('page', file_name, fingerprint))
+
+  def remove(self):
+    """ Close and delete the journal, once the build is safely over. """
+    if self.journal_file is not None:
+      self.journal_file.close()
+      self.journal_file = None
+    if os.path.exists(self.file_name):
+      os.remove(self.file_name)
+
+
+class BuildCache(object):
+  """
+  The persistent state of incremental builds. The GalleryItemFactory asks it
+  for metadata before opening a JPEG, and the GalleryGenerator asks it which
+  pages need to be rendered.
+  """
+  def __init__(self, cache_file_name, manifest_hash, pictures, pages,
+      stat_file=os.stat, file_exists=os.path.isfile, template_globals=None,
+      journal=None):
+    """
+    Constructor for BuildCache.
+
+    Args:
+      cache_file_name the file the cache is saved to.
+      manifest_hash the hash of the current manifest, see hash_manifest.
+      pictures a dict mapping JPEG paths to (stamp, status, data) tuples
+               from the previous run.
+      pages a dict mapping output file names to their fingerprints from
+            the previous run.
+      stat_file the function used to stat a JPEG, defaults to os.stat.
+      file_exists the function used to check that an output file is still
+                  there, defaults to os.path.isfile.
+      template_globals the variables the pages are rendered with, see
+                       exporter.create_environment. Directory pages are
+                       rendered again when they change.
+      journal the open BuildJournal to record the build's progress in, or
+              None to not keep one.
+    """
+    assign_injectables(self, locals())
+    if self.template_globals is None:
+      self.template_globals = {}
+    self.stamps = {}
+    self.new_pictures = {}
+    self.new_pages = {}
+    # Maps the files of the pages being rendered to the output file names
+    # of their GalleryItems, and those to the number of files still to be
+    # written, see record_written_file.
+    self.unwritten_items = {}
+    self.unwritten_counts = {}
+
+  def get_stamp(self, full_jpeg_name):
+    """
+    Returns the (modification time, size) of a file. Each file is only
+    stat'ed once per run.
+
+    Args:
+      full_jpeg_name the path of the file.
+    """
+    if full_jpeg_name not in self.stamps:
+      stat_result = self.stat_file(full_jpeg_name)
+      self.stamps[full_jpeg_name] = (stat_result.st_mtime, stat_result.st_size)
+    return self.stamps[full_jpeg_name]
+
+  def lookup(self, full_jpeg_name):
+    """
+    Find the metadata extracted from a JPEG by a previous run.
+
+    Args:
+      full_jpeg_name the path of the JPEG.
+
+    Returns:
+      A (status, payload) tuple like the ones returned by
+      galleryitemfactory.extract_iptc_data, or None if the file is not in
+      the cache or has changed since it was cached.
+    """
+    if full_jpeg_name not in self.pictures:
+      return None
+    stamp, status, data = self.pictures[full_jpeg_name]
+    try:
+      if stamp != self.get_stamp(full_jpeg_name):
+        return None
+    except OSError:
+      return None
+    self.new_pictures[full_jpeg_name] = (stamp, status, data)
+    if status == EXTRACTED:
+      return (status, ExtractedIptcInfo(dict(data)))
+    return (status, None)
+
+  def store(self, full_jpeg_name, outcome):
+    """
+    Remember the metadata extracted from a JPEG. Files that could not be
+    read at all are not remembered, so they will be tried again next time.
+
+    Args:
+      full_jpeg_name the path of the JPEG.
+      outcome the (status, payload) tuple returned by extract_iptc_data.
+    """
+    status, iptc_info = outcome
+    if status == EXTRACTED:
+      data = iptc_info.get_data().items()
+    elif status == NO_IPTC_DATA:
+      data = None
+    else:
+      return
+    try:
+      stamp = self.get_stamp(full_jpeg_name)
+    except OSError:
+      return
+    self.new_pictures[full_jpeg_name] = (stamp, status, data)
+    if self.journal is not None:
+      self.journal.record_picture(full_jpeg_name, (stamp, status, data))
+
+  def compute_page_fingerprints(self, top_directory):
+    """
+    Walk the gallery tree and fingerprint every page. A picture's page
+    depends on the picture's file, its resized copies and the manifest; a
+    directory's page depends on its own position in the tree and on all of
+    its contents, so a change anywhere below a directory changes that
+    directory's fingerprint too.
+
+    Args:
+      top_directory the JpegDirectory at the top of the gallery.
+
+    Returns:
+      A dict mapping output file names to fingerprints.
+    """
+    fingerprints = {}
+    self.fingerprint_directory(top_directory, fingerprints)
+    return fingerprints
+
+  def fingerprint_directory(self, directory, fingerprints):
+    """
+    Helper for compute_page_fingerprints, handles a single JpegDirectory.
+
+    Args:
+      directory the JpegDirectory to fingerprint.
+      fingerprints the dict to add the fingerprints to.
+
+    Returns:
+      The fingerprint of directory.
+    """
+    parts = [self.manifest_hash, directory.get_name(),
+        directory.get_back_href(), directory.get_page_size(),
+        directory.get_title(),
+        sorted(self.template_globals.items())]
+    for entry in directory.get_contents():
+      if isinstance(entry, JpegDirectory):
+        parts.append(self.fingerprint_directory(entry, fingerprints))
+      elif isinstance(entry, DirectorySummary):
+        # Only the subdirectory's entry is shown here, and that is made
+        # from its name alone.
+        parts.append(entry.get_name())
+      else:
+        full_jpeg_name = os.path.join(directory.get_name(), entry.get_name())
+        parts.append(self.fingerprint_picture(full_jpeg_name, entry,
+          fingerprints))
+    fingerprint = hash_parts(parts)
+    fingerprints[directory.get_output_file_name()] = fingerprint
+    return fingerprint
+
+  def fingerprint_picture(self, full_jpeg_name, picture, fingerprints):
+    """
+    Helper for compute_page_fingerprints, handles a single JpegPicture.
+
+    Args:
+      full_jpeg_name the path of the picture's file.
+      picture the JpegPicture to fingerprint.
+      fingerprints the dict to add the fingerprint to.
+
+    Returns:
+      The fingerprint of picture.
+    """
+    variants = picture.get_variants()
+    if variants is not None:
+      variants = sorted(variants.items())
+    fingerprint = hash_parts([self.manifest_hash, full_jpeg_name,
+        self.get_stamp(full_jpeg_name), picture.get_back_href(), variants])
+    fingerprints[picture.get_output_file_name()] = fingerprint
+    return fingerprint
+
+  def create_page_filter(self, top_directory, output_directory):
+    """
+    Decide which pages have to be rendered in this run.
+
+    Args:
+      top_directory the JpegDirectory at the top of the gallery.
+      output_directory the directory the pages are written to.
+
+    Returns:
+      A function that takes a GalleryItem and returns True if its pages have
+      changed since the last run, or any of them are missing from
+      output_directory.
+    """
+    self.new_pages = self.compute_page_fingerprints(top_directory)
+    return self.create_fingerprint_filter(output_directory)
+
+  def add_directory(self, directory):
+    """
+    Fingerprint the pages of one more directory, for builds that create the
+    directories one at a time (see GalleryItemFactory.iter_directories).
+    Every directory has to be added before its pages are filtered.
+
+    Args:
+      directory a JpegDirectory whose subdirectories are DirectorySummaries.
+    """
+    self.fingerprint_directory(directory, self.new_pages)
+
+  def create_fingerprint_filter(self, output_directory):
+    """
+    Create the page filter for the pages fingerprinted so far, see
+    create_page_filter.
+
+    Args:
+      output_directory the directory the pages are written to.
+    """
+    def page_filter(gallery_item):
+      if self.is_current(gallery_item, output_directory):
+        return False
+      self.expect_files(gallery_item)
+      return True
+    return page_filter
+
+  def is_current(self, gallery_item, output_directory):
+    """
+    Helper for create_fingerprint_filter, returns True if the pages of a
+    GalleryItem don't need to be rendered again.
+    """
+    file_name = gallery_item.get_output_file_name()
+    if self.pages.get(file_name) != self.new_pages.get(file_name):
+      return False
+    for page_file_name in gallery_item.get_output_file_names():
+      if not self.file_exists(os.path.join(output_directory, page_file_name)):
+        return False
+    return True
+
+  def expect_files(self, gallery_item):
+    """
+    Remember which files a GalleryItem that is about to be rendered will
+    write, so that it can be journaled once they are all written.
+    """
+    file_names = gallery_item.get_output_file_names()
+    if not file_names:
+      return # A DirectorySummary, its directory is rendered elsewhere.
+    item_file_name = gallery_item.get_output_file_name()
+    for file_name in file_names:
+      self.unwritten_items[file_name] = item_file_name
+    self.unwritten_counts[item_file_name] = len(file_names)
+
+  def record_written_file(self, file_name):
+    """
+    Note that a page was written (or was already current), see
+    TemplateWriter.write_templates. Once all the pages of a GalleryItem are
+    written, its fingerprint goes in the journal, so a resumed build won't
+    render it again.
+
+    Args:
+      file_name the name of the page, relative to the output directory.
+    """
+    item_file_name = self.unwritten_items.pop(file_name, None)
+    if item_file_name is None:
+      return
+    self.unwritten_counts[item_file_name] -= 1
+    if self.unwritten_counts[item_file_name] == 0:
+      del self.unwritten_counts[item_file_name]
+      if self.journal is not None \
+          and item_file_name in self.new_pages:
+        self.journal.record_page(item_file_name,
+            self.new_pages[item_file_name])
+
+  def save(self):
+    """
+    Write the state of this run to the cache file. Entries for files that
+    were not seen in this run are dropped.
+
+    Effects:
+      Writes self.cache_file_name, and deletes the journal.
+    """
+    state = {'version': CACHE_FORMAT_VERSION,
+        'manifest_hash': self.manifest_hash,
+        'pictures': self.new_pictures,
+        'pages': self.new_pages}
+    temporary_name = self.cache_file_name + '.tmp'
+    with open(temporary_name, 'wb') as cache_file:
+      pickle.dump(state, cache_file, pickle.HIGHEST_PROTOCOL)
+    os.rename(temporary_name, self.cache_file_name)
+    if self.journal is not None:
+      self.journal.remove()
+
+
+def load_build_cache(output_directory, lookup_table, stat_file=os.stat,
+    template_globals=None, cache_file_name=CACHE_FILE_NAME, resume=False):
+  """
+  Factory function for BuildCache, reads the cache left in output_directory
+  by a previous run. A missing or unreadable cache, or one written for a
+  different manifest, gives an empty BuildCache.
+
+  Args:
+    output_directory the directory that the gallery is written to.
+    lookup_table the lookup table parsed from the manifest.
+    stat_file the function used to stat the JPEGs, defaults to os.stat.
+    template_globals see BuildCache.
+    cache_file_name the name of the cache file in output_directory, builds
+                    that only do part of the gallery (see sharding) each
+                    keep their own.
+    resume whether to pick up where an interrupted build left off, by
+           adding what its journal says it did to the cache. Otherwise the
+           journal is started over.
+  """
+  cache_file_name = os.path.join(output_directory, cache_file_name)
+  manifest_hash = hash_manifest(lookup_table)
+  pictures = {}
+  pages = {}
+  try:
+    with open(cache_file_name, 'rb') as cache_file:
+      state = pickle.load(cache_file)
+    if state.get('version') == CACHE_FORMAT_VERSION \
+        and state.get('manifest_hash') == manifest_hash:
+      pictures = state['pictures']
+      pages = state['pages']
+  except (IOError, EOFError, pickle.UnpicklingError):
+    print "No usable cache found in %s, rebuilding everything." % \
+        output_directory
+  journal = BuildJournal(cache_file_name + JOURNAL_SUFFIX, manifest_hash)
+  if resume:
+    journal_pictures, journal_pages = journal.replay()
+    print "Resuming an interrupted build, %d pictures and %d pages were " \
+        "already done." % (len(journal_pictures), len(journal_pages))
+    pictures.update(journal_pictures)
+    pages.update(journal_pages)
+  if not os.path.isdir(output_directory):
+    os.makedirs(output_directory)
+  journal.open(keep_records=resume)
+  return BuildCache(cache_file_name, manifest_hash, pictures, pages,
+      stat_file=stat_file, template_globals=template_globals,
+      journal=journal)
@@ -0,0 +1,141 @@
+"""
+Module providing Compressor, which writes precompressed siblings of the
+HTML, CSS and JavaScript files in the output directory (page.html.gz and,
+if the brotli module is installed, page.html.br), so that a web server can
+send those instead of compressing on the fly.
+"""
+import os
+import os.path
+import gzip
+from cStringIO import StringIO
+from multiprocessing.pool import ThreadPool
+from ..utils.inject import assign_injectables
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'brotli'
+SUFFIXES = {GZIP: '.gz', BROTLI: '.br'}
+
+
+def available_formats():
+  """ Returns the formats that can be written with the installed modules. """
+  if brotli is None:
+    return [GZIP]
+  return [GZIP, BROTLI]
+
+
+def sidecar_is_current(source, sidecar, stat_file=os.stat):
+  """
+  Decide whether a compressed copy was made from the current version of a
+  file. Compressed copies are given the modification time of their source,
+  and times are compared to the millisecond because pages can be rewritten
+  within a second of each other in watch mode.
+
+  Args:
+    source the name of the original file.
+    sidecar the name of the compressed copy.
+    stat_file the function used to stat source, defaults to os.stat.
+  """
+  try:
+    sidecar_stat = os.stat(sidecar)
+  except OSError:
+    return False
+  return int(stat_file(source).st_mtime * 1000) == \
+      int(sidecar_stat.st_mtime * 1000)
+
+
+def gzip_contents(contents, mtime):
+  """
+  Compress with gzip. The header carries mtime and no file name, so the
+  output only changes when the contents or mtime do.
+  """
+  buffer = StringIO()
+  gzip_file = gzip.GzipFile(filename='', mode='wb', compresslevel=9,
+      fileobj=buffer, mtime=mtime)
+  try:
+    gzip_file.write(contents)
+  finally:
+    gzip_file.close()
+  return buffer.getvalue()
+
+
+def brotli_contents(contents, mtime):
+  """ Compress with brotli at its highest quality. """
+  return brotli.compress(contents, quality=11)
+
+
+COMPRESS_FUNCTIONS = {GZIP: gzip_contents, BROTLI: brotli_contents}
+
+
+def compress_file(job):
+  """
+  Write one compressed copy of a file.
+
+  Args:
+    job a tuple of (source, format).
+
+  Effects:
+    Writes source plus the format's suffix, with the modification time of
+    source.
+  """
+  source, compression_format = job
+  with open(source, 'rb') as source_file:
+    contents = source_file.read()
+  mtime = os.stat(source).st_mtime
+  sidecar = source + SUFFIXES[compression_format]
+  temporary_name = sidecar + '.tmp'
+  with open(temporary_name, 'wb') as sidecar_file:
+    sidecar_file.write(COMPRESS_FUNCTIONS[compression_format](contents,
+      int(mtime)))
+  os.utime(temporary_name, (mtime, mtime))
+  os.rename(temporary_name, sidecar)
+
+
+class Compressor(object):
+  """
+  Writes the compressed copies of files, skipping the ones that are
+  already current and spreading the work over a pool of threads (zlib and
+  brotli release the interpreter lock while they compress).
+  """
+  def __init__(self, thread_count=1, formats=None):
+    """
+    Constructor for Compressor.
+
+    Args:
+      thread_count the number of threads to compress with, defaults to 1.
+      formats the formats to write, defaults to available_formats().
+    """
+    assign_injectables(self, locals())
+    if self.formats is None:
+      self.formats = available_formats()
+
+  def compress_files(self, file_names, stat_file=os.stat):
+    """
+    Write the compressed copies of files.
+
+    Args:
+      file_names the full names of the files to compress.
+      stat_file the function used to stat the files, defaults to os.stat.
+
+    Returns:
+      The number of compressed copies that were written, not counting the
+      ones that were already current.
+    """
+    jobs = [(file_name, compression_format) for file_name in file_names \
+        for compression_format in self.formats \
+        if not sidecar_is_current(file_name,
+          file_name + SUFFIXES[compression_format], stat_file)]
+    if self.thread_count == 1 or len(jobs) < 2:
+      map(compress_file, jobs)
+    else:
+      thread_pool = ThreadPool(self.thread_count)
+      try:
+        thread_pool.map(compress_file, jobs)
+      finally:
+        thread_pool.close()
+        thread_pool.join()
+    return len(jobs)
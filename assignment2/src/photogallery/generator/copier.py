@@ -1,9 +1,22 @@
 import shutil
 import os
 import os.path
+import errno
+import fcntl
+from multiprocessing.pool import ThreadPool
 from galleryitemfactory import is_jpeg_file, is_css_file, is_js_file
+from scanner import FileIndex
+from ..utils.inject import assign_injectables
+from progress import NullProgressReporter, COPIED_FILES, COPIED_BYTES
 
-def copy_css(from_directory, to_directory):
+COPY = 'copy'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+COPY_MODES = (COPY, HARDLINK, REFLINK)
+# The Linux ioctl that makes a copy-on-write clone of a file (btrfs, XFS).
+FICLONE = 0x40049409
+
+def copy_css(from_directory, to_directory, copy_engine=None):
   """
   Scans from_directory and finds all the CSS files in it and its subdirectories.
   Copies those CSS files to to_directory. Note that to_directory will have a flat
@@ -12,14 +25,16 @@ def copy_css(from_directory, to_directory):
   Args:
     from_directory the directory to search for CSS files
     to_directory the directory to copy the CSS files to
+    copy_engine the CopyEngine that does the copying, or None to copy the
+                files one at a time.
 
   Effects:
     Copies files over the directories in the filesystem.
   """
-  return copy_files_of_type(from_directory, to_directory, is_css_file)
+  return copy_files_of_type(from_directory, to_directory, is_css_file, copy_engine)
 
 
-def copy_jpegs(from_directory, to_directory):
+def copy_jpegs(from_directory, to_directory, copy_engine=None):
   """
   Scans from_directory and finds all the JPEGs in it and its subdirectories.
   Copies those JPEGs to to_directory. Note that to_directory will have a flat
@@ -28,14 +43,16 @@ def copy_jpegs(from_directory, to_directory):
   Args:
     from_directory the directory to search for JPEGs
     to_directory the directory to copy the JPEGs to
+    copy_engine the CopyEngine that does the copying, or None to copy the
+                files one at a time.
 
   Effects:
     Copies files over the directories in the filesystem.
   """
-  return copy_files_of_type(from_directory, to_directory, is_jpeg_file)
+  return copy_files_of_type(from_directory, to_directory, is_jpeg_file, copy_engine)
 
 
-def copy_javascript(from_directory, to_directory):
+def copy_javascript(from_directory, to_directory, copy_engine=None):
   """
   Scans from_directory and finds all the JPEGs in it and its subdirectories.
   Copies those JPEGs to to_directory. Note that to_directory will have a flat
@@ -44,14 +61,18 @@ def copy_javascript(from_directory, to_directory):
   Args:
     from_directory the directory to search for JPEGs
     to_directory the directory to copy the JPEGs to
+    copy_engine the CopyEngine that does the copying, or None to copy the
+                files one at a time.
 
   Effects:
     Copies files over the directories in the filesystem.
   """
-  return copy_files_of_type(from_directory, to_directory, is_js_file)
+  return copy_files_of_type(from_directory, to_directory, is_js_file,
+      copy_engine)
 
 
-def copy_files_of_type(from_directory, to_directory, type_tester):
+def copy_files_of_type(from_directory, to_directory, type_tester,
+    copy_engine=None):
   """
   Scans from_directory and finds all the appropriate files in it and its
   subdirectories.  Copies those files to to_directory. Note that to_directory 
@@ -62,14 +83,158 @@ def copy_files_of_type(from_directory, to_directory, type_tester):
     to_directory the directory to copy the files to.
     type_tester the function that determines whether a file name has the proper
                 extension.
+    copy_engine the CopyEngine that does the copying, or None to copy the
+                files one at a time.
 
   Effects:
     Copies files over the directories in the filesystem.
   """
-  contents = os.listdir(from_directory)
-  for entry in contents:
-    full_entry = os.path.join(from_directory, entry)
-    if os.path.isdir(full_entry):
-      copy_jpegs(full_entry, to_directory)
-    elif type_tester(full_entry):
-      shutil.copy2(full_entry, to_directory)
+  if copy_engine is None:
+    copy_engine = CopyEngine()
+  file_index = FileIndex(from_directory)
+  copy_engine.copy_files(file_index.find_files(type_tester), to_directory,
+      file_index.stat)
+
+
+def destination_is_current(source, destination, stat_file=os.stat):
+  """
+  Decide whether a file was already copied by an earlier run, by comparing
+  sizes and modification times. Copies keep the modification time of their
+  source, so the two match unless the source changed.
+
+  Args:
+    source the name of the file to copy.
+    destination the name of the copy.
+    stat_file the function used to stat source, defaults to os.stat.
+  """
+  try:
+    destination_stat = os.stat(destination)
+  except OSError:
+    return False
+  source_stat = stat_file(source)
+  return source_stat.st_size == destination_stat.st_size \
+      and int(source_stat.st_mtime) == int(destination_stat.st_mtime)
+
+
+def copy_file(source, destination):
+  """ Copy a file along with its permissions and modification time. """
+  shutil.copy2(source, destination)
+
+
+def hardlink_file(source, destination):
+  """
+  Make destination a hard link to source, which costs no IO at all. Falls
+  back to copying when the two are on different filesystems.
+  """
+  if os.path.lexists(destination):
+    os.remove(destination)
+  try:
+    os.link(source, destination)
+  except OSError as link_error:
+    if link_error.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+      raise
+    copy_file(source, destination)
+
+
+def reflink_file(source, destination):
+  """
+  Make destination a copy-on-write clone of source, which shares the data
+  blocks instead of copying them. Falls back to copying on filesystems
+  (or pairs of filesystems) that don't support clones.
+  """
+  try:
+    with open(source, 'rb') as source_file:
+      with open(destination, 'wb') as destination_file:
+        fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+    shutil.copystat(source, destination)
+  except IOError:
+    copy_file(source, destination)
+
+
+COPY_FUNCTIONS = {COPY: copy_file, HARDLINK: hardlink_file,
+    REFLINK: reflink_file}
+
+
+class CopyEngine(object):
+  """
+  Copies files into a directory, skipping the ones that are already there
+  and optionally spreading the work over a pool of threads.
+  """
+  def __init__(self, thread_count=1, copy_mode=COPY, progress_reporter=None):
+    """
+    Constructor for CopyEngine.
+
+    Args:
+      thread_count the number of threads to copy with, defaults to 1.
+      copy_mode one of COPY_MODES. COPY makes real copies (the default),
+                HARDLINK makes hard links, and REFLINK makes copy-on-write
+                clones. The last two fall back to copying when they can't
+                be used.
+      progress_reporter the progress.ProgressReporter that counts the files
+                        and bytes as they are copied, or None to not report
+                        progress.
+    """
+    assign_injectables(self, locals())
+    if self.progress_reporter is None:
+      self.progress_reporter = NullProgressReporter()
+    self.copy_function = COPY_FUNCTIONS[copy_mode]
+    self.copied_byte_count = 0
+
+  def get_copied_byte_count(self):
+    """ Returns the number of bytes copied by all calls to copy_files. """
+    return self.copied_byte_count
+
+  def copy_files(self, file_names, to_directory, stat_file=os.stat):
+    """
+    Copy files into to_directory, which will have a flat structure.
+
+    Args:
+      file_names the full names of the files to copy.
+      to_directory the directory to copy the files to.
+      stat_file the function used to stat the files being copied, such as
+                FileIndex.stat, defaults to os.stat.
+
+    Returns:
+      The number of files that were copied, not counting the ones that
+      were already current.
+
+    Effects:
+      Copies files over the directories in the filesystem.
+    """
+    jobs = [(file_name,
+        os.path.join(to_directory, os.path.basename(file_name))) \
+        for file_name in file_names]
+    jobs = [(source, destination, stat_file(source).st_size) \
+        for source, destination in jobs \
+        if not destination_is_current(source, destination, stat_file)]
+    byte_count = sum(size for source, destination, size in jobs)
+    self.copied_byte_count += byte_count
+    self.progress_reporter.add_to_total(byte_count)
+    if self.thread_count == 1 or len(jobs) < 2:
+      self.count_copies(map(self.copy_job, jobs))
+    else:
+      thread_pool = ThreadPool(self.thread_count)
+      try:
+        # Unordered, so each copy is counted as soon as it is done.
+        self.count_copies(thread_pool.imap_unordered(self.copy_job, jobs))
+      finally:
+        thread_pool.close()
+        thread_pool.join()
+    return len(jobs)
+
+  def copy_job(self, job):
+    """
+    Copy a single (source, destination, size) job.
+
+    Returns:
+      The size of the file.
+    """
+    source, destination, size = job
+    self.copy_function(source, destination)
+    return size
+
+  def count_copies(self, sizes):
+    """ Tell the progress reporter about finished copies, in this thread. """
+    for size in sizes:
+      self.progress_reporter.count(COPIED_FILES)
+      self.progress_reporter.count(COPIED_BYTES, size)
@@ -0,0 +1,165 @@
+"""
+Module providing DirectoryTitles, which decides the title of every
+directory before the build starts. Titles are read from a titles file, a
+JSON object or a two column CSV file mapping directory paths (relative to
+the input directory, with "." for the input directory itself) to titles.
+The user is asked for the missing ones all at once, and the answers are
+saved back to the file, so later builds don't ask again and can run
+unattended and in parallel.
+"""
+import os
+import os.path
+import csv
+import simplejson as json
+from ..utils.inject import assign_injectables
+from galleryitem import infer_title
+
+TITLES_FILE_NAME = '.directory-titles.json'
+
+
+def to_unicode(text):
+  """ Decode a UTF-8 byte string, such as a path or typed input. """
+  if isinstance(text, str):
+    return text.decode('utf-8', 'replace')
+  return text
+
+
+def is_csv_file_name(file_name):
+  """ Returns True if a titles file should be read and written as CSV. """
+  return file_name.lower().endswith('.csv')
+
+
+class DirectoryTitles(object):
+  """
+  The titles of the gallery's directories, keyed by their paths relative to
+  the input directory.
+  """
+  def __init__(self, root_directory, titles=None, file_name=None,
+      should_prompt=False, read_input=raw_input):
+    """
+    Constructor for DirectoryTitles.
+
+    Args:
+      root_directory the input directory that the paths are relative to.
+      titles a dict mapping relative paths to titles, defaults to empty.
+      file_name the titles file to save to, or None to not save.
+      should_prompt whether to ask for the titles that are missing.
+      read_input the function used to ask, defaults to raw_input.
+    """
+    assign_injectables(self, locals())
+    if self.titles is None:
+      self.titles = {}
+    self.changed = False
+
+  def get_key(self, directory_name):
+    """ Returns the path of a directory relative to root_directory. """
+    relative_path = os.path.relpath(directory_name, self.root_directory)
+    return to_unicode(relative_path.replace(os.sep, '/'))
+
+  def get_title(self, directory_name):
+    """
+    Returns the title of a directory, or None if it doesn't have one.
+
+    Args:
+      directory_name the full name of the directory.
+    """
+    return self.titles.get(self.get_key(directory_name))
+
+  def set_title(self, directory_name, title):
+    self.titles[self.get_key(directory_name)] = to_unicode(title)
+    self.changed = True
+
+  def resolve_titles(self, directory_names):
+    """
+    Make sure every directory has a title before the build starts: ask for
+    the missing ones if allowed, one after the other, and save them.
+
+    Args:
+      directory_names the full names of all the directories in the gallery.
+
+    Returns:
+      The number of directories that were asked about.
+    """
+    if not self.should_prompt:
+      return 0
+    missing = [directory_name for directory_name in directory_names \
+        if self.get_title(directory_name) is None]
+    for directory_name in missing:
+      inferred_name = infer_title(directory_name)
+      answer = self.read_input("Name for the directory %s [%s]:" % \
+          (directory_name, inferred_name)).strip()
+      # Accepting the inferred name is an answer too, so don't ask again.
+      self.set_title(directory_name, answer or inferred_name)
+    self.save()
+    return len(missing)
+
+  def save(self):
+    """
+    Write the titles back to the titles file, if they changed.
+
+    Effects:
+      Replaces file_name.
+    """
+    if self.file_name is None or not self.changed:
+      return
+    directory = os.path.dirname(self.file_name)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory) # The default is in the output directory.
+    temporary_name = self.file_name + '.tmp'
+    with open(temporary_name, 'wb') as titles_file:
+      if is_csv_file_name(self.file_name):
+        writer = csv.writer(titles_file)
+        for key in sorted(self.titles):
+          writer.writerow([key.encode('utf-8'),
+            self.titles[key].encode('utf-8')])
+      else:
+        json.dump(self.titles, titles_file, indent=2, sort_keys=True)
+    os.rename(temporary_name, self.file_name)
+    self.changed = False
+
+
+def read_titles_file(file_name):
+  """
+  Read a titles file.
+
+  Args:
+    file_name the name of the file, read as CSV if it ends with .csv and
+              as JSON otherwise.
+
+  Returns:
+    A dict mapping relative paths to titles, as unicode.
+
+  Raises:
+    IOError if the file can't be read, ValueError if it is malformed.
+  """
+  with open(file_name, 'rb') as titles_file:
+    if not is_csv_file_name(file_name):
+      titles = json.load(titles_file)
+      if not isinstance(titles, dict):
+        raise ValueError('%s should hold a JSON object.' % file_name)
+      return titles
+    titles = {}
+    for row in csv.reader(titles_file):
+      if not row:
+        continue
+      if len(row) != 2:
+        raise ValueError('Each row of %s should have a path and a title.' % \
+            file_name)
+      titles[row[0].decode('utf-8')] = row[1].decode('utf-8')
+    return titles
+
+
+def load_directory_titles(root_directory, file_name, should_prompt):
+  """
+  Factory function for DirectoryTitles. A titles file that doesn't exist
+  yet gives no titles, and is created when there are some to save.
+
+  Args:
+    root_directory the input directory.
+    file_name the titles file.
+    should_prompt whether to ask for the titles that are missing.
+  """
+  titles = {}
+  if os.path.isfile(file_name):
+    titles = read_titles_file(file_name)
+  return DirectoryTitles(root_directory, titles, file_name, should_prompt)
@@ -1,48 +1,181 @@
-from jinja2 import Environment, PackageLoader
+import os
+import os.path
+import itertools
+from jinja2 import Environment, PackageLoader, FileSystemBytecodeCache
 from ..utils.inject import assign_injectables
 from ..utils.getters import with_getters_for
 
 PHOTO_DIRECTORY_TEMPLATE_NAME = 'photo-directory.html'
 PHOTO_DETAIL_TEMPLATE_NAME = 'photo-detail.html'
+# How many pages iter_export_parallel hands to the workers at once, and
+# how many of those each worker takes at a time.
+RENDER_BATCH_SIZE = 256
+RENDER_CHUNK_SIZE = 8
 
 class Exporter(object):
-  def __init__(self, jinja_template):
+  def __init__(self, jinja_template, template_name=None):
     """
     Constructor for an exporter. It can export either
     a JpegDirectory or a JpegPicture.
 
     Args:
       jinja_template - the Template to populate
+      template_name - the name jinja_template was loaded under, which worker
+                      processes use to load it again (see
+                      iter_export_parallel). Only needed when rendering in
+                      parallel.
     """
     assign_injectables(self, locals())
 
-  def export(self, gallery_item):
+  def export(self, gallery_item, page_filter=None):
     """
     Given a GalleryItem with which to populate the template,
     render the template(s) and return them. If gallery_item
     is a directory, this method recurses on its contents.
 
+    Args:
+      gallery_item the GalleryItem to export.
+      page_filter a function that takes a GalleryItem and returns False if
+                  its page is already up to date and should not be rendered,
+                  or None (the default) to render every page.
+
     Returns:
       A list of all the templates that were populated, as
       HtmlFileNameAndContents. There's one for each GalleryItem.
     """
-    contents = gallery_item.get_contents()
-    # Put the file names in alphabetical order
-    def sorter(first, second):
-      if first.get_name() > second.get_name():
-        return 1
-      elif first.get_name() < second.get_name():
-        return -1
-      else:
-        return 0
-    contents.sort(sorter)
-    templates = [HtmlFileNameAndContents(gallery_item.get_output_file_name(),
-        self.jinja_template.render(gallery_item.as_view()))]
-    for entry in contents:
+    return list(self.iter_export(gallery_item, page_filter))
+
+  def iter_export(self, gallery_item, page_filter=None):
+    """
+    Like export, but renders the pages one at a time as they are asked for,
+    so only one rendered page needs to be in memory at once.
+
+    Args:
+      gallery_item the GalleryItem to export.
+      page_filter see export.
+
+    Returns:
+      A generator of HtmlFileNameAndContents, one for each page of each
+      GalleryItem, with gallery_item's own pages first.
+    """
+    return render_views(self.iter_views(gallery_item, page_filter))
+
+  def iter_export_parallel(self, gallery_item, process_pool, page_filter=None):
+    """
+    Like iter_export, but the templates are rendered by the worker processes
+    of process_pool. The views are built in this process and sent to the
+    workers as plain dicts, a batch at a time, and the rendered pages come
+    back in the same order as iter_export produces them.
+
+    Args:
+      gallery_item the GalleryItem to export.
+      process_pool the multiprocessing.Pool to render with.
+      page_filter see export.
+
+    Returns:
+      A generator of HtmlFileNameAndContents, like iter_export.
+    """
+    return render_views_parallel(self.iter_views(gallery_item, page_filter),
+        process_pool)
+
+  def iter_views(self, gallery_item, page_filter=None):
+    """
+    Walks gallery_item and its contents, producing the views of the pages
+    that need to be rendered.
+
+    Args:
+      gallery_item the GalleryItem to start with.
+      page_filter see export.
+
+    Returns:
+      A generator of (Exporter, output file name, view) tuples, where the
+      Exporter is the one that should render the view.
+    """
+    if page_filter is None or page_filter(gallery_item):
+      for file_name, view in gallery_item.as_views():
+        yield (self, file_name, view)
+    # The contents are already in order, see GalleryItemFactory.
+    for entry in gallery_item.get_contents():
       appropriate_exporter = entry.get_exporter()
-      templates.extend(appropriate_exporter.export(entry))
-    
-    return templates
+      for page in appropriate_exporter.iter_views(entry, page_filter):
+        yield page
+
+  def render(self, view):
+    """
+    Populate the template with a view.
+
+    Args:
+      view the dict of values to pass to the template.
+
+    Returns:
+      The contents of the page.
+    """
+    return self.jinja_template.render(view)
+with_getters_for(Exporter, 'template_name')
+
+def render_views(views):
+  """
+  Render views one at a time as they are asked for.
+
+  Args:
+    views an iterable of (Exporter, output file name, view) tuples, see
+          Exporter.iter_views.
+
+  Returns:
+    A generator of HtmlFileNameAndContents, in the same order as views.
+  """
+  for page_exporter, file_name, view in views:
+    yield HtmlFileNameAndContents(file_name, page_exporter.render(view))
+
+def render_views_parallel(views, process_pool):
+  """
+  Like render_views, but the templates are rendered by the worker processes
+  of process_pool, see Exporter.iter_export_parallel.
+
+  Args:
+    views see render_views.
+    process_pool the multiprocessing.Pool to render with.
+  """
+  views = iter(views)
+  while True:
+    jobs = [(page_exporter.get_template_name(), file_name,
+      to_plain_view(view)) for page_exporter, file_name, view in
+      itertools.islice(views, RENDER_BATCH_SIZE)]
+    if not jobs:
+      return
+    for file_name, contents in process_pool.imap(render_page, jobs,
+        RENDER_CHUNK_SIZE):
+      yield HtmlFileNameAndContents(file_name, contents)
+
+def to_plain_view(view):
+  """
+  Copy a view, turning the ImmutableDicts in it into ordinary dicts so that
+  it can be pickled and sent to another process.
+
+  Args:
+    view a view, or a value inside one.
+  """
+  if isinstance(view, dict):
+    return dict((key, to_plain_view(value)) for key, value in view.iteritems())
+  elif isinstance(view, (list, tuple)):
+    return [to_plain_view(value) for value in view]
+  return view
+
+def render_page(job):
+  """
+  Renders a single page. This is a module level function so that it can be
+  sent to the worker processes of a multiprocessing.Pool, which render with
+  their own copy of the shared ExporterRegistry.
+
+  Args:
+    job a tuple of (template_name, file_name, view).
+
+  Returns:
+    A tuple of (file_name, contents).
+  """
+  template_name, file_name, view = job
+  return (file_name, get_shared_registry().get_exporter(template_name)
+      .render(view))
 
 class HtmlFileNameAndContents(object):
   """
@@ -53,6 +186,85 @@ class HtmlFileNameAndContents(object):
     assign_injectables(self, locals())
 with_getters_for(HtmlFileNameAndContents, 'file_name', 'contents')
 
+class ExporterRegistry(object):
+  """
+  Hands out one Exporter per template name. All of the templates are loaded
+  from a single jinja2 Environment and compiled the first time they are
+  asked for, so exporting a gallery compiles each template once instead of
+  once per GalleryItem.
+  """
+  def __init__(self, environment):
+    """
+    Constructor for ExporterRegistry.
+
+    Args:
+      environment the jinja2 Environment to load the templates from.
+    """
+    assign_injectables(self, locals())
+    self.exporters = {}
+
+  def get_exporter(self, template_name):
+    """
+    Returns the Exporter for a template, creating it if necessary.
+
+    Args:
+      template_name the name of the template in photogallery/templates.
+    """
+    if template_name not in self.exporters:
+      self.exporters[template_name] = Exporter(
+          self.environment.get_template(template_name), template_name)
+    return self.exporters[template_name]
+
+# The registry shared by every GalleryItem in this process, see
+# configure_exporters.
+shared_registry = None
+
+def create_environment(bytecode_cache_directory=None, template_globals=None):
+  """
+  Create the jinja2 Environment for this package's templates.
+
+  Args:
+    bytecode_cache_directory a directory in which jinja2 can keep compiled
+                             templates between runs, or None to compile
+                             them in every run.
+    template_globals a dict of variables that every template can use, such
+                     as search_enabled, or None for none.
+  """
+  bytecode_cache = None
+  if bytecode_cache_directory is not None:
+    if not os.path.isdir(bytecode_cache_directory):
+      os.makedirs(bytecode_cache_directory)
+    bytecode_cache = FileSystemBytecodeCache(bytecode_cache_directory)
+  environment = Environment(loader=PackageLoader('photogallery', 'templates'),
+      bytecode_cache=bytecode_cache)
+  if template_globals is not None:
+    environment.globals.update(template_globals)
+  return environment
+
+def configure_exporters(bytecode_cache_directory=None, template_globals=None):
+  """
+  Replace the shared ExporterRegistry with a fresh one. Called once at the
+  start of a run.
+
+  Args:
+    bytecode_cache_directory see create_environment.
+    template_globals see create_environment.
+
+  Returns:
+    The new ExporterRegistry.
+  """
+  global shared_registry
+  shared_registry = \
+      ExporterRegistry(create_environment(bytecode_cache_directory,
+        template_globals))
+  return shared_registry
+
+def get_shared_registry():
+  """ Returns the shared ExporterRegistry, creating it if necessary. """
+  if shared_registry is None:
+    configure_exporters()
+  return shared_registry
+
 def create_photo_detail_exporter():
   return create_exporter(PHOTO_DETAIL_TEMPLATE_NAME)
 
@@ -60,5 +272,4 @@ def create_photo_directory_exporter():
   return create_exporter(PHOTO_DIRECTORY_TEMPLATE_NAME)
 
 def create_exporter(template_name):
-  environment = Environment(loader=PackageLoader('photogallery', 'templates'))
-  return Exporter(environment.get_template(template_name))
+  return get_shared_registry().get_exporter(template_name)
@@ -1,13 +1,30 @@
 import os
 import getopt
 import sys
+import multiprocessing
 from ..utils.inject import assign_injectables
 from ..utils.immutabledict import ImmutableDict
 from manifestparser import ManifestParser
-from galleryitemfactory import GalleryItemFactory
+from galleryitem import directory_name_to_html_file_name, DirectorySummary
+from galleryitemfactory import GalleryItemFactory, is_jpeg_file, \
+    is_css_file, is_js_file, is_html_file, is_json_file, name_sort_key, \
+    natural_sort_key
+from scanner import FileIndex
+from iptcinfo import IPTCInfo
 import exporter
 import templatewriter
 import copier
+import buildcache
+import iptcreader
+import metadatareader
+import directorytitles
+import thumbnailer
+import compressor
+import searchindex
+import sharding
+import quarantine
+from profiler import BuildProfiler, NullProfiler
+import progress
 
 class GalleryGenerator(object):
   """
@@ -15,7 +32,12 @@ class GalleryGenerator(object):
   that the main function interacts with.
   """
   def __init__(self, gallery_item_factory, input_directory, output_directory,
-      static_files_directory, exporter, template_writer):
+      static_files_directory, exporter, template_writer, process_pool=None,
+      build_cache=None, copy_engine=None, input_index=None,
+      static_files_index=None, thumbnailer=None, profiler=None,
+      compressor=None, search_index_writer=None,
+      one_directory_at_a_time=False, directory_titles=None, shard=None,
+      shard_summaries=None, progress_reporter=None, quarantine=None):
     """
     Constructor for GalleryGenerator. All needed service objects are injected.
 
@@ -26,25 +48,383 @@ class GalleryGenerator(object):
       static_files_directory the directory containing static files to copy over.
       exporter the Exporter to populate the templates.
       template_writer the object that writes the templates to disk.
+      process_pool the multiprocessing.Pool shared by the stages that fan out
+                   work, or None if everything runs in this process. It is
+                   closed once the pages have been written.
+      build_cache the BuildCache used for incremental builds, or None to
+                  render every page.
+      copy_engine the copier.CopyEngine that copies the JPEGs and static
+                  files, or None to copy them one at a time.
+      input_index the FileIndex of input_directory, which should also be
+                  what gallery_item_factory lists directories with. One is
+                  created if it is None.
+      static_files_index the FileIndex of static_files_directory, one is
+                         created if it is None.
+      thumbnailer the Thumbnailer that makes resized copies of the JPEGs
+                  before the directory tree is created, or None to show the
+                  originals everywhere.
+      profiler the profiler.BuildProfiler that times each phase of run, or
+               None to not profile the build.
+      compressor the compressor.Compressor that writes compressed copies of
+                 the pages, CSS and JavaScript once everything else is
+                 done, or None to not write any.
+      search_index_writer the searchindex.SearchIndexWriter that writes the
+                          index of caption terms that gallerySearch.js
+                          queries, or None to not write one.
+      one_directory_at_a_time whether to create, render and then forget
+                              each directory in turn (see
+                              GalleryItemFactory.iter_directories) instead
+                              of creating the whole tree before rendering
+                              anything, so memory use grows with the depth
+                              of the tree rather than the number of
+                              pictures. The search index builder and the
+                              build cache's records of the new pictures
+                              and pages still grow with the number of
+                              pictures.
+      directory_titles the directorytitles.DirectoryTitles that
+                       gallery_item_factory takes the titles from, which
+                       asks for the missing ones before anything is built,
+                       or None if titles are inferred or asked for as the
+                       pages are rendered.
+      shard the sharding.Shard to build, in which case input_index should
+            only hold the shard's directories, or None to build the whole
+            gallery.
+      shard_summaries the top-level directories built by the shards, see
+                      sharding.read_shard_summaries, to merge them into the
+                      gallery, in which case input_index should only hold
+                      the files in input_directory itself. None if this is
+                      not the merge step of a sharded build.
+      progress_reporter the progress.ProgressReporter that run reports its
+                        progress to, or None to not report progress. It
+                        should also be given to gallery_item_factory,
+                        copy_engine and thumbnailer, which do the counting.
+      quarantine the quarantine.Quarantine that gallery_item_factory and
+                 thumbnailer put the files they can't read in, or None.
+                 Quarantined files are left out of the build, and the ones
+                 that changed or are gone are pruned after the scan.
     """
     assign_injectables(self, locals())
+    if self.profiler is None:
+      self.profiler = NullProfiler()
+    if self.progress_reporter is None:
+      self.progress_reporter = progress.NullProgressReporter()
+    if self.copy_engine is None:
+      self.copy_engine = copier.CopyEngine()
+    if self.input_index is None:
+      self.input_index = FileIndex(input_directory)
+    if self.static_files_index is None:
+      self.static_files_index = FileIndex(static_files_directory)
 
   def run(self):
-    top_jpeg_directory = \
-        self.gallery_item_factory.create_directory(self.input_directory)
-    populated_templates = self.exporter.export(top_jpeg_directory)
-    self.template_writer.write_templates(populated_templates)
-    # We need to copy the JPEGs over too, and the CSS
-    copier.copy_jpegs(self.input_directory, self.output_directory)
-    copier.copy_css(self.static_files_directory, self.output_directory)
-    # Also, if there are scripts that enhance the experience,
-    # copy them over too.
-    copier.copy_javascript(self.static_files_directory, self.output_directory)
-    # Also grab a copy of directory_image.jpg
-    copier.copy_jpegs(self.static_files_directory, self.output_directory)
-    # And make a symlink for browsing convenience.
-    self.symlink_index(self.output_directory,
-        top_jpeg_directory.get_output_file_name())
+    self.profiler.start()
+    self.progress_reporter.start()
+    succeeded = False
+    try:
+      self.build()
+      succeeded = True
+    finally:
+      # Monitoring tools following the progress need to see a build that
+      # failed end too, and its profile shows how far it got.
+      try:
+        self.progress_reporter.finish(succeeded)
+      finally:
+        self.profiler.finish(succeeded)
+
+  def build(self):
+    """ Does the work of run, between starting and finishing the reports. """
+    # Walk both trees once up front; everything else reads the indexes.
+    with self.profiler.phase('scan'):
+      self.input_index.scan()
+      self.static_files_index.scan()
+      self.profiler.count(files=self.input_index.get_entry_count() +
+          self.static_files_index.get_entry_count())
+    if self.quarantine is not None:
+      self.quarantine.prune()
+    try:
+      # Ask for all the missing titles now, so nothing waits on the user
+      # once the build is under way.
+      if self.directory_titles is not None:
+        self.directory_titles.resolve_titles(
+            self.input_index.get_directory_names())
+      if self.thumbnailer is not None:
+        jpeg_file_names = self.find_jpegs()
+        with self.profiler.phase('thumbnails'), \
+            self.progress_reporter.stage('thumbnails', progress.THUMBNAILS,
+                len(jpeg_file_names)):
+          self.thumbnailer.generate(jpeg_file_names)
+          self.profiler.count(files=len(jpeg_file_names))
+      search_index_builder = None
+      if self.search_index_writer is not None:
+        search_index_builder = self.search_index_writer.create_builder()
+      if self.one_directory_at_a_time and self.shard_summaries is None:
+        top_file_name = self.write_pages_one_directory_at_a_time(
+            search_index_builder)
+      else:
+        top_file_name = self.write_pages(search_index_builder)
+    finally:
+      self.close_process_pool()
+    print 'Wrote %d pages, %d were unchanged.' % \
+        (self.template_writer.get_written_count(),
+            self.template_writer.get_skipped_count())
+    if self.quarantine is not None and self.quarantine.get_size() > 0:
+      print '%d files were left out because reading them failed, ' \
+          '%d of them in this build. They are listed in %s.' % \
+          (self.quarantine.get_size(), self.quarantine.get_added_count(),
+              self.quarantine.file_name)
+    # A shard's part of the search index is merged with the others later.
+    if search_index_builder is not None and self.shard is None:
+      with self.profiler.phase('search index'):
+        self.profiler.count(
+            files=self.search_index_writer.write_index(search_index_builder))
+    with self.profiler.phase('copy files'), \
+        self.progress_reporter.stage('copy files', progress.COPIED_BYTES):
+      # We need to copy the JPEGs over too, and the CSS
+      self.copy_files(self.input_index, is_jpeg_file)
+      self.copy_files(self.static_files_index, is_css_file)
+      # Also, if there are scripts that enhance the experience,
+      # copy them over too.
+      self.copy_files(self.static_files_index, is_js_file)
+      # Also grab a copy of directory_image.jpg
+      self.copy_files(self.static_files_index, is_jpeg_file)
+    # And make a symlink for browsing convenience, unless the top-level
+    # page is left to the merge step.
+    if self.shard is None:
+      self.symlink_index(self.output_directory, top_file_name)
+    if self.compressor is not None:
+      with self.profiler.phase('compress'):
+        self.compress_files()
+    if self.build_cache is not None:
+      self.build_cache.save()
+    # Last, so that the merge step only finds the summary of a shard that
+    # is completely done.
+    if self.shard is not None:
+      self.shard.write_summary(self.output_directory,
+          self.find_top_level_directories(), search_index_builder)
+
+  def copy_files(self, file_index, type_tester):
+    """
+    Copy the files of one type from an indexed tree to the output directory.
+
+    Args:
+      file_index the FileIndex of the tree to copy from.
+      type_tester the function that determines whether a file name has the
+                  proper extension.
+    """
+    copied_byte_count = self.copy_engine.get_copied_byte_count()
+    copied_file_count = self.copy_engine.copy_files(
+        file_index.find_files(type_tester), self.output_directory,
+        file_index.stat)
+    self.profiler.count(files=copied_file_count,
+        bytes=self.copy_engine.get_copied_byte_count() - copied_byte_count)
+
+  def compress_files(self):
+    """
+    Write compressed copies of the text files in the output directory.
+    """
+    output_index = FileIndex(self.output_directory)
+    file_names = output_index.find_files(lambda file_name:
+        is_published_text_file(self.output_directory, file_name))
+    self.profiler.count(files=self.compressor.compress_files(file_names,
+      output_index.stat))
+
+  def write_pages(self, search_index_builder):
+    """
+    Create the whole directory tree, then render and write its pages. The
+    merge step of a sharded build only creates the top directory.
+
+    Args:
+      search_index_builder the searchindex.SearchIndexBuilder to add the
+                           pictures to, or None.
+
+    Returns:
+      The name of the top-level page.
+    """
+    # Lazily read metadata is read while the pages are written, so there is
+    # no telling how much of it this stage will read.
+    metadata_total = None
+    if not self.gallery_item_factory.reads_metadata_lazily():
+      metadata_total = self.count_jpegs()
+    with self.profiler.phase('read metadata'), \
+        self.progress_reporter.stage('read metadata', progress.IMAGES,
+            metadata_total):
+      if self.shard_summaries is None:
+        top_jpeg_directory = \
+            self.gallery_item_factory.create_directory(self.input_directory)
+      else:
+        top_jpeg_directory = self.create_merged_directory()
+    page_filter = None
+    if self.build_cache is not None:
+      page_filter = self.build_cache.create_page_filter(top_jpeg_directory,
+          self.output_directory)
+    page_filter = self.filter_shard_pages(page_filter)
+    if search_index_builder is not None:
+      search_index_builder.add_directory_tree(top_jpeg_directory)
+      if self.shard_summaries is not None:
+        self.add_shard_documents(top_jpeg_directory, search_index_builder)
+    # Each page is written as soon as it is rendered.
+    with self.profiler.phase('write pages'), \
+        self.progress_reporter.stage('write pages', progress.PAGES):
+      populated_templates = self.profiler.iterate_phase('render pages',
+          self.iter_populated_templates(
+            self.exporter.iter_views(top_jpeg_directory, page_filter)))
+      self.template_writer.write_templates(populated_templates,
+          self.on_page_written)
+    return top_jpeg_directory.get_output_file_name()
+
+  def write_pages_one_directory_at_a_time(self, search_index_builder):
+    """
+    Like write_pages, but each directory's pages are written as soon as it
+    has been created, before moving on to the next.
+
+    Args:
+      search_index_builder see write_pages.
+
+    Returns:
+      The name of the top-level page.
+    """
+    page_filter = None
+    if self.build_cache is not None:
+      page_filter = \
+          self.build_cache.create_fingerprint_filter(self.output_directory)
+    page_filter = self.filter_shard_pages(page_filter)
+    views = self.iter_directory_views(
+        self.gallery_item_factory.iter_directories(self.input_directory),
+        page_filter, search_index_builder)
+    # Reading the metadata and rendering are interleaved, so they are
+    # timed together, and the pictures are the better measure of progress.
+    with self.profiler.phase('write pages'), \
+        self.progress_reporter.stage('read metadata and write pages',
+            progress.IMAGES, self.count_jpegs()):
+      populated_templates = self.profiler.iterate_phase(
+          'read metadata and render pages',
+          self.iter_populated_templates(views))
+      self.template_writer.write_templates(populated_templates,
+          self.on_page_written)
+    return directory_name_to_html_file_name(self.input_directory)
+
+  def create_merged_directory(self):
+    """
+    Create the JpegDirectory at the top of a sharded gallery, with the
+    pictures in input_directory itself and the top-level directories that
+    the shards built.
+    """
+    file_names = \
+        self.input_index.list_directory_contents(self.input_directory)
+    subdirectory_names = [os.path.join(self.input_directory, name) \
+        for name in self.shard_summaries]
+    return self.gallery_item_factory.create_summarized_directory(
+        self.input_directory, file_names, subdirectory_names)
+
+  def add_shard_documents(self, top_directory, search_index_builder):
+    """
+    Add the pictures the shards found to the search index, in the order of
+    their top-level directories.
+
+    Args:
+      top_directory the JpegDirectory made by create_merged_directory.
+      search_index_builder the searchindex.SearchIndexBuilder to add them to.
+    """
+    for entry in top_directory.get_contents():
+      if isinstance(entry, DirectorySummary):
+        name = os.path.basename(entry.get_name())
+        for document, terms in self.shard_summaries[name]:
+          search_index_builder.add_document(document, terms)
+
+  def find_top_level_directories(self):
+    """ Returns the full names of the directories in input_directory. """
+    names = [os.path.join(self.input_directory, name) for name in \
+        self.input_index.list_directory_contents(self.input_directory)]
+    return filter(self.input_index.is_directory, names)
+
+  def filter_shard_pages(self, page_filter):
+    """
+    Leave the pages of input_directory out of a shard's build, since they
+    are rendered by the merge step.
+
+    Args:
+      page_filter see Exporter.export.
+
+    Returns:
+      page_filter, or a filter that also leaves out those pages.
+    """
+    if self.shard is None:
+      return page_filter
+    def shard_page_filter(gallery_item):
+      if not self.shard.is_shard_page(gallery_item):
+        return False
+      return page_filter is None or page_filter(gallery_item)
+    return shard_page_filter
+
+  def iter_directory_views(self, directories, page_filter,
+      search_index_builder):
+    """
+    Produce the views of the pages of directories that are created one at a
+    time, fingerprinting each directory and adding it to the search index
+    before its views are produced.
+
+    Args:
+      directories an iterable of JpegDirectories whose subdirectories are
+                  DirectorySummaries.
+      page_filter see Exporter.export.
+      search_index_builder see write_pages.
+
+    Returns:
+      A generator of views, see Exporter.iter_views.
+    """
+    for directory in directories:
+      if self.build_cache is not None:
+        self.build_cache.add_directory(directory)
+      if search_index_builder is not None:
+        search_index_builder.add_directory(directory)
+      for view in self.exporter.iter_views(directory, page_filter):
+        yield view
+
+  def iter_populated_templates(self, views):
+    """
+    Render the pages, in the worker processes if there are any.
+
+    Args:
+      views an iterable of views, see Exporter.iter_views.
+
+    Returns:
+      A generator of HtmlFileNameAndContents.
+    """
+    if self.process_pool is None:
+      populated_templates = exporter.render_views(views)
+    else:
+      populated_templates = \
+          exporter.render_views_parallel(views, self.process_pool)
+    return self.progress_reporter.iterate(progress.PAGES, populated_templates)
+
+  def on_page_written(self, file_name):
+    """
+    Called by the template_writer once each page is on disk, so that the
+    build cache can journal the pages that are done.
+    """
+    if self.build_cache is not None:
+      self.build_cache.record_written_file(file_name)
+
+  def find_jpegs(self):
+    """
+    Returns the full names of the JPEGs in input_index, leaving out the
+    quarantined ones, which won't be read.
+    """
+    full_jpeg_names = self.input_index.find_files(is_jpeg_file)
+    if self.quarantine is None:
+      return full_jpeg_names
+    return [name for name in full_jpeg_names \
+        if not self.quarantine.is_quarantined(name)]
+
+  def count_jpegs(self):
+    """ Returns the number of JPEGs that will be read, see find_jpegs. """
+    return len(self.find_jpegs())
+
+  def close_process_pool(self):
+    """ Shut down the worker processes, if there are any. """
+    if self.process_pool is not None:
+      self.process_pool.close()
+      self.process_pool.join()
+      self.process_pool = None
 
   def symlink_index(self, output_directory, file_name):
     """
@@ -56,6 +436,9 @@ class GalleryGenerator(object):
       file_name the name of the file to symlink to.
     """
     full_link_name = os.path.join(output_directory, 'index.html')
+    if os.path.islink(full_link_name) \
+        and os.readlink(full_link_name) == file_name:
+      return # Left behind by an earlier run into the same directory.
     try:
       os.symlink(file_name, full_link_name)
     except OSError:
@@ -81,17 +464,165 @@ def create_gallery_generator(command_line_arguments, css_directory):
   # First parse the manifest file
   with open(input_data['manifest_file'], 'r') as manifest_file:
     parser = ManifestParser(manifest_file)
-    lookup_table = parser.get_json_data()
-  factory = GalleryItemFactory(lookup_table, input_data['should_prompt'])
+    try:
+      lookup_table = parser.get_lookup_plan(metadatareader.canonical_key)
+    except ValueError as key_error:
+      print key_error
+      print_usage()
+      sys.exit(1)
+  template_globals = {'search_enabled': input_data['search_index']}
+  # Configure the exporters before starting the workers, so that they
+  # inherit the same template environment.
+  exporter.configure_exporters(input_data['template_cache_directory'],
+      template_globals)
+  process_pool = create_process_pool(input_data['worker_count'])
+  build_profiler = None
+  if input_data['profile']:
+    build_profiler = BuildProfiler(input_data['output_directory'],
+        use_cprofile=input_data['cprofile'])
+  progress_reporter = None
+  if input_data['progress'] or input_data['progress_json'] is not None:
+    progress_stream = None
+    if input_data['progress']:
+      progress_stream = sys.stderr
+    progress_reporter = progress.ProgressReporter(progress_stream,
+        input_data['progress_json'])
   template_exporter = exporter.create_photo_directory_exporter()
-  template_writer = \
-      templatewriter.create_template_writer(input_data['output_directory'])
+  shard = None
+  shard_summaries = None
+  include_entry = None
+  # The shards may share an output directory and run at the same time, so
+  # each part of a sharded build keeps its own state files.
+  state_file_suffix = ''
+  if input_data['shard'] is not None:
+    shard_number, shard_count = input_data['shard']
+    shard = sharding.Shard(input_data['input_directory'], shard_number,
+        shard_count)
+    include_entry = shard.include_entry
+    state_file_suffix = '-shard-%d-of-%d' % (shard_number, shard_count)
+  elif input_data['merge_shards'] is not None:
+    try:
+      shard_summaries = sharding.read_shard_summaries(
+          input_data['output_directory'], input_data['merge_shards'])
+    except (IOError, ValueError) as summary_error:
+      print "The shards can't be merged yet:", summary_error
+      sys.exit(1)
+    include_entry = sharding.is_merge_entry
+    state_file_suffix = '-merge'
+  template_writer = templatewriter.create_template_writer(
+      input_data['output_directory'],
+      templatewriter.HASHES_FILE_NAME + state_file_suffix)
+  input_index = FileIndex(input_data['input_directory'],
+      include_entry=include_entry)
+  build_cache = None
+  if input_data['incremental']:
+    build_cache = buildcache.load_build_cache(input_data['output_directory'],
+        lookup_table, stat_file=input_index.stat,
+        template_globals=template_globals,
+        cache_file_name=buildcache.CACHE_FILE_NAME + state_file_suffix,
+        resume=input_data['resume'])
+  file_quarantine = quarantine.load_quarantine(
+      os.path.join(input_data['output_directory'],
+        quarantine.QUARANTINE_FILE_NAME + state_file_suffix),
+      stat_file=input_index.stat)
+  picture_thumbnailer = None
+  if input_data['thumbnails']:
+    picture_thumbnailer = thumbnailer.Thumbnailer(
+        input_data['output_directory'], process_pool=process_pool,
+        stat_file=input_index.stat, progress_reporter=progress_reporter,
+        quarantine=file_quarantine)
+  iptc_info_constructor = IPTCInfo
+  if metadatareader.needs_metadata_reader(lookup_table.values()):
+    iptc_info_constructor = \
+        metadatareader.NativeMetadataConstructor(lookup_table.values())
+  elif input_data['native_iptc']:
+    iptc_info_constructor = \
+        iptcreader.NativeIptcInfoConstructor(lookup_table.values())
+  text_compressor = None
+  if input_data['precompress']:
+    text_compressor = compressor.Compressor(input_data['worker_count'])
+  search_index_writer = None
+  if input_data['search_index']:
+    search_index_writer = \
+        searchindex.SearchIndexWriter(input_data['output_directory'])
+  titles_file = input_data['titles_file']
+  if titles_file is None:
+    titles_file = os.path.join(input_data['output_directory'],
+        directorytitles.TITLES_FILE_NAME)
+  directory_titles = directorytitles.load_directory_titles(
+      input_data['input_directory'], titles_file, input_data['should_prompt'])
+  sort_key = name_sort_key
+  if input_data['natural_sort']:
+    sort_key = natural_sort_key
+  # The titles are all settled before the build, so the factory never has
+  # to prompt.
+  factory = GalleryItemFactory(lookup_table, False,
+      iptc_info_constructor=iptc_info_constructor,
+      process_pool=process_pool, metadata_cache=build_cache,
+      lazy_metadata=input_data['lazy_metadata'],
+      list_directory=input_index.list_directory_contents,
+      is_directory=input_index.is_directory,
+      variants_for=picture_thumbnailer and picture_thumbnailer.get_variants,
+      profiler=build_profiler, page_size=input_data['page_size'],
+      sort_key=sort_key, directory_titles=directory_titles,
+      progress_reporter=progress_reporter, quarantine=file_quarantine)
   return GalleryGenerator(gallery_item_factory=factory,
       input_directory=input_data['input_directory'],
       output_directory=input_data['output_directory'],
       static_files_directory=css_directory,
       exporter=template_exporter,
-      template_writer=template_writer)
+      template_writer=template_writer,
+      process_pool=process_pool,
+      build_cache=build_cache,
+      copy_engine=copier.CopyEngine(input_data['copy_thread_count'],
+        input_data['copy_mode'], progress_reporter),
+      input_index=input_index,
+      static_files_index=FileIndex(css_directory),
+      thumbnailer=picture_thumbnailer,
+      profiler=build_profiler,
+      compressor=text_compressor,
+      search_index_writer=search_index_writer,
+      one_directory_at_a_time=input_data['one_directory_at_a_time'],
+      directory_titles=directory_titles,
+      shard=shard,
+      shard_summaries=shard_summaries,
+      progress_reporter=progress_reporter,
+      quarantine=file_quarantine)
+
+def create_process_pool(worker_count):
+  """
+  Create the pool of worker processes for a run.
+
+  Args:
+    worker_count the number of processes to use.
+
+  Returns:
+    A multiprocessing.Pool, or None if worker_count is 1 and everything
+    should happen in this process.
+  """
+  if worker_count == 1:
+    return None
+  return multiprocessing.Pool(worker_count)
+
+def is_published_text_file(output_directory, full_name):
+  """
+  Decide whether a file in the output directory is one of the text files
+  the web server sends, and so worth compressing. The search index is the
+  only JSON that is published; the other JSON files, like everything
+  whose name starts with a dot, hold the state of the build.
+
+  Args:
+    output_directory the directory the gallery is written to.
+    full_name the full name of a file in output_directory.
+  """
+  relative_name = os.path.relpath(full_name, output_directory)
+  if any(part.startswith('.') for part in relative_name.split(os.sep)):
+    return False
+  if is_json_file(full_name):
+    return os.path.dirname(relative_name) == \
+        searchindex.SEARCH_DIRECTORY_NAME
+  return is_html_file(full_name) or is_css_file(full_name) \
+      or is_js_file(full_name)
 
 def parse_command_line_arguments(command_line_arguments):
   """
@@ -101,6 +632,85 @@ def parse_command_line_arguments(command_line_arguments):
   -o, --output-directory -> the output directory for the HTML (required)
   -n, --no-prompt -> Automatically use inferred names for directories,
                  instead of prompting the user.
+  --titles-file -> A JSON or CSV file of directory titles, keyed by the
+                   directories' paths relative to the input directory
+                   ("." for the input directory itself). The user is asked
+                   for the missing ones before the build starts (unless
+                   -n is given) and the answers are added to the file.
+                   Defaults to .directory-titles.json in the output
+                   directory.
+  -w, --workers -> The number of processes to read JPEG metadata, resize
+                   pictures and render pages with (defaults to 1, meaning
+                   no extra processes).
+  --incremental -> Only re-read JPEGs and re-render pages that changed since
+                   the last run into the same output directory. What the
+                   build has done so far is kept in a journal as it goes.
+  --resume -> Pick up where an --incremental build that was interrupted left
+              off, using its journal, instead of going back to the last
+              build that finished. Implies --incremental.
+  --template-cache -> A directory in which to keep compiled templates
+                      between runs.
+  --lazy-metadata -> Only read a JPEG's metadata when its pages are rendered.
+                     JPEGs without metadata are shown without a caption
+                     instead of being skipped.
+  --native-iptc -> Read the IPTC data with the built in reader, which only
+                   decodes the datasets named in the manifest. Manifests
+                   that name EXIF tags ("exif:Artist") or XMP properties
+                   ("xmp:dc:creator") are always read with the built in
+                   reader, see metadatareader.
+  --copy-threads -> The number of threads to copy files with (defaults to 1).
+  --copy-mode -> How to put the JPEGs in the output directory: copy (the
+                 default), hardlink or reflink.
+  --thumbnails -> Show small copies of the JPEGs on directory pages and
+                  medium sized ones on detail pages. Needs the Python
+                  Imaging Library (Pillow).
+  --profile -> Time each phase of the build and write a report to
+               build-profile.json in the output directory.
+  --cprofile -> Like --profile, but also run the build under cProfile and
+                dump the statistics to build-profile.pstats.
+  --page-size -> The largest number of pictures and subdirectories to show
+                 on one directory page. Bigger directories are split over
+                 several pages. By default every directory gets one page.
+  --natural-sort -> Compare numbers in file names as numbers, so IMG_2.jpg
+                    comes before IMG_10.jpg.
+  --watch -> After building, keep watching the input directory and the
+             manifest, and rebuild incrementally whenever they change.
+             Implies --no-prompt.
+  --precompress -> Write .gz copies (and .br copies, if the brotli module
+                   is installed) of the pages, CSS, JavaScript and search
+                   index, for web servers that can send precompressed
+                   files. Uses as many threads as --workers.
+  --one-directory-at-a-time -> Create and write the directories one at a
+                               time, so memory use grows with the depth of
+                               the input tree instead of the number of
+                               pictures. With --search-index or
+                               --incremental, the caption index and the
+                               build cache's records still hold an entry
+                               per picture until the end of the build.
+  --search-index -> Write an index of the caption terms to the search
+                    directory of the output, and add a search box to the
+                    directory pages that looks things up in it.
+  --shard -> Only build part of the gallery, so the work can be split
+             across machines: --shard=2/4 builds the directories in the
+             input directory that hash to the second of four shards,
+             without the input directory's own page and pictures, and
+             leaves a summary of them in the output directory. Implies
+             --no-prompt.
+  --merge-shards -> Once all the shards of a --shard=i/N build have put
+                    their summaries in the output directory, build the
+                    input directory's own page and pictures (and the
+                    search index) with --merge-shards=N. Implies
+                    --no-prompt.
+  --progress -> Every few seconds, print how many pictures have been read,
+                pages rendered and bytes copied to standard error, with the
+                rate of the current stage of the build and an estimate of
+                how long it will take.
+  --progress-json -> Append the same reports to a file, one JSON object per
+                     line, for monitoring tools to follow.
+
+  JPEGs that the metadata reader fails on in an unexpected way are left
+  out, and listed in .quarantine.json in the output directory so that
+  later builds skip them until they change.
 
   Args:
     command_line_arguments the command line arguments with the program
@@ -108,13 +718,27 @@ def parse_command_line_arguments(command_line_arguments):
   """
   try:
     options, arguments = getopt.getopt(command_line_arguments,
-        "hi:o:m:n", ['help', 'input-directory=', 'output-directory=',
-          'manifest-file=', 'no-prompt'])
+        "hi:o:m:nw:", ['help', 'input-directory=', 'output-directory=',
+          'manifest-file=', 'no-prompt', 'workers=', 'incremental',
+          'template-cache=', 'lazy-metadata', 'native-iptc',
+          'copy-threads=', 'copy-mode=', 'thumbnails', 'profile',
+          'cprofile', 'page-size=', 'natural-sort',
+          'watch', 'precompress', 'search-index',
+          'one-directory-at-a-time', 'titles-file=', 'shard=',
+          'merge-shards=', 'progress', 'progress-json=', 'resume'])
   except getopt.GetoptError:
     print_usage()
     sys.exit(2)
 
-  input_data = {'should_prompt': True}
+  input_data = {'should_prompt': True, 'worker_count': 1,
+      'incremental': False, 'template_cache_directory': None,
+      'lazy_metadata': False, 'native_iptc': False, 'copy_thread_count': 1,
+      'copy_mode': copier.COPY, 'thumbnails': False, 'profile': False,
+      'cprofile': False, 'page_size': None, 'natural_sort': False,
+      'watch': False, 'precompress': False, 'search_index': False,
+      'one_directory_at_a_time': False, 'titles_file': None, 'shard': None,
+      'merge_shards': None, 'progress': False, 'progress_json': None,
+      'resume': False}
   for option, argument in options:
     if option in ('-h', '--help'):
       print_usage()
@@ -137,12 +761,99 @@ def parse_command_line_arguments(command_line_arguments):
         sys.exit(1)
     elif option in ('-n', '--no-prompt'):
       input_data['should_prompt'] = False
+    elif option in ('-w', '--workers'):
+      if argument.isdigit() and int(argument) > 0:
+        input_data['worker_count'] = int(argument)
+      else:
+        print argument, "isn't a positive number of workers."
+        print_usage()
+        sys.exit(1)
+    elif option == '--incremental':
+      input_data['incremental'] = True
+    elif option == '--resume':
+      input_data['incremental'] = True
+      input_data['resume'] = True
+    elif option == '--template-cache':
+      input_data['template_cache_directory'] = argument
+    elif option == '--lazy-metadata':
+      input_data['lazy_metadata'] = True
+    elif option == '--native-iptc':
+      input_data['native_iptc'] = True
+    elif option == '--copy-threads':
+      if argument.isdigit() and int(argument) > 0:
+        input_data['copy_thread_count'] = int(argument)
+      else:
+        print argument, "isn't a positive number of threads."
+        print_usage()
+        sys.exit(1)
+    elif option == '--copy-mode':
+      if argument in copier.COPY_MODES:
+        input_data['copy_mode'] = argument
+      else:
+        print argument, "isn't one of", ', '.join(copier.COPY_MODES)
+        print_usage()
+        sys.exit(1)
+    elif option == '--thumbnails':
+      if thumbnailer.is_available():
+        input_data['thumbnails'] = True
+      else:
+        print "--thumbnails needs the Python Imaging Library (Pillow)."
+        sys.exit(1)
+    elif option == '--profile':
+      input_data['profile'] = True
+    elif option == '--cprofile':
+      input_data['profile'] = True
+      input_data['cprofile'] = True
+    elif option == '--page-size':
+      if argument.isdigit() and int(argument) > 0:
+        input_data['page_size'] = int(argument)
+      else:
+        print argument, "isn't a positive page size."
+        print_usage()
+        sys.exit(1)
+    elif option == '--natural-sort':
+      input_data['natural_sort'] = True
+    elif option == '--watch':
+      input_data['watch'] = True
+      input_data['should_prompt'] = False
+    elif option == '--precompress':
+      input_data['precompress'] = True
+    elif option == '--search-index':
+      input_data['search_index'] = True
+    elif option == '--one-directory-at-a-time':
+      input_data['one_directory_at_a_time'] = True
+    elif option == '--titles-file':
+      input_data['titles_file'] = argument
+    elif option == '--shard':
+      try:
+        input_data['shard'] = sharding.parse_shard(argument)
+      except ValueError as shard_error:
+        print shard_error
+        print_usage()
+        sys.exit(1)
+      input_data['should_prompt'] = False
+    elif option == '--merge-shards':
+      if argument.isdigit() and int(argument) > 0:
+        input_data['merge_shards'] = int(argument)
+      else:
+        print argument, "isn't a positive number of shards."
+        print_usage()
+        sys.exit(1)
+      input_data['should_prompt'] = False
+    elif option == '--progress':
+      input_data['progress'] = True
+    elif option == '--progress-json':
+      input_data['progress_json'] = argument
 
   if 'input_directory' not in input_data \
       or 'output_directory' not in input_data \
       or 'manifest_file' not in input_data:
     print_usage() 
     sys.exit(1)
+  if input_data['shard'] is not None and input_data['merge_shards'] is not None:
+    print "--shard and --merge-shards are separate steps of a build."
+    print_usage()
+    sys.exit(1)
 
   return ImmutableDict(input_data)
 
@@ -157,5 +868,50 @@ def print_usage():
         "--manifest_file=)"
   print "-n Automatically infer directory titles instead of asking, " + \
       "will ask by default. (long form: --no-prompt)"
+  print "--titles-file=titles.json Take directory titles from titles.json " + \
+      "(or a .csv file) and save the answers to any questions there."
+  print "-w 4 Read JPEG metadata and render pages with 4 worker " + \
+      "processes, defaults to 1 " + \
+      "(long form: --workers=)"
+  print "--incremental Reuse the metadata and pages from the last run into " + \
+      "the same output directory, only rebuilding what changed."
+  print "--resume Continue an --incremental build that was interrupted, " + \
+      "skipping the work it had already done."
+  print "--template-cache=my_cache/ Keep compiled templates in my_cache " + \
+      "between runs."
+  print "--lazy-metadata Only read each JPEG's metadata when its pages " + \
+      "are rendered. JPEGs without metadata get no caption instead of " + \
+      "being skipped."
+  print "--native-iptc Read IPTC data with the built in reader instead " + \
+      "of IPTCInfo."
+  print "--copy-threads=4 Copy files with 4 threads, defaults to 1."
+  print "--copy-mode=hardlink Hard link (or reflink) the JPEGs into the " + \
+      "output directory instead of copying them, defaults to copy."
+  print "--thumbnails Generate small and medium sized copies of the " + \
+      "JPEGs and show those instead of the originals (needs Pillow)."
+  print "--profile Write the time spent in each phase of the build to " + \
+      "build-profile.json in the output directory."
+  print "--cprofile Like --profile, and also dump cProfile statistics to " + \
+      "build-profile.pstats."
+  print "--page-size=100 Show at most 100 pictures on each directory " + \
+      "page, splitting bigger directories over several pages."
+  print "--natural-sort Put IMG_2.jpg before IMG_10.jpg instead of after it."
+  print "--watch Keep rebuilding the gallery as the input changes " + \
+      "(implies -n)."
+  print "--precompress Write .gz (and .br) copies of the pages, CSS, " + \
+      "JavaScript and search index next to them."
+  print "--one-directory-at-a-time Keep only one directory in memory " + \
+      "at a time, for very large galleries. --search-index and " + \
+      "--incremental still keep an entry per picture."
+  print "--search-index Write an index of the captions and add a search " + \
+      "box to the directory pages."
+  print "--shard=2/4 Build the second of four parts of the gallery, " + \
+      "for building on several machines (implies -n)."
+  print "--merge-shards=4 Finish a gallery built in four parts with " + \
+      "--shard, once they are all in the output directory (implies -n)."
+  print "--progress Report the progress of the build to standard error " + \
+      "every few seconds."
+  print "--progress-json=progress.jsonl Append the progress reports to " + \
+      "progress.jsonl as JSON lines."
   print "Calling this script with -h or --help prints this message " + \
       "and exits."
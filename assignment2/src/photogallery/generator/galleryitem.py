@@ -1,6 +1,7 @@
 from ..utils.inject import assign_injectables
 from ..utils.getters import with_getters_for
 from ..utils.immutabledict import ImmutableDict
+from manifestparser import LookupPlan
 import exporter
 
 
@@ -17,6 +18,27 @@ class GalleryItem(object):
   def as_view(self):
     raise NotImplementedError
 
+  def as_entry_view(self):
+    """
+    The view of this item as an entry in its parent directory's page. Only
+    the entry's link and image are shown there, so subclasses can leave out
+    anything else that is expensive to compute.
+    """
+    return self.as_view()
+
+  def as_views(self):
+    """
+    The views of all the pages this item is rendered to.
+
+    Returns:
+      An iterable of (output file name, view) tuples.
+    """
+    return [(self.get_output_file_name(), self.as_view())]
+
+  def get_output_file_names(self):
+    """ Returns the names of all the pages this item is rendered to. """
+    return [self.get_output_file_name()]
+
   def get_contents(self):
     raise NotImplementedError
 
@@ -33,7 +55,7 @@ class NoSuchMetadata(Exception):
 
 class JpegPicture(GalleryItem):
   """ A single immutable JPEG picture """
-  def __init__(self, name, back_href, iptc_info, lookup_table):
+  def __init__(self, name, back_href, iptc_info, lookup_table, variants=None):
     """
     Constructor for JpegPictures.
 
@@ -43,6 +65,11 @@ class JpegPicture(GalleryItem):
       iptc_info the IPTCInfo object wrapped around the file.
       lookup_table an immutable dictionary mapping metadata
                    attribute names to their indices in iptc_info.data.
+                   Pass the run's shared LookupPlan; anything else is
+                   compiled into a LookupPlan the first time it is needed.
+      variants an ImmutableDict with the names of the picture's resized
+               copies under 'thumbnail_src' and 'web_src', or None if
+               there are none and the original should be shown instead.
     """
     assign_injectables(self, locals())
 
@@ -79,7 +106,31 @@ class JpegPicture(GalleryItem):
     if attribute_name not in self.lookup_table:
       raise NoSuchMetadata, attribute_name
     iptc_info_key = self.lookup_table[attribute_name]
-    return self.iptc_info.data[iptc_info_key]
+    return self.get_iptc_info().data[iptc_info_key]
+
+  def get_iptc_info(self):
+    """ Returns the object holding this picture's IPTC data. """
+    return self.iptc_info
+
+  def get_lookup_plan(self):
+    """ Returns self.lookup_table as a LookupPlan. """
+    if not isinstance(self.lookup_table, LookupPlan):
+      self.lookup_table = LookupPlan(self.lookup_table)
+    return self.lookup_table
+
+  def get_caption_fields(self):
+    """
+    Reads every attribute in the lookup table in a single pass.
+
+    Returns:
+      A list of (attribute name, value) pairs, in manifest order.
+    """
+    entries = self.get_lookup_plan().get_entries()
+    if not entries:
+      return [] # Nothing to read, so don't load the metadata.
+    data = self.get_iptc_info().data
+    return [(attribute_name, data[iptc_info_key]) \
+        for attribute_name, iptc_info_key in entries]
 
   def get_all_attributes(self):
     """
@@ -90,24 +141,25 @@ class JpegPicture(GalleryItem):
       An ImmutableDict mapping all the available attribute names
       to their values.
     """
-    result = {}
-    for attribute_name in self.lookup_table:
-      result[attribute_name] = self.lookup(attribute_name)
-    return ImmutableDict(result)
+    return ImmutableDict(self.get_caption_fields())
 
-  def build_caption(self):
+  def build_caption(self, caption_fields=None):
     """
     Pretty-prints all of the attributes associated with this JPEG picture
     into a caption.
 
+    Args:
+      caption_fields the result of get_caption_fields, if it has already
+                     been called.
+
     Returns:
       A string caption that can be put in the template.
     """
+    if caption_fields is None:
+      caption_fields = self.get_caption_fields()
     caption = []
-    attributes = self.get_all_attributes()
-    for attribute in attributes:
+    for attribute, attribute_value in caption_fields:
       attribute_string = attribute + ": "
-      attribute_value = self.lookup(attribute)
       if attribute_value is None:
         result = 'No data for this image\n'
       else:
@@ -124,13 +176,21 @@ class JpegPicture(GalleryItem):
       A new ImmutableDict containing data about self.
     """
     result = {}
-    if 'alt_text' in self.lookup_table:
-      result['alt_text'] = self.lookup('alt_text')
+    caption_fields = self.get_caption_fields()
+    alt_text_index = self.get_lookup_plan().get_alt_text_index()
+    if alt_text_index is not None:
+      result['alt_text'] = caption_fields[alt_text_index][1]
     else:
       result['alt_text'] = self.name
 
     result['src'] = self.name
-    result['caption_data'] = self.build_caption()
+    if self.variants is None:
+      result['thumbnail_src'] = self.name
+      result['web_src'] = self.name
+    else:
+      result['thumbnail_src'] = self.variants['thumbnail_src']
+      result['web_src'] = self.variants['web_src']
+    result['caption_data'] = self.build_caption(caption_fields)
     result['href'] = self.get_output_file_name()
     result['back_href'] = self.back_href
     return ImmutableDict(result)
@@ -140,7 +200,44 @@ class JpegPicture(GalleryItem):
 
   def __repr__(self):
     return self.__str__()
-with_getters_for(JpegPicture, 'name')
+with_getters_for(JpegPicture, 'name', 'back_href', 'variants')
+
+
+class LazyJpegPicture(JpegPicture):
+  """
+  A JpegPicture that doesn't read its file until the first lookup. Until
+  then it only holds the path of the file, and afterwards it only holds
+  the datasets named in the lookup table.
+  """
+  def __init__(self, name, back_href, full_jpeg_name, load_metadata,
+      lookup_table, variants=None):
+    """
+    Constructor for LazyJpegPictures.
+
+    Args:
+      name the name of the JPEG file.
+      back_href the link to the parent directory.
+      full_jpeg_name the path of the JPEG file.
+      load_metadata a function that takes full_jpeg_name and returns an
+                    object whose data attribute maps the datasets in
+                    lookup_table to their values.
+      lookup_table an immutable dictionary mapping metadata
+                   attribute names to their indices in the loaded data.
+      variants see JpegPicture.
+    """
+    JpegPicture.__init__(self, name, back_href, None, lookup_table, variants)
+    self.full_jpeg_name = full_jpeg_name
+    self.load_metadata = load_metadata
+
+  def get_iptc_info(self):
+    """ Loads the metadata the first time it is needed. """
+    if self.iptc_info is None:
+      self.iptc_info = self.load_metadata(self.full_jpeg_name)
+      self.load_metadata = None
+    return self.iptc_info
+
+  def __str__(self):
+    return 'LazyJpegPicture(' + self.name + ')'
 
 def directory_name_to_html_file_name(directory_name):
     """ Remove leading and trailing /, if they exist. """
@@ -149,8 +246,89 @@ def directory_name_to_html_file_name(directory_name):
         replace('\\', '-').replace('.', '-')
     return no_illegal_chars + '.html'
 
+def remove_extension(name):
+  """
+  Given a file name, removes its extension.
+
+  Args:
+    name the name to process.
+  """
+  dot_index = name.find('.')
+  if dot_index == -1: # No extension
+    return name
+  return name[:dot_index]
+
+def infer_title(directory_name):
+  """
+  Make a title for a directory out of its name, for when nobody has given
+  it a better one.
+
+  Args:
+    directory_name the name of the directory.
+  """
+  file_name = directory_name_to_html_file_name(directory_name)
+  return remove_extension(file_name) \
+      .replace('-', ' ').replace('_', ' ').capitalize()
+
+class DirectorySummary(GalleryItem):
+  """
+  Stands in for a subdirectory on its parent's page when the directories
+  are created one at a time (see GalleryItemFactory.iter_directories). It
+  only knows enough to show the subdirectory's entry; the subdirectory's
+  own pages are exported when it is created.
+  """
+  def __init__(self, name, back_href):
+    """
+    Constructor for DirectorySummary.
+
+    Args:
+      name the name of the subdirectory.
+      back_href the href for the subdirectory's parent.
+    """
+    assign_injectables(self, locals())
+
+  def as_entry_view(self):
+    """
+    Creates the view of the subdirectory shown in its parent's page.
+    """
+    result = {}
+    # Needed if this is being viewed as a subdirectory in photo-directory
+    result['alt_text'] = self.get_output_file_name()
+    result['src'] = 'directory_image.jpg'
+    result['thumbnail_src'] = 'directory_image.jpg'
+    result['href'] = self.get_output_file_name()
+    result['back_href'] = self.back_href
+    return ImmutableDict(result)
+
+  def as_views(self):
+    """ The subdirectory's pages are not rendered from here. """
+    return []
+
+  def get_output_file_names(self):
+    return []
+
+  def get_contents(self):
+    """ The contents aren't known until the subdirectory is created. """
+    return []
+
+  def get_exporter(self):
+    """ Returns a directory exporter. """
+    return exporter.create_photo_directory_exporter()
+
+  def get_output_file_name(self):
+    """ Convert self.name into an appropriate HTML file name."""
+    return directory_name_to_html_file_name(self.name)
+
+  def __str__(self):
+    return 'DirectorySummary(' + self.name + ')'
+
+  def __repr__(self):
+    return self.__str__()
+with_getters_for(DirectorySummary, 'name', 'back_href')
+
 class JpegDirectory(GalleryItem):
-  def __init__(self, name, contents, should_prompt, back_href=None):
+  def __init__(self, name, contents, should_prompt, back_href=None,
+      page_size=None, title=None):
     """
     Constructor for JpegDirectories.
 
@@ -161,6 +339,11 @@ class JpegDirectory(GalleryItem):
       back_href the href for the parent directory, if it exists,
                 or None if it doesn't. Unlike with JpegPictures, it is possible
                 for back_href to be None.
+      page_size the largest number of items to show on one page, or None
+                (the default) to show them all on a single page.
+      title the title of the directory's pages, or None (the default) to
+            infer one from the name, or prompt for one if should_prompt.
+            See directorytitles for deciding the titles ahead of time.
     """
     assign_injectables(self, locals())
     self.human_readable_title = None
@@ -170,19 +353,89 @@ class JpegDirectory(GalleryItem):
     Creates a view of this object that can be sent to the template.
 
     Returns:
-      An ImmutableDict with data about this object to be displayed.
+      An ImmutableDict with data about this object to be displayed. If the
+      directory has more than one page, this is the view of the first one.
     """
-    result = {}
-    result['title'] = self.get_human_readable_title()
-    result['images'] = [picture.as_view() for picture in self.contents]
+    return self.create_page_view(1)
 
-    # Needed if this is being viewed as a subdirectory in photo-directory
-    result['alt_text'] = self.get_output_file_name()
-    result['src'] = 'directory_image.jpg'
-    result['href'] = self.get_output_file_name()
-    result['back_href'] = self.back_href
+  def as_entry_view(self):
+    """
+    Creates the view of this object shown in its parent's page, which
+    leaves out the contents.
+    """
+    return self.get_summary().as_entry_view()
+
+  def get_summary(self):
+    """ Returns the DirectorySummary that stands in for this directory. """
+    return DirectorySummary(self.name, self.back_href)
+
+  def as_views(self):
+    """
+    Creates the views of every page of this directory, one at a time, so
+    that only a single page's worth of entries is processed at once.
+
+    Returns:
+      A generator of (output file name, view) tuples.
+    """
+    for page_number in range(1, self.get_page_count() + 1):
+      yield (self.get_page_file_name(page_number),
+          self.create_page_view(page_number))
+
+  def create_page_view(self, page_number):
+    """
+    Creates the view of a single page of this directory.
+
+    Args:
+      page_number the number of the page, starting from 1.
+
+    Returns:
+      An ImmutableDict with the entries on the page, and links to the
+      previous and next pages (None if there aren't any).
+    """
+    page_count = self.get_page_count()
+    if self.page_size is None:
+      entries = self.contents
+    else:
+      start = (page_number - 1) * self.page_size
+      entries = self.contents[start:start + self.page_size]
+    result = dict(self.as_entry_view())
+    result['title'] = self.get_human_readable_title()
+    result['images'] = [entry.as_entry_view() for entry in entries]
+    result['page_number'] = page_number
+    result['page_count'] = page_count
+    result['prev_href'] = None
+    result['next_href'] = None
+    if page_number > 1:
+      result['prev_href'] = self.get_page_file_name(page_number - 1)
+    if page_number < page_count:
+      result['next_href'] = self.get_page_file_name(page_number + 1)
     return ImmutableDict(result)
 
+  def get_page_count(self):
+    """ Returns the number of pages this directory is rendered to. """
+    if self.page_size is None or not self.contents:
+      return 1
+    return (len(self.contents) + self.page_size - 1) // self.page_size
+
+  def get_page_file_name(self, page_number):
+    """
+    Returns the name of the file a page is written to. The first page keeps
+    the directory's usual name, so links to the directory still work. The
+    others get a '.page-N' suffix, which can't clash with the name of any
+    other directory's page because directory names have their dots replaced.
+
+    Args:
+      page_number the number of the page, starting from 1.
+    """
+    file_name = self.get_output_file_name()
+    if page_number == 1:
+      return file_name
+    return '%s.page-%d.html' % (self.remove_extension(file_name), page_number)
+
+  def get_output_file_names(self):
+    return [self.get_page_file_name(page_number) \
+        for page_number in range(1, self.get_page_count() + 1)]
+
   def get_exporter(self):
     """ Returns a directory exporter. """
     return exporter.create_photo_directory_exporter()
@@ -193,14 +446,14 @@ class JpegDirectory(GalleryItem):
 
   def get_human_readable_title(self):
     """
-    Try to infer a title for the template page.
-    If allowed, prompt the user for a better version.
+    Use the title given to the constructor, or try to infer a title for the
+    template page. If allowed, prompt the user for a better version.
     """
+    if self.title is not None:
+      return self.title
     if self.human_readable_title is not None:
       return self.human_readable_title
-    file_name = self.get_output_file_name()
-    inferred_name = self.remove_extension(file_name) \
-        .replace('-', ' ').replace('_', ' ').capitalize()
+    inferred_name = infer_title(self.name)
     if self.should_prompt:
       self.human_readable_title = raw_input( \
           "Name for the directory %s [%s]:" % \
@@ -219,14 +472,12 @@ class JpegDirectory(GalleryItem):
     Args:
       name the name to process.
     """
-    dot_index = name.find('.')
-    if dot_index == -1: # No extension
-      return name
-    return name[:dot_index]
+    return remove_extension(name)
 
   def __str__(self):
     return 'JpegDirectory(' + self.name + ')'
 
   def __repr__(self):
     return self.__str__()
-with_getters_for(JpegDirectory, 'name', 'contents')
+with_getters_for(JpegDirectory, 'name', 'contents', 'back_href',
+    'page_size', 'title')
@@ -1,9 +1,16 @@
 import os
 import re
+import time
 import os.path
+import itertools
 from iptcinfo import IPTCInfo
-from galleryitem import JpegPicture, JpegDirectory, directory_name_to_html_file_name
+from galleryitem import JpegPicture, LazyJpegPicture, JpegDirectory, \
+    DirectorySummary, directory_name_to_html_file_name
 from ..utils.inject import assign_injectables
+from ..utils.getters import with_getters_for
+from profiler import NullProfiler
+from progress import NullProgressReporter, IMAGES
+from quarantine import describe_exception
 
 def is_jpeg_file(file_name):
   """
@@ -43,6 +50,32 @@ def is_js_file(file_name):
   return file_is_of_type(file_name, 'js')
   
 
+def is_html_file(file_name):
+  """
+  Determine if a file is labeled as HTML.
+
+  Args:
+    file_name the name of the file.
+
+  Returns:
+    True if the file ends with .html.
+  """
+  return file_is_of_type(file_name, 'html')
+
+
+def is_json_file(file_name):
+  """
+  Determine if a file is labeled as JSON.
+
+  Args:
+    file_name the name of the file.
+
+  Returns:
+    True if the file ends with .json.
+  """
+  return file_is_of_type(file_name, 'json')
+
+
 def file_is_of_type(file_name, extension):
   """
   Return whether a file is of a certain type.
@@ -55,10 +88,106 @@ def file_is_of_type(file_name, extension):
   Returns:
     True if file_name ends with extension.
   """
-  type_re = re.compile(r'\.%s' % extension)
+  type_re = re.compile(r'\.%s$' % extension)
   return type_re.search(file_name) != None
 
 
+DIGITS_RE = re.compile(r'(\d+)')
+
+
+def name_sort_key(gallery_item):
+  """
+  Sort key that puts GalleryItems in plain alphabetical order of their
+  names, so IMG_10.jpg comes before IMG_2.jpg.
+  """
+  return gallery_item.get_name()
+
+
+def natural_sort_key(gallery_item):
+  """
+  Sort key that compares the runs of digits in GalleryItems' names as
+  numbers, so IMG_2.jpg comes before IMG_10.jpg.
+  """
+  # Splitting on a captured group puts text at the even positions and
+  # digits at the odd ones, so two keys only ever compare like with like.
+  return [int(part) if index % 2 else part for index, part in
+      enumerate(DIGITS_RE.split(gallery_item.get_name()))]
+
+
+NO_IPTC_DATA_MESSAGE = 'No IPTC data found.'
+EXTRACTED = 'extracted'
+UNREADABLE = 'unreadable'
+NO_IPTC_DATA = 'no_iptc_data'
+FAILED = 'failed'
+# How many files each worker process reads at a time.
+METADATA_CHUNK_SIZE = 8
+
+
+class ExtractedIptcInfo(object):
+  """
+  A picklable stand-in for IPTCInfo that only carries the datasets named in
+  the manifest. Worker processes send these back to the parent instead of
+  whole IPTCInfo objects.
+  """
+  def __init__(self, data):
+    """
+    Constructor for ExtractedIptcInfo.
+
+    Args:
+      data a dict mapping IPTC dataset numbers to their values, with None
+           for datasets that the file does not have.
+    """
+    assign_injectables(self, locals())
+with_getters_for(ExtractedIptcInfo, 'data')
+
+
+def extract_iptc_data(arguments):
+  """
+  Reads the IPTC data out of a single JPEG. This is a module level function
+  so that it can be sent to the worker processes of a multiprocessing.Pool.
+
+  Args:
+    arguments a tuple of (iptc_info_constructor, full_jpeg_name, keys), where
+              keys are the IPTC dataset numbers that should be extracted.
+
+  Returns:
+    A tuple of (status, payload). status is EXTRACTED, in which case payload
+    is an ExtractedIptcInfo, or UNREADABLE or NO_IPTC_DATA, in which case
+    payload is None and the file should be skipped, or FAILED, in which case
+    payload is any other exception raised when trying to extract the IPTC
+    information. It is returned rather than raised, so that one bad file
+    doesn't lose the results of the others read with it.
+  """
+  iptc_info_constructor, full_jpeg_name, keys = arguments
+  try:
+    iptc_info = iptc_info_constructor(full_jpeg_name)
+  except IOError:
+    return (UNREADABLE, None)
+  except Exception as possible_iptc_exception:
+    if str(possible_iptc_exception) == NO_IPTC_DATA_MESSAGE:
+      return (NO_IPTC_DATA, None)
+    return (FAILED, possible_iptc_exception)
+  data = dict((key, iptc_info.data[key]) for key in keys)
+  return (EXTRACTED, ExtractedIptcInfo(data))
+
+
+def timed_extract_iptc_data(arguments):
+  """
+  Like extract_iptc_data, but also measures how long the read took, in the
+  process that did the reading.
+
+  Args:
+    arguments the same tuple as for extract_iptc_data.
+
+  Returns:
+    A tuple of (outcome, seconds), where outcome is what extract_iptc_data
+    returned.
+  """
+  start = time.time()
+  outcome = extract_iptc_data(arguments)
+  return (outcome, time.time() - start)
+
+
 class GalleryItemFactory(object):
   """
   Class to bootstrap the application by reading the disk and
@@ -66,7 +195,11 @@ class GalleryItemFactory(object):
   """
   def __init__(self, lookup_table, should_prompt,
       iptc_info_constructor=IPTCInfo,
-      list_directory=os.listdir, is_directory=os.path.isdir):
+      list_directory=os.listdir, is_directory=os.path.isdir,
+      process_pool=None, metadata_cache=None, lazy_metadata=False,
+      variants_for=None, profiler=None, page_size=None,
+      sort_key=name_sort_key, directory_titles=None, progress_reporter=None,
+      quarantine=None):
     """
     Constructor for GalleryItemFactory
 
@@ -80,8 +213,40 @@ class GalleryItemFactory(object):
                      defaults to os.listdir
       is_directory a function that takes a file name and returns true if it
                    is  a directory (defaults to os.path.isdir).
+      process_pool a multiprocessing.Pool used to read the JPEGs of each
+                   directory in parallel, or None (the default) to read them
+                   one at a time in this process.
+      metadata_cache a BuildCache holding the metadata read by previous runs,
+                     or None (the default) to read every JPEG.
+      lazy_metadata whether to put off reading JPEGs that are not in
+                    metadata_cache until their metadata is first needed,
+                    by creating LazyJpegPictures for them (defaults to False).
+                    Files that turn out to be unreadable are then captioned
+                    as having no data instead of being skipped.
+      variants_for a function that takes the full name of a JPEG and returns
+                   the names of its resized copies (see JpegPicture), or None
+                   (the default) if there aren't any.
+      profiler the profiler.BuildProfiler that is told how long each IPTC
+               read took, or None to not keep track.
+      page_size the largest number of items to put on one directory page, or
+                None (the default) to put each directory on a single page.
+      sort_key the function that gives the key a GalleryItem is sorted by
+               within its directory, defaults to name_sort_key.
+      directory_titles the directorytitles.DirectoryTitles to take the
+                       directories' titles from, or None (the default) to
+                       infer them or prompt for them as they are needed.
+      progress_reporter the progress.ProgressReporter that counts the JPEGs
+                        as they are read, or None to not report progress.
+      quarantine the quarantine.Quarantine that files which raise unexpected
+                 exceptions are put in, and which files already in it are
+                 skipped by, or None (the default) to let the exceptions
+                 propagate.
     """
     assign_injectables(self, locals())
+    if self.profiler is None:
+      self.profiler = NullProfiler()
+    if self.progress_reporter is None:
+      self.progress_reporter = NullProgressReporter()
 
   def create_directory(self, path, parent_path=None):
     """
@@ -95,7 +260,7 @@ class GalleryItemFactory(object):
 
     Returns:
       A JpegDirectory containing GalleryItems wrapped around all the appropriate
-      contents of the directory referred to by path.
+      contents of the directory referred to by path, sorted by sort_key.
 
     Raises:
       Any exception thrown when trying to extract IPTC information from a JPEG
@@ -104,18 +269,253 @@ class GalleryItemFactory(object):
     file_names = self.list_directory(path)
     jpeg_names = filter(is_jpeg_file, file_names)
 
-    path_contents = []
-
-    for name in jpeg_names:
-      maybe_jpeg_picture = self.try_create_jpeg_picture(path, name)
-      if maybe_jpeg_picture is not None:
-        path_contents.append(maybe_jpeg_picture)
+    path_contents = self.create_jpeg_pictures(path, jpeg_names)
 
     subdirectories = self.create_subdirectories(file_names, path)
     path_contents.extend(subdirectories)
+    path_contents.sort(key=self.sort_key)
     back_href = self.maybe_get_back_href(parent_path)
     return JpegDirectory(path, path_contents, self.should_prompt,
-        back_href=back_href)
+        back_href=back_href, page_size=self.page_size,
+        title=self.find_title(path))
+
+  def iter_directories(self, path):
+    """
+    Like create_directory, but creates the directories one at a time, depth
+    first and without recursing, instead of building the whole tree at once.
+    Subdirectories appear in their parent's contents as DirectorySummaries,
+    so once a directory has been exported it can be thrown away, and only
+    the paths of the directories still to visit are kept.
+
+    Args:
+      path the path to the top-most directory.
+
+    Returns:
+      A generator of JpegDirectories, each one before its subdirectories,
+      with the same contents as create_directory would give them except for
+      the subdirectories.
+
+    Raises:
+      See create_directory.
+    """
+    to_visit = [(path, None)]
+    while to_visit:
+      directory_path, parent_path = to_visit.pop()
+      file_names = self.list_directory(directory_path)
+      directory = self.create_summarized_directory(directory_path, file_names,
+          self.find_subdirectories(file_names, directory_path), parent_path)
+      yield directory
+      # Reversed, so that subdirectories are visited in sorted order.
+      to_visit.extend(reversed([(entry.get_name(), directory_path) \
+          for entry in directory.get_contents() \
+          if isinstance(entry, DirectorySummary)]))
+
+  def create_summarized_directory(self, path, file_names, subdirectory_names,
+      parent_path=None):
+    """
+    Creates a JpegDirectory whose subdirectories are DirectorySummaries,
+    see iter_directories.
+
+    Args:
+      path the path to the directory.
+      file_names the names of the files in path. The JPEGs among them are
+                 read, the rest are ignored.
+      subdirectory_names the full names of the subdirectories to show, which
+                         need not be listed in file_names.
+      parent_path see create_directory.
+    """
+    jpeg_names = filter(is_jpeg_file, file_names)
+    path_contents = self.create_jpeg_pictures(path, jpeg_names)
+    subdirectory_back_href = self.maybe_get_back_href(path)
+    path_contents.extend(DirectorySummary(directory_name,
+      subdirectory_back_href) for directory_name in subdirectory_names)
+    path_contents.sort(key=self.sort_key)
+    return JpegDirectory(path, path_contents, self.should_prompt,
+        back_href=self.maybe_get_back_href(parent_path),
+        page_size=self.page_size, title=self.find_title(path))
+
+  def create_jpeg_pictures(self, path, jpeg_names):
+    """
+    Creates JpegPictures for all the JPEGs in a single directory, fanning the
+    IPTC extraction out to self.process_pool if there is one. Each JPEG is
+    counted as an image on the progress reporter once its metadata is read,
+    or looked up in the cache; quarantined ones aren't counted at all.
+
+    Args:
+      path the path to the directory the files are in.
+      jpeg_names the names of the JPEG files in path.
+
+    Returns:
+      A list of JpegPictures, in the same order as jpeg_names, leaving out
+      the files that had to be skipped.
+    """
+    if self.quarantine is not None:
+      jpeg_names = [name for name in jpeg_names \
+          if not self.quarantine.is_quarantined(os.path.join(path, name))]
+    if self.lazy_metadata:
+      maybe_jpeg_pictures = [self.create_lazy_jpeg_picture(path, name) \
+          for name in jpeg_names]
+    elif self.process_pool is None and self.metadata_cache is None:
+      maybe_jpeg_pictures = list(self.progress_reporter.iterate(IMAGES,
+          (self.try_create_jpeg_picture(path, name) for name in jpeg_names)))
+    else:
+      outcomes = self.extract_iptc_outcomes(path, jpeg_names)
+      maybe_jpeg_pictures = [self.jpeg_picture_from_outcome(path, name, outcome) \
+          for name, outcome in zip(jpeg_names, outcomes)]
+    return [picture for picture in maybe_jpeg_pictures if picture is not None]
+
+  def reads_metadata_lazily(self):
+    """
+    Returns True if the metadata is only read when the pages are rendered,
+    see lazy_metadata.
+    """
+    return self.lazy_metadata
+
+  def create_lazy_jpeg_picture(self, path, name):
+    """
+    Creates a LazyJpegPicture for a JPEG, or a JpegPicture if its metadata
+    is already in self.metadata_cache.
+
+    Args:
+      path the path to the directory the file is in.
+      name the name of the file.
+
+    Returns:
+      A JpegPicture, or None if the cache says the file should be skipped.
+    """
+    full_jpeg_name = os.path.join(path, name)
+    if self.metadata_cache is not None:
+      outcome = self.metadata_cache.lookup(full_jpeg_name)
+      if outcome is not None:
+        self.progress_reporter.count(IMAGES)
+        return self.jpeg_picture_from_outcome(path, name, outcome)
+    return LazyJpegPicture(name, directory_name_to_html_file_name(path),
+        full_jpeg_name, self.load_metadata, self.lookup_table,
+        self.find_variants(path, name))
+
+  def load_metadata(self, full_jpeg_name):
+    """
+    Reads the metadata of a single JPEG for a LazyJpegPicture. By now the
+    picture is already part of its directory, so a file that can't be read
+    gets empty metadata instead of being skipped. For the same reason, a
+    file that fails unexpectedly isn't put in the quarantine, which would
+    leave it out of later builds but not this one.
+
+    Args:
+      full_jpeg_name the path of the JPEG.
+
+    Returns:
+      An ExtractedIptcInfo with the datasets named in the lookup table.
+    """
+    keys = self.lookup_table.values()
+    outcome, seconds = timed_extract_iptc_data((self.iptc_info_constructor,
+        full_jpeg_name, keys))
+    self.profiler.record_iptc_read(full_jpeg_name, seconds)
+    self.progress_reporter.count(IMAGES)
+    if self.metadata_cache is not None:
+      self.metadata_cache.store(full_jpeg_name, outcome)
+    status, iptc_info = outcome
+    if status == EXTRACTED:
+      return iptc_info
+    elif status == FAILED:
+      if self.quarantine is None:
+        raise iptc_info
+      print "Reading %s failed unexpectedly (%s)." % (full_jpeg_name,
+          describe_exception(iptc_info))
+    else:
+      print "I was unable to get IPTC data from the file %s" % full_jpeg_name
+    print "It will be shown without a caption."
+    return ExtractedIptcInfo(dict((key, None) for key in keys))
+
+  def extract_iptc_outcomes(self, path, jpeg_names):
+    """
+    Gets the metadata of the JPEGs in a single directory, from
+    self.metadata_cache where possible, and by reading the files (with
+    self.process_pool, if there is one) otherwise.
+
+    Args:
+      path the path to the directory the files are in.
+      jpeg_names the names of the JPEG files in path.
+
+    Returns:
+      A list of the (status, payload) tuples described by extract_iptc_data,
+      in the same order as jpeg_names.
+    """
+    full_jpeg_names = [os.path.join(path, name) for name in jpeg_names]
+    if self.metadata_cache is None:
+      outcomes = [None] * len(full_jpeg_names)
+    else:
+      outcomes = map(self.metadata_cache.lookup, full_jpeg_names)
+    missing_indices = [index for index, outcome in enumerate(outcomes) \
+        if outcome is None]
+    self.progress_reporter.count(IMAGES,
+        len(full_jpeg_names) - len(missing_indices))
+    keys = self.lookup_table.values()
+    arguments = [(self.iptc_info_constructor, full_jpeg_names[index], keys) \
+        for index in missing_indices]
+    # Results come back in order as they are read, so that each picture is
+    # counted when it is done.
+    if self.process_pool is None:
+      timed_outcomes = itertools.imap(timed_extract_iptc_data, arguments)
+    else:
+      timed_outcomes = self.process_pool.imap(timed_extract_iptc_data,
+          arguments, METADATA_CHUNK_SIZE)
+    timed_outcomes = self.progress_reporter.iterate(IMAGES, timed_outcomes)
+    for index, (outcome, seconds) in zip(missing_indices, timed_outcomes):
+      self.profiler.record_iptc_read(full_jpeg_names[index], seconds)
+      outcomes[index] = outcome
+      if self.metadata_cache is not None:
+        self.metadata_cache.store(full_jpeg_names[index], outcome)
+    return outcomes
+
+  def jpeg_picture_from_outcome(self, path, name, outcome):
+    """
+    Turns the result of extract_iptc_data into a JpegPicture, printing the
+    same messages as try_create_jpeg_picture for files that were skipped.
+
+    Args:
+      path the path to the directory the file is in.
+      name the name of the file.
+      outcome the (status, payload) tuple returned by extract_iptc_data.
+
+    Returns:
+      A JpegPicture, or None if the file was skipped.
+    """
+    status, iptc_info = outcome
+    if status == UNREADABLE:
+      self.report_unreadable_file(name)
+      return None
+    elif status == NO_IPTC_DATA:
+      self.report_missing_iptc_data(name)
+      return None
+    elif status == FAILED:
+      self.handle_unexpected_exception(os.path.join(path, name), iptc_info)
+      return None
+    return JpegPicture(name, directory_name_to_html_file_name(path), iptc_info,
+        self.lookup_table, self.find_variants(path, name))
+
+  def find_title(self, path):
+    """
+    Find the title of a directory in self.directory_titles, if there is one.
+
+    Args:
+      path the path to the directory.
+    """
+    if self.directory_titles is None:
+      return None
+    return self.directory_titles.get_title(path)
+
+  def find_variants(self, path, name):
+    """
+    Find the resized copies of a JPEG, if there are any.
+
+    Args:
+      path the path to the directory the file is in.
+      name the name of the file.
+    """
+    if self.variants_for is None:
+      return None
+    return self.variants_for(os.path.join(path, name))
 
   def try_create_jpeg_picture(self, path, name):
     """
@@ -135,26 +535,54 @@ class GalleryItemFactory(object):
       Any exception raised when trying to extract IPTC information from the
       JPEG, that is not an IOError or an exception with the message 
       'No IPTC data found.' In those two cases, simply skips the file and
-      prints a message saying so.
+      prints a message saying so. If there is a quarantine, other exceptions
+      put the file in it and skip it too.
     """
     full_jpeg_name = os.path.join(path, name)
+    start = time.time()
     try:
+      iptc_info = self.iptc_info_constructor(full_jpeg_name)
+      self.profiler.record_iptc_read(full_jpeg_name, time.time() - start)
       return JpegPicture(name,
         directory_name_to_html_file_name(path),
-        self.iptc_info_constructor(full_jpeg_name),
-          self.lookup_table)
+        iptc_info,
+          self.lookup_table, self.find_variants(path, name))
     except IOError:
-      print "I was unable to open the file ", name, " for some reason"
-      print "Maybe it's corrupted?"
-      print "Skipping it..."
+      self.report_unreadable_file(name)
       return None
     except Exception as possible_iptc_exception:
-      if str(possible_iptc_exception) == 'No IPTC data found.':
-        print "I was unable to get IPTC data from the file %s" % name
-        print "Skipping it..."
+      if str(possible_iptc_exception) == NO_IPTC_DATA_MESSAGE:
+        self.report_missing_iptc_data(name)
         return None
       else:
-        raise possible_iptc_exception # Some other exception
+        # Some other exception
+        self.handle_unexpected_exception(full_jpeg_name,
+            possible_iptc_exception)
+        return None
+
+  def handle_unexpected_exception(self, full_jpeg_name, exception):
+    """
+    Put a file whose metadata couldn't be read in the quarantine.
+
+    Args:
+      full_jpeg_name the full name of the file.
+      exception the unexpected exception that reading it raised.
+
+    Raises:
+      exception, if there is no quarantine.
+    """
+    if self.quarantine is None:
+      raise exception
+    self.quarantine.add(full_jpeg_name, exception)
+
+  def report_unreadable_file(self, name):
+    print "I was unable to open the file ", name, " for some reason"
+    print "Maybe it's corrupted?"
+    print "Skipping it..."
+
+  def report_missing_iptc_data(self, name):
+    print "I was unable to get IPTC data from the file %s" % name
+    print "Skipping it..."
 
   def maybe_get_back_href(self, path):
     """
@@ -179,8 +607,21 @@ class GalleryItemFactory(object):
       file_names the names of the files in path.
       path the root directory path to process.
     """
-    full_file_names = [os.path.join(path, name) for name in file_names]
-    directory_names = filter(self.is_directory, full_file_names)
+    directory_names = self.find_subdirectories(file_names, path)
     jpeg_directories = [self.create_directory(directory_name, parent_path=path) \
         for directory_name in directory_names]
     return jpeg_directories
+
+  def find_subdirectories(self, file_names, path):
+    """
+    Find which of the files in path are directories.
+
+    Args:
+      file_names the names of the files in path.
+      path the directory they are in.
+
+    Returns:
+      The full names of the subdirectories.
+    """
+    full_file_names = [os.path.join(path, name) for name in file_names]
+    return filter(self.is_directory, full_file_names)
@@ -1,8 +1,64 @@
 import simplejson as json
+from collections import OrderedDict
 from ..utils.inject import assign_injectables
+from ..utils.immutabledict import ImmutableDict
+
+ALT_TEXT_ATTRIBUTE = 'alt_text'
 
 def parse_manifest_data(to_parse):
-  return json.loads(to_parse)
+  """ Parse a manifest, keeping its attributes in the order they are listed. """
+  return json.loads(to_parse, object_pairs_hook=OrderedDict)
+
+class LookupPlan(ImmutableDict):
+  """
+  A lookup table compiled once per run and shared by every JpegPicture.
+  It is still a dict mapping attribute names to IPTC dataset numbers, but it
+  also keeps the attributes in manifest order as a tuple, so a picture can
+  read all of its caption fields in a single pass.
+  """
+  def __init__(self, lookup_table, canonical_key=None):
+    """
+    Constructor for LookupPlan.
+
+    Args:
+      lookup_table a dict mapping attribute names to dataset numbers, or a
+                   sequence of (name, dataset number) pairs. If it is an
+                   ordered dict or a sequence, its order is kept.
+      canonical_key a function that turns each key of the manifest into the
+                    form the metadata readers take, such as
+                    metadatareader.canonical_key, or None to keep the keys
+                    as they are.
+
+    Raises:
+      ValueError if canonical_key raises it for one of the keys.
+    """
+    if isinstance(lookup_table, dict):
+      entries = tuple(lookup_table.items())
+    else:
+      entries = tuple(lookup_table)
+    if canonical_key is not None:
+      entries = tuple((name, canonical_key(key)) for name, key in entries)
+    ImmutableDict.__init__(self, entries)
+    self.entries = entries
+    self.alt_text_index = None
+    for index, (name, key) in enumerate(entries):
+      if name == ALT_TEXT_ATTRIBUTE:
+        self.alt_text_index = index
+
+  def get_entries(self):
+    """ Returns the (attribute name, dataset number) pairs, in order. """
+    return self.entries
+
+  def get_alt_text_index(self):
+    """
+    Returns the position of the alt_text attribute in get_entries, or None
+    if the manifest doesn't have one.
+    """
+    return self.alt_text_index
+
+  def __reduce__(self):
+    # ImmutableDict can't be unpickled item by item, so rebuild from entries.
+    return (LookupPlan, (self.entries,))
 
 class ManifestParser(object):
   def __init__(self, input_file):
@@ -12,3 +68,15 @@ class ManifestParser(object):
     lines = self.input_file.readlines()
     json_string = "\n".join(lines)
     return parse_manifest_data(json_string)
+
+  def get_lookup_plan(self, canonical_key=None):
+    """
+    Returns the manifest compiled into a LookupPlan.
+
+    Args:
+      canonical_key see LookupPlan.
+
+    Raises:
+      ValueError if one of the manifest's keys can't be understood.
+    """
+    return LookupPlan(self.get_json_data(), canonical_key)
@@ -0,0 +1,410 @@
+"""
+Module providing NativeMetadata, which reads the EXIF (APP1), XMP (APP1)
+and IPTC (APP13) metadata of a JPEG in a single walk over its markers,
+without reading the image data.
+
+The manifest addresses the three kinds of metadata with different keys:
+
+  80                  an IPTC dataset number, as before. Its name in
+                      IPTCInfo, such as "by-line", and "iptc:80" or
+                      "iptc:by-line" mean the same.
+  "exif:Artist"       an EXIF tag, by name (see EXIF_TAGS) or number, such
+                      as "exif:0x013b".
+  "xmp:dc:creator"    an XMP property, as a prefix from XMP_NAMESPACES and
+                      a property name.
+
+The gallery generator compiles the manifest with canonical_key, which turns
+every IPTC key into its dataset number, so the readers only ever see
+numbers for IPTC.
+
+Like NativeIptcInfo, NativeMetadata objects keep the values in data, keyed
+by the manifest's keys, so NativeMetadataConstructor can be handed to
+GalleryItemFactory as its iptc_info_constructor.
+"""
+import os
+import mmap
+import struct
+from xml.etree import cElementTree as ElementTree
+from iptcinfo import c_datasets_r as IPTC_DATASET_NAMES
+from iptcreader import iter_segments, find_iptc_resource, \
+    parse_iptc_datasets, IptcDatasets, APP13_MARKER
+from galleryitemfactory import NO_IPTC_DATA_MESSAGE
+
+APP1_MARKER = 0xe1
+EXIF_SIGNATURE = 'Exif\x00\x00'
+XMP_SIGNATURE = 'http://ns.adobe.com/xap/1.0/\x00'
+
+EXIF = 'exif'
+XMP = 'xmp'
+IPTC = 'iptc'
+
+EXIF_TAGS = {
+  'ImageDescription': 0x010e,
+  'Make': 0x010f,
+  'Model': 0x0110,
+  'Orientation': 0x0112,
+  'Software': 0x0131,
+  'DateTime': 0x0132,
+  'Artist': 0x013b,
+  'Copyright': 0x8298,
+  'ExposureTime': 0x829a,
+  'FNumber': 0x829d,
+  'ISOSpeedRatings': 0x8827,
+  'DateTimeOriginal': 0x9003,
+  'DateTimeDigitized': 0x9004,
+  'ExposureBiasValue': 0x9204,
+  'Flash': 0x9209,
+  'FocalLength': 0x920a,
+  'UserComment': 0x9286,
+  'FocalLengthIn35mmFilm': 0xa405,
+  'CameraOwnerName': 0xa430,
+  'BodySerialNumber': 0xa431,
+  'LensMake': 0xa433,
+  'LensModel': 0xa434,
+}
+EXIF_IFD_POINTER = 0x8769
+USER_COMMENT_TAG = 0x9286
+
+ASCII_TYPE = 2
+UNDEFINED_TYPE = 7
+RATIONAL_TYPES = frozenset([5, 10])
+# The struct format of a single value of each EXIF type.
+EXIF_TYPE_FORMATS = {1: 'B', 2: 'c', 3: 'H', 4: 'I', 5: 'II', 6: 'b', 7: 'c',
+    8: 'h', 9: 'i', 10: 'ii'}
+
+XMP_NAMESPACES = {
+  'dc': 'http://purl.org/dc/elements/1.1/',
+  'xmp': 'http://ns.adobe.com/xap/1.0/',
+  'xmpRights': 'http://ns.adobe.com/xap/1.0/rights/',
+  'photoshop': 'http://ns.adobe.com/photoshop/1.0/',
+  'Iptc4xmpCore': 'http://iptc.org/std/Iptc4xmpCore/1.0/xmlns/',
+  'exif': 'http://ns.adobe.com/exif/1.0/',
+  'aux': 'http://ns.adobe.com/exif/1.0/aux/',
+  'tiff': 'http://ns.adobe.com/tiff/1.0/',
+  'lr': 'http://ns.adobe.com/lightroom/1.0/',
+}
+RDF_NAMESPACE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+
+def parse_key(key):
+  """
+  Work out which kind of metadata a manifest key refers to.
+
+  Args:
+    key a value from the manifest's lookup table.
+
+  Returns:
+    A tuple of (kind, address): (IPTC, dataset number), (EXIF, tag number)
+    or (XMP, '{namespace}property').
+
+  Raises:
+    ValueError if the key can't be understood.
+  """
+  if isinstance(key, (int, long)):
+    return (IPTC, key)
+  if isinstance(key, basestring) and key in IPTC_DATASET_NAMES:
+    return (IPTC, IPTC_DATASET_NAMES[key])
+  if isinstance(key, basestring) and ':' in key:
+    kind, name = key.split(':', 1)
+    if kind == EXIF:
+      if name in EXIF_TAGS:
+        return (EXIF, EXIF_TAGS[name])
+      try:
+        return (EXIF, int(name, 0))
+      except ValueError:
+        pass
+    elif kind == XMP and ':' in name:
+      prefix, property_name = name.split(':', 1)
+      if prefix in XMP_NAMESPACES:
+        return (XMP, '{%s}%s' % (XMP_NAMESPACES[prefix], property_name))
+    elif kind == IPTC and name.isdigit():
+      return (IPTC, int(name))
+    elif kind == IPTC and name in IPTC_DATASET_NAMES:
+      return (IPTC, IPTC_DATASET_NAMES[name])
+  raise ValueError('The manifest key %r is not an IPTC dataset number or ' \
+      'name, an EXIF tag or an XMP property.' % (key,))
+
+
+def canonical_key(key):
+  """
+  Returns the form of a manifest key that is handed to the readers: the
+  dataset number for IPTC keys, however they were written, and the key
+  itself for EXIF and XMP.
+
+  Raises:
+    ValueError if the key can't be understood, see parse_key.
+  """
+  kind, address = parse_key(key)
+  if kind == IPTC:
+    return address
+  return key
+
+
+def needs_metadata_reader(keys):
+  """ Returns True if any of the manifest keys refer to EXIF or XMP. """
+  return any(parse_key(key)[0] != IPTC for key in keys)
+
+
+def find_metadata_segments(jpeg_data, kinds):
+  """
+  Walks the markers of a JPEG once, picking out the metadata segments.
+  Scanning stops at the start of the image data, or as soon as every kind
+  of segment asked for has been found.
+
+  Args:
+    jpeg_data the contents of the file, as a string or an mmap.
+    kinds the kinds of metadata to look for, some of EXIF, XMP and IPTC.
+
+  Returns:
+    A dict mapping each kind that was found to its bytes: the TIFF
+    structure for EXIF, the XML packet for XMP and the IIM block for IPTC.
+  """
+  segments = {}
+  for marker, segment_start, segment_end in iter_segments(jpeg_data):
+    if marker == APP1_MARKER:
+      header = jpeg_data[segment_start:segment_start + len(XMP_SIGNATURE)]
+      if EXIF in kinds and EXIF not in segments \
+          and header.startswith(EXIF_SIGNATURE):
+        segments[EXIF] = \
+            jpeg_data[segment_start + len(EXIF_SIGNATURE):segment_end]
+      elif XMP in kinds and XMP not in segments \
+          and header == XMP_SIGNATURE:
+        segments[XMP] = \
+            jpeg_data[segment_start + len(XMP_SIGNATURE):segment_end]
+    elif marker == APP13_MARKER and IPTC in kinds and IPTC not in segments:
+      iptc_block = find_iptc_resource(jpeg_data[segment_start:segment_end])
+      if iptc_block is not None:
+        segments[IPTC] = iptc_block
+    if len(segments) == len(kinds):
+      break
+  return segments
+
+
+def parse_exif(tiff_data, tags):
+  """
+  Decodes EXIF tags from the first image directory (IFD0) and the EXIF
+  directory it points to.
+
+  Args:
+    tiff_data the TIFF structure from the EXIF segment.
+    tags the tag numbers to decode.
+
+  Returns:
+    A dict mapping the tags that were found to their values, as strings.
+    A damaged TIFF structure gives whatever could be read before the
+    damage.
+  """
+  values = {}
+  if tiff_data[:2] == 'II':
+    byte_order = '<'
+  elif tiff_data[:2] == 'MM':
+    byte_order = '>'
+  else:
+    return values
+  try:
+    ifd_offset = struct.unpack(byte_order + 'I', tiff_data[4:8])[0]
+    entries = read_ifd(tiff_data, ifd_offset, byte_order)
+    if EXIF_IFD_POINTER in entries:
+      exif_ifd_offset = decode_exif_numbers(tiff_data,
+          entries[EXIF_IFD_POINTER], byte_order)[0]
+      entries.update(read_ifd(tiff_data, exif_ifd_offset, byte_order))
+    for tag in tags:
+      if tag in entries:
+        values[tag] = decode_exif_value(tiff_data, tag, entries[tag],
+            byte_order)
+  except (struct.error, IndexError):
+    pass
+  return values
+
+
+def read_ifd(tiff_data, offset, byte_order):
+  """
+  Reads the entries of one TIFF image directory.
+
+  Returns:
+    A dict mapping tag numbers to (type, count, offset of the value), where
+    the value is stored in the entry itself if it fits in four bytes.
+  """
+  entries = {}
+  entry_count = struct.unpack(byte_order + 'H', tiff_data[offset:offset + 2])[0]
+  for index in range(entry_count):
+    entry_offset = offset + 2 + 12 * index
+    tag, value_type, count = struct.unpack(byte_order + 'HHI',
+        tiff_data[entry_offset:entry_offset + 8])
+    if value_type not in EXIF_TYPE_FORMATS:
+      continue
+    size = struct.calcsize(EXIF_TYPE_FORMATS[value_type]) * count
+    value_offset = entry_offset + 8
+    if size > 4:
+      value_offset = struct.unpack(byte_order + 'I',
+          tiff_data[value_offset:value_offset + 4])[0]
+    if value_offset + size > len(tiff_data):
+      continue
+    entries[tag] = (value_type, count, value_offset)
+  return entries
+
+
+def decode_exif_numbers(tiff_data, entry, byte_order):
+  """ Returns the values of a numeric entry, with rationals as pairs. """
+  value_type, count, value_offset = entry
+  value_format = EXIF_TYPE_FORMATS[value_type]
+  numbers = struct.unpack(byte_order + value_format * count,
+      tiff_data[value_offset:value_offset + struct.calcsize(value_format) *
+        count])
+  if value_type in RATIONAL_TYPES:
+    return zip(numbers[::2], numbers[1::2])
+  return numbers
+
+
+def decode_exif_value(tiff_data, tag, entry, byte_order):
+  """
+  Turns an entry's value into a string for the caption. Text is stripped
+  of its padding, and several numbers are separated by commas.
+  """
+  value_type, count, value_offset = entry
+  if value_type in (ASCII_TYPE, UNDEFINED_TYPE):
+    raw_value = tiff_data[value_offset:value_offset + count]
+    if tag == USER_COMMENT_TAG:
+      return decode_user_comment(raw_value, byte_order)
+    return raw_value.rstrip('\x00').strip()
+  return ', '.join(format_exif_number(number) for number in
+      decode_exif_numbers(tiff_data, entry, byte_order))
+
+
+def decode_user_comment(raw_value, byte_order):
+  """ UserComment starts with eight bytes naming its character code. """
+  character_code, comment = raw_value[:8], raw_value[8:]
+  if character_code.startswith('UNICODE'):
+    encoding = 'utf-16-le' if byte_order == '<' else 'utf-16-be'
+    comment = comment.decode(encoding, 'replace').encode('utf-8')
+  return comment.rstrip('\x00').strip()
+
+
+def format_exif_number(number):
+  """ Formats an integer, or a rational as a (numerator, denominator) pair. """
+  if not isinstance(number, tuple):
+    return str(number)
+  numerator, denominator = number
+  if denominator == 0:
+    return str(numerator)
+  if numerator % denominator == 0:
+    return str(numerator // denominator)
+  if numerator == 1:
+    return '1/%d' % denominator # Exposure times read better as fractions.
+  return '%g' % (float(numerator) / denominator)
+
+
+def parse_xmp(packet, properties):
+  """
+  Finds XMP properties in a packet. A property can be an attribute or a
+  child element of an rdf:Description. Language alternatives give the
+  default language's text, and lists are joined with commas.
+
+  Args:
+    packet the XML packet from the XMP segment.
+    properties the properties to find, as '{namespace}property' names.
+
+  Returns:
+    A dict mapping the properties that were found to their values, as
+    UTF-8 strings.
+  """
+  values = {}
+  try:
+    root = ElementTree.fromstring(packet.rstrip('\x00 \t\r\n'))
+  except SyntaxError:
+    return values
+  wanted = frozenset(properties)
+  for description in root.iter('{%s}Description' % RDF_NAMESPACE):
+    for name, text in description.attrib.items():
+      if name in wanted and name not in values:
+        values[name] = text.encode('utf-8')
+    for element in description:
+      if element.tag in wanted and element.tag not in values:
+        values[element.tag] = xmp_element_text(element).encode('utf-8')
+  return values
+
+
+def xmp_element_text(element):
+  """ Helper for parse_xmp, gets the text of a single property element. """
+  for container_name in ('Alt', 'Seq', 'Bag'):
+    container = element.find('{%s}%s' % (RDF_NAMESPACE, container_name))
+    if container is None:
+      continue
+    items = container.findall('{%s}li' % RDF_NAMESPACE)
+    if container_name == 'Alt':
+      for item in items:
+        if item.get(XML_LANG) == 'x-default':
+          return (item.text or u'').strip()
+      items = items[:1]
+    return u', '.join((item.text or u'').strip() for item in items)
+  return (element.text or u'').strip()
+
+
+class NativeMetadata(object):
+  """
+  Reads the EXIF, XMP and IPTC metadata of a JPEG file, a drop-in
+  replacement for IPTCInfo as far as the photo gallery is concerned.
+  """
+  def __init__(self, file_name, keys):
+    """
+    Constructor for NativeMetadata.
+
+    Args:
+      file_name the path of the JPEG to read.
+      keys the manifest keys to decode, see parse_key.
+
+    Raises:
+      IOError if the file can't be read.
+      Exception with the message 'No IPTC data found.' if the file has none
+      of the kinds of metadata that keys refer to, matching IPTCInfo.
+      ValueError if one of the keys can't be understood.
+    """
+    addresses = dict((key, parse_key(key)) for key in keys)
+    kinds = frozenset(kind for kind, address in addresses.values())
+    segments = {}
+    with open(file_name, 'rb') as jpeg_file:
+      if os.fstat(jpeg_file.fileno()).st_size > 0:
+        jpeg_data = mmap.mmap(jpeg_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+          segments = find_metadata_segments(jpeg_data, kinds)
+        finally:
+          jpeg_data.close()
+    if not segments:
+      raise Exception(NO_IPTC_DATA_MESSAGE)
+    def addresses_of(wanted_kind):
+      return [address for kind, address in addresses.values() \
+          if kind == wanted_kind]
+    decoded = {
+      IPTC: parse_iptc_datasets(segments.get(IPTC, ''), addresses_of(IPTC)),
+      EXIF: parse_exif(segments.get(EXIF, ''), addresses_of(EXIF)),
+      XMP: parse_xmp(segments[XMP], addresses_of(XMP)) if XMP in segments \
+          else {}}
+    self.data = IptcDatasets()
+    for key, (kind, address) in addresses.items():
+      self.data[key] = decoded[kind].get(address)
+
+
+class NativeMetadataConstructor(object):
+  """
+  A picklable function object that creates NativeMetadatas that only decode
+  the given keys. Pass it to GalleryItemFactory as iptc_info_constructor.
+  """
+  def __init__(self, keys):
+    """
+    Constructor for NativeMetadataConstructor.
+
+    Args:
+      keys the manifest keys to decode, usually the values of the manifest's
+           lookup table.
+
+    Raises:
+      ValueError if one of the keys can't be understood, so that a bad
+      manifest is reported before any file is read.
+    """
+    self.keys = tuple(keys)
+    for key in self.keys:
+      parse_key(key)
+
+  def __call__(self, file_name):
+    return NativeMetadata(file_name, self.keys)
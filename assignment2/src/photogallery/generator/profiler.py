@@ -0,0 +1,228 @@
+"""
+Module providing BuildProfiler, which times the phases of a gallery build
+and writes a report to the output directory, and NullProfiler, which has the
+same interface and does nothing. Objects that can be profiled take a
+profiler and default to a NullProfiler, so they never have to check.
+"""
+import os.path
+import time
+import heapq
+import cProfile
+from contextlib import contextmanager
+import simplejson as json
+from ..utils.inject import assign_injectables
+
+REPORT_FILE_NAME = 'build-profile.json'
+CPROFILE_FILE_NAME = 'build-profile.pstats'
+
+
+class PhaseRecord(object):
+  """ The time spent in a phase, and how many files and bytes it handled. """
+  def __init__(self, name):
+    self.name = name
+    self.seconds = 0.0
+    self.files = 0
+    self.bytes = 0
+
+  def as_view(self):
+    return {'name': self.name, 'seconds': round(self.seconds, 6),
+        'files': self.files, 'bytes': self.bytes}
+
+
+class BuildProfiler(object):
+  """
+  Records how long each phase of a build takes. Phases are reported in the
+  order they were first entered.
+  """
+  def __init__(self, output_directory, use_cprofile=False, slowest_count=20,
+      clock=time.time):
+    """
+    Constructor for BuildProfiler.
+
+    Args:
+      output_directory the directory to write the report to.
+      use_cprofile whether to run the whole build under cProfile and dump
+                   its statistics next to the report (defaults to False).
+      slowest_count how many of the slowest IPTC reads to report.
+      clock the function that returns the current time in seconds,
+            defaults to time.time.
+    """
+    assign_injectables(self, locals())
+    self.phases = []
+    self.phases_by_name = {}
+    self.active_phases = []
+    self.slowest_iptc_reads = []
+    self.iptc_read_count = 0
+    self.started_at = None
+    self.finished_at = None
+    self.succeeded = None
+    self.profile = None
+
+  def get_phase(self, name):
+    """ Returns the PhaseRecord for name, creating it if necessary. """
+    if name not in self.phases_by_name:
+      record = PhaseRecord(name)
+      self.phases.append(record)
+      self.phases_by_name[name] = record
+    return self.phases_by_name[name]
+
+  def start(self):
+    """ Call at the start of the build. """
+    self.started_at = self.clock()
+    if self.use_cprofile:
+      self.profile = cProfile.Profile()
+      self.profile.enable()
+
+  @contextmanager
+  def phase(self, name):
+    """
+    A context manager that charges the time spent in its block to a phase.
+    Time charged to a nested phase, such as one timed by iterate_phase, is
+    not also charged to this one.
+
+    Args:
+      name the name of the phase.
+    """
+    record = self.get_phase(name)
+    self.active_phases.append([record, 0.0])
+    start = self.clock()
+    try:
+      yield record
+    finally:
+      record, nested_seconds = self.active_phases.pop()
+      elapsed = self.clock() - start
+      record.seconds += elapsed - nested_seconds
+      if self.active_phases:
+        self.active_phases[-1][1] += elapsed
+
+  def iterate_phase(self, name, iterable):
+    """
+    Wraps iterable so that the time spent producing its items is charged to
+    the phase name, such as rendering pages that are consumed by a writer.
+    Each item is counted as a file, and if it has a get_contents method, its
+    contents are counted as bytes (in UTF-8, if they are unicode), in this
+    phase and in the one around it.
+
+    Args:
+      name the name of the phase.
+      iterable the iterable to wrap.
+
+    Returns:
+      A generator of the items of iterable.
+    """
+    record = self.get_phase(name)
+    iterator = iter(iterable)
+    while True:
+      start = self.clock()
+      try:
+        item = iterator.next()
+      except StopIteration:
+        self.charge_nested(record, self.clock() - start)
+        return
+      self.charge_nested(record, self.clock() - start)
+      size = 0
+      if hasattr(item, 'get_contents'):
+        contents = item.get_contents()
+        if isinstance(contents, unicode):
+          # Measured the way TemplateWriter writes it.
+          contents = contents.encode('utf-8')
+        size = len(contents)
+      record.files += 1
+      record.bytes += size
+      self.count(files=1, bytes=size)
+      yield item
+
+  def charge_nested(self, record, seconds):
+    """ Helper for iterate_phase, moves seconds from the active phase. """
+    record.seconds += seconds
+    if self.active_phases:
+      self.active_phases[-1][1] += seconds
+
+  def count(self, files=0, bytes=0):
+    """
+    Add to the numbers of files and bytes handled by the active phase.
+
+    Args:
+      files the number of files to add.
+      bytes the number of bytes to add.
+    """
+    if self.active_phases:
+      record = self.active_phases[-1][0]
+      record.files += files
+      record.bytes += bytes
+
+  def record_iptc_read(self, file_name, seconds):
+    """
+    Remember how long it took to read the IPTC data of a file, and count it
+    as a file handled by the active phase. Only the slowest reads are kept.
+
+    Args:
+      file_name the full name of the JPEG.
+      seconds how long reading it took.
+    """
+    self.iptc_read_count += 1
+    self.count(files=1)
+    entry = (seconds, file_name)
+    if len(self.slowest_iptc_reads) < self.slowest_count:
+      heapq.heappush(self.slowest_iptc_reads, entry)
+    else:
+      heapq.heappushpop(self.slowest_iptc_reads, entry)
+
+  def create_report(self):
+    """
+    Returns the report as a dict that can be serialized to JSON.
+    """
+    slowest = sorted(self.slowest_iptc_reads, reverse=True)
+    return {'total_seconds': round(self.finished_at - self.started_at, 6),
+        'succeeded': self.succeeded,
+        'phases': [record.as_view() for record in self.phases],
+        'iptc_reads': self.iptc_read_count,
+        'slowest_iptc_reads': [{'file': file_name,
+          'seconds': round(seconds, 6)} for seconds, file_name in slowest]}
+
+  def finish(self, succeeded=True):
+    """
+    Call at the end of the build, whether or not it got there.
+
+    Args:
+      succeeded whether the build got to the end.
+
+    Effects:
+      Writes the report, and the cProfile statistics if they were collected,
+      to the output directory.
+    """
+    self.finished_at = self.clock()
+    self.succeeded = succeeded
+    # A build can fail before anything was written to the output directory.
+    if not os.path.isdir(self.output_directory):
+      os.makedirs(self.output_directory)
+    if self.profile is not None:
+      self.profile.disable()
+      self.profile.dump_stats(os.path.join(self.output_directory,
+          CPROFILE_FILE_NAME))
+    report_file_name = os.path.join(self.output_directory, REPORT_FILE_NAME)
+    with open(report_file_name, 'w') as report_file:
+      json.dump(self.create_report(), report_file, indent=2)
+    print 'Wrote a profile of this build to', report_file_name
+
+
+class NullProfiler(object):
+  """ A profiler that doesn't record anything. """
+  def start(self):
+    pass
+
+  @contextmanager
+  def phase(self, name):
+    yield None
+
+  def iterate_phase(self, name, iterable):
+    return iterable
+
+  def count(self, files=0, bytes=0):
+    pass
+
+  def record_iptc_read(self, file_name, seconds):
+    pass
+
+  def finish(self, succeeded=True):
+    pass
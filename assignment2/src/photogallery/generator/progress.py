@@ -0,0 +1,253 @@
+"""
+Module providing ProgressReporter, which keeps count of what a build has
+done so far and every few seconds reports the counts, the current rate and
+an estimate of the time left, and NullProgressReporter, which has the same
+interface and does nothing. Like the profilers, objects that report their
+progress take a reporter and default to a NullProgressReporter.
+
+A build goes through stages, such as reading the metadata, and each stage
+is measured by one of the counters, such as the number of images read. The
+rate and the estimate are for the current stage, and there is only an
+estimate if the stage knows how much work it has in total.
+"""
+import sys
+import time
+from contextlib import contextmanager
+import simplejson as json
+from ..utils.inject import assign_injectables
+
+IMAGES = 'images'
+THUMBNAILS = 'thumbnails'
+PAGES = 'pages'
+COPIED_FILES = 'copied_files'
+COPIED_BYTES = 'copied_bytes'
+COUNTERS = (IMAGES, THUMBNAILS, PAGES, COPIED_FILES, COPIED_BYTES)
+# How the counters are described on the terminal.
+LABELS = {IMAGES: 'images', THUMBNAILS: 'thumbnails', PAGES: 'pages',
+    COPIED_FILES: 'files copied', COPIED_BYTES: 'copied'}
+DEFAULT_INTERVAL_SECONDS = 5.0
+
+
+def format_duration(seconds):
+  """ Format a number of seconds as H:MM:SS. """
+  seconds = int(round(seconds))
+  return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def format_bytes(count):
+  """ Format a number of bytes with a binary unit, such as 1.5 MiB. """
+  for unit in ['B', 'KiB', 'MiB', 'GiB']:
+    if count < 1024 or unit == 'GiB':
+      break
+    count /= 1024.0
+  if unit == 'B':
+    return '%d B' % count
+  return '%.1f %s' % (count, unit)
+
+
+class StageRecord(object):
+  """ The counter a stage is measured by, and how far along it is. """
+  def __init__(self, name, counter, total, started_at, start_count):
+    assign_injectables(self, locals())
+
+
+class ProgressReporter(object):
+  """
+  Reports the progress of a build to the terminal and to a file of JSON
+  lines, one object per report, for monitoring tools to follow.
+  """
+  def __init__(self, stream=sys.stderr, json_lines_file_name=None,
+      interval_seconds=DEFAULT_INTERVAL_SECONDS, clock=time.time):
+    """
+    Constructor for ProgressReporter.
+
+    Args:
+      stream the file to write readable reports to, defaults to
+             sys.stderr. None to only write JSON lines.
+      json_lines_file_name the file to append the JSON reports to, or None
+                           to not write any.
+      interval_seconds how often to report.
+      clock the function that returns the current time in seconds,
+            defaults to time.time.
+    """
+    assign_injectables(self, locals())
+    self.counts = dict((counter, 0) for counter in COUNTERS)
+    self.current_stage = None
+    self.started_at = None
+    self.reported_at = None
+    self.json_lines_file = None
+
+  def start(self):
+    """ Call at the start of the build. """
+    self.started_at = self.clock()
+    self.reported_at = self.started_at
+    if self.json_lines_file_name is not None:
+      self.json_lines_file = open(self.json_lines_file_name, 'a')
+
+  @contextmanager
+  def stage(self, name, counter, total=None):
+    """
+    A context manager for a stage of the build. Its progress is reported
+    when it ends, as well as every interval_seconds while it runs.
+
+    Args:
+      name the name of the stage.
+      counter the one of COUNTERS that measures the stage's progress.
+      total the value that counter will have gone up by when the stage is
+            done, or None if it isn't known (yet, see add_to_total).
+    """
+    self.current_stage = StageRecord(name, counter, total, self.clock(),
+        self.counts[counter])
+    try:
+      yield self.current_stage
+    finally:
+      self.report()
+      self.current_stage = None
+
+  def add_to_total(self, amount):
+    """
+    Add to the amount of work the current stage has, for stages that find
+    out how much they have to do as they go.
+    """
+    if self.current_stage is not None:
+      self.current_stage.total = (self.current_stage.total or 0) + amount
+
+  def count(self, counter, amount=1):
+    """
+    Add to one of the counters, and report if it's time to.
+
+    Args:
+      counter one of COUNTERS.
+      amount how much to add to it.
+    """
+    self.counts[counter] += amount
+    if self.clock() - self.reported_at >= self.interval_seconds:
+      self.report()
+
+  def iterate(self, counter, iterable):
+    """
+    Wraps iterable so that each of its items adds one to counter when it is
+    produced.
+
+    Returns:
+      A generator of the items of iterable.
+    """
+    for item in iterable:
+      self.count(counter)
+      yield item
+
+  def create_report(self, finished=False, failed=False):
+    """
+    Returns the current state of the build as a dict that can be serialized
+    to JSON.
+
+    Args:
+      finished whether the build is over.
+      failed whether the build has stopped because of an error.
+    """
+    now = self.clock()
+    report = {'time': now, 'elapsed_seconds': round(now - self.started_at, 3),
+        'finished': finished, 'failed': failed, 'stage': None, 'done': None, 'total': None,
+        'counter': None, 'rate': None, 'eta_seconds': None}
+    report.update(self.counts)
+    stage = self.current_stage
+    if stage is not None:
+      done = self.counts[stage.counter] - stage.start_count
+      stage_seconds = now - stage.started_at
+      report['stage'] = stage.name
+      report['counter'] = stage.counter
+      report['done'] = done
+      report['total'] = stage.total
+      if stage_seconds > 0:
+        report['rate'] = round(done / stage_seconds, 3)
+      # Assume the rest of the stage goes as fast as it has so far.
+      if stage.total is not None and done > 0:
+        report['eta_seconds'] = round(
+            max(stage.total - done, 0) * stage_seconds / done, 3)
+    return report
+
+  def format_report(self, report):
+    """ Turn a report into a line for the terminal. """
+    parts = ['[%s]' % format_duration(report['elapsed_seconds'])]
+    if report['failed']:
+      parts.append('failed:')
+    elif report['finished']:
+      parts.append('finished:')
+    elif report['stage'] is not None:
+      counter = report['counter']
+      done = report['done']
+      if counter == COPIED_BYTES:
+        done = format_bytes(done)
+      if report['total'] is None:
+        parts.append('%s: %s %s' % (report['stage'], done, LABELS[counter]))
+      else:
+        total = report['total']
+        if counter == COPIED_BYTES:
+          total = format_bytes(total)
+        parts.append('%s: %s of %s %s' % (report['stage'], done, total,
+          LABELS[counter]))
+      if report['rate'] is not None:
+        rate = report['rate']
+        if counter == COPIED_BYTES:
+          parts.append('(%s/s)' % format_bytes(rate))
+        else:
+          parts.append('(%.1f/s)' % rate)
+      if report['eta_seconds'] is not None:
+        parts.append('ETA %s' % format_duration(report['eta_seconds']))
+      parts.append('|')
+    parts.append('%d images, %d thumbnails, %d pages, %d files (%s) copied' % \
+        (report[IMAGES], report[THUMBNAILS], report[PAGES],
+          report[COPIED_FILES], format_bytes(report[COPIED_BYTES])))
+    return ' '.join(parts)
+
+  def report(self, finished=False, failed=False):
+    """
+    Write a report now.
+
+    Args:
+      finished whether the build is over.
+      failed whether the build has stopped because of an error.
+    """
+    self.reported_at = self.clock()
+    report = self.create_report(finished, failed)
+    if self.stream is not None:
+      self.stream.write(self.format_report(report) + '\n')
+      self.stream.flush()
+    if self.json_lines_file is not None:
+      self.json_lines_file.write(json.dumps(report, sort_keys=True) + '\n')
+      self.json_lines_file.flush()
+
+  def finish(self, succeeded=True):
+    """
+    Call at the end of the build, writes the final report.
+
+    Args:
+      succeeded whether the build got to the end. If not, the final report
+                is marked failed instead of finished.
+    """
+    self.report(finished=succeeded, failed=not succeeded)
+    if self.json_lines_file is not None:
+      self.json_lines_file.close()
+      self.json_lines_file = None
+
+
+class NullProgressReporter(object):
+  """ A progress reporter that doesn't report anything. """
+  def start(self):
+    pass
+
+  @contextmanager
+  def stage(self, name, counter, total=None):
+    yield None
+
+  def add_to_total(self, amount):
+    pass
+
+  def count(self, counter, amount=1):
+    pass
+
+  def iterate(self, counter, iterable):
+    return iterable
+
+  def finish(self, succeeded=True):
+    pass
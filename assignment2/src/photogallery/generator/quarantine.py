@@ -0,0 +1,162 @@
+"""
+Module providing Quarantine, the list of JPEGs that made the metadata
+reader raise an exception it didn't expect, or that the imaging library
+couldn't decode when making thumbnails. Instead of stopping the build,
+such a file is left out of the gallery and added to the list, which is kept
+in the output directory so that later builds skip it without reading it
+again, until the file changes. Files that changed or were deleted are
+dropped from the list, see prune.
+
+The list is a JSON object mapping each file's full name to the error it
+caused and the modification time and size it had, so it can be looked at
+and edited by hand.
+"""
+import os
+import os.path
+import traceback
+import simplejson as json
+from ..utils.inject import assign_injectables
+from ..utils.getters import with_getters_for
+
+QUARANTINE_FILE_NAME = '.quarantine.json'
+
+
+def describe_exception(exception):
+  """ Returns the type and message of an exception as one line. """
+  return traceback.format_exception_only(type(exception),
+      exception)[-1].strip()
+
+
+class Quarantine(object):
+  """
+  The JPEGs that are left out of the gallery because reading them failed in
+  an unexpected way.
+  """
+  def __init__(self, file_name, entries=None, stat_file=os.stat):
+    """
+    Constructor for Quarantine.
+
+    Args:
+      file_name the file the list is saved to, or None to not save it.
+      entries a dict mapping full file names to dicts with the 'error' they
+              caused and their 'stamp', the [modification time, size] they
+              had, defaults to empty.
+      stat_file the function used to stat the files, defaults to os.stat.
+    """
+    assign_injectables(self, locals())
+    if self.entries is None:
+      self.entries = {}
+    self.added_count = 0
+
+  def get_stamp(self, full_jpeg_name):
+    stat_result = self.stat_file(full_jpeg_name)
+    return [stat_result.st_mtime, stat_result.st_size]
+
+  def is_current(self, full_jpeg_name):
+    """
+    Returns True if a file on the list still exists and hasn't changed
+    since it was put there.
+    """
+    try:
+      return self.entries[full_jpeg_name]['stamp'] == \
+          self.get_stamp(full_jpeg_name)
+    except OSError:
+      return False
+
+  def is_quarantined(self, full_jpeg_name):
+    """
+    Returns True if a file is on the list and hasn't changed since it was
+    put there. A file that has changed is taken off the list, so that it is
+    read again.
+    """
+    if full_jpeg_name not in self.entries:
+      return False
+    if self.is_current(full_jpeg_name):
+      return True
+    del self.entries[full_jpeg_name]
+    self.save()
+    return False
+
+  def prune(self):
+    """
+    Take the files that changed or were deleted off the list, so that only
+    the ones that are still left out of the gallery are counted.
+
+    Returns:
+      The number of files taken off the list.
+
+    Effects:
+      Saves the list, if anything was taken off it.
+    """
+    stale_names = [name for name in self.entries if not self.is_current(name)]
+    for name in stale_names:
+      del self.entries[name]
+    if stale_names:
+      self.save()
+    return len(stale_names)
+
+  def add(self, full_jpeg_name, exception):
+    """
+    Put a file on the list, and save the list straight away so it survives
+    the build dying later on.
+
+    Args:
+      full_jpeg_name the full name of the file.
+      exception the exception that reading it raised.
+    """
+    try:
+      stamp = self.get_stamp(full_jpeg_name)
+    except OSError:
+      stamp = None
+    self.entries[full_jpeg_name] = {'error': describe_exception(exception),
+        'stamp': stamp}
+    self.added_count += 1
+    print "Reading %s failed unexpectedly (%s)." % (full_jpeg_name,
+        self.entries[full_jpeg_name]['error'])
+    print "Skipping it, and leaving it out of later builds until it changes."
+    self.save()
+
+  def save(self):
+    """
+    Write the list to file_name.
+
+    Effects:
+      Replaces file_name.
+    """
+    if self.file_name is None:
+      return
+    directory = os.path.dirname(self.file_name)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory)
+    temporary_name = self.file_name + '.tmp'
+    with open(temporary_name, 'wb') as quarantine_file:
+      json.dump(self.entries, quarantine_file, indent=2, sort_keys=True)
+    os.rename(temporary_name, self.file_name)
+
+  def get_size(self):
+    """ Returns the number of files on the list. """
+    return len(self.entries)
+with_getters_for(Quarantine, 'added_count')
+
+
+def load_quarantine(file_name, stat_file=os.stat):
+  """
+  Factory function for Quarantine, reads the list left by earlier builds.
+  A missing or unreadable list gives an empty Quarantine.
+
+  Args:
+    file_name the file the list is kept in.
+    stat_file see Quarantine.
+  """
+  entries = {}
+  try:
+    with open(file_name, 'rb') as quarantine_file:
+      entries = json.load(quarantine_file)
+    if not isinstance(entries, dict):
+      entries = {}
+  except (IOError, ValueError):
+    pass
+  # JSON gives unicode names, but the paths read from the disk are bytes.
+  entries = dict((name.encode('utf-8'), entry) \
+      for name, entry in entries.iteritems())
+  return Quarantine(file_name, entries, stat_file)
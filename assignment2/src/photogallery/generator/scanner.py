@@ -0,0 +1,156 @@
+"""
+Module providing FileIndex, which walks a directory tree once and remembers
+what it found, so that the GalleryItemFactory, the BuildCache and the copier
+can all ask about the tree without going back to the filesystem.
+"""
+import os
+import os.path
+import stat
+from ..utils.inject import assign_injectables
+
+
+class FileIndex(object):
+  """
+  An in-memory index of a directory tree. Every directory is listed once and
+  every entry is stat'ed once, the first time the index is used.
+  """
+  def __init__(self, root_directory, list_directory=os.listdir,
+      stat_file=os.stat, include_entry=None):
+    """
+    Constructor for FileIndex.
+
+    Args:
+      root_directory the directory at the top of the tree to index.
+      list_directory the function that lists the names in a directory,
+                     defaults to os.listdir.
+      stat_file the function that stats a file, defaults to os.stat.
+      include_entry a function that takes the full name of an entry and
+                    whether it is a directory, and returns False to leave
+                    the entry (and everything under it) out of the index,
+                    as if it didn't exist. None (the default) indexes the
+                    whole tree.
+    """
+    assign_injectables(self, locals())
+    self.directories = None
+    self.stats = {}
+
+  def scan(self):
+    """
+    Walk the tree, unless that has already been done. The other methods call
+    this themselves, but calling it explicitly controls when the IO happens.
+
+    Effects:
+      Lists every directory and stats every entry under root_directory.
+    """
+    if self.directories is not None:
+      return
+    self.directories = {}
+    to_scan = [self.root_directory]
+    while to_scan:
+      directory = to_scan.pop()
+      names = []
+      subdirectories = []
+      for name in self.list_directory(directory):
+        full_name = os.path.join(directory, name)
+        try:
+          stat_result = self.stat_file(full_name)
+        except OSError:
+          # A dangling symlink, or the file vanished mid-scan.
+          stat_result = None
+        is_directory = stat_result is not None \
+            and stat.S_ISDIR(stat_result.st_mode)
+        if self.include_entry is not None \
+            and not self.include_entry(full_name, is_directory):
+          continue
+        names.append(name)
+        self.stats[full_name] = stat_result
+        if is_directory:
+          subdirectories.append(full_name)
+      self.directories[directory] = names
+      # Reversed, so that directories are visited in listing order.
+      to_scan.extend(reversed(subdirectories))
+
+  def get_entry_count(self):
+    """ Returns the number of files and directories in the tree. """
+    self.scan()
+    return len(self.stats)
+
+  def get_directory_names(self):
+    """
+    Returns the full names of all the directories in the tree, starting with
+    root_directory and with every directory before its subdirectories.
+    """
+    self.scan()
+    names = []
+    to_visit = [self.root_directory]
+    while to_visit:
+      directory = to_visit.pop()
+      names.append(directory)
+      subdirectories = [os.path.join(directory, name) \
+          for name in self.directories[directory]]
+      to_visit.extend(reversed(filter(self.is_directory, subdirectories)))
+    return names
+
+  def list_directory_contents(self, path):
+    """
+    A drop-in replacement for os.listdir for directories in the tree.
+
+    Args:
+      path the full name of the directory.
+    """
+    self.scan()
+    if path not in self.directories:
+      return self.list_directory(path)
+    return list(self.directories[path])
+
+  def is_directory(self, path):
+    """
+    A drop-in replacement for os.path.isdir for entries in the tree.
+
+    Args:
+      path the full name of the entry.
+    """
+    self.scan()
+    if path not in self.stats:
+      return os.path.isdir(path)
+    stat_result = self.stats[path]
+    return stat_result is not None and stat.S_ISDIR(stat_result.st_mode)
+
+  def stat(self, path):
+    """
+    A drop-in replacement for os.stat for entries in the tree.
+
+    Args:
+      path the full name of the entry.
+
+    Raises:
+      OSError if the entry couldn't be stat'ed during the scan.
+    """
+    self.scan()
+    if path not in self.stats:
+      return self.stat_file(path)
+    stat_result = self.stats[path]
+    if stat_result is None:
+      raise OSError('Could not stat %s' % path)
+    return stat_result
+
+  def find_files(self, type_tester):
+    """
+    Finds the regular files in the tree that pass type_tester.
+
+    Args:
+      type_tester the function that determines whether a file name has the
+                  proper extension.
+
+    Returns:
+      A list of full file names, in the order they were listed.
+    """
+    file_names = []
+    for directory in self.get_directory_names():
+      for name in self.directories[directory]:
+        full_name = os.path.join(directory, name)
+        stat_result = self.stats[full_name]
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode) \
+            and type_tester(full_name):
+          file_names.append(full_name)
+    return file_names
@@ -0,0 +1,286 @@
+"""
+Module providing SearchIndexWriter, which writes an inverted index of the
+pictures' caption terms to the search directory of the output, for
+gallerySearch.js to query in the browser without a server.
+
+The index is split into small JSON files so that a search only downloads
+what it needs:
+
+  search/index.json     the sizes needed to find the other files.
+  search/terms-XX.json  the terms starting with the two characters XX,
+                        mapping each term to the ids of the pictures whose
+                        captions contain it, delta encoded.
+  search/docs-N.json    pictures N * documents_per_shard onwards, as
+                        [href, thumbnail_src, caption text] lists.
+"""
+import os
+import os.path
+import re
+import simplejson as json
+from ..utils.inject import assign_injectables
+from galleryitem import JpegDirectory, DirectorySummary
+from exporter import HtmlFileNameAndContents
+from templatewriter import create_template_writer
+
+SEARCH_DIRECTORY_NAME = 'search'
+INDEX_FORMAT_VERSION = 1
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+SAFE_CHARACTERS = 'abcdefghijklmnopqrstuvwxyz0123456789'
+# The shards of the index, and their compressed copies (see compressor).
+SHARD_FILE_RE = re.compile(r'^((?:terms-[^.]+|docs-\d+)\.json)(?:\.gz|\.br)?$')
+
+
+def to_text(value):
+  """
+  Turn a metadata value into unicode text. IPTC strings are usually UTF-8,
+  but older files use Latin-1. Lists of keywords are joined with spaces.
+  """
+  if value is None:
+    return u''
+  if isinstance(value, (list, tuple)):
+    return u' '.join(to_text(item) for item in value)
+  if isinstance(value, unicode):
+    return value
+  try:
+    return value.decode('utf-8')
+  except UnicodeDecodeError:
+    return value.decode('latin-1')
+
+
+def extract_terms(text, minimum_length=2):
+  """
+  Split text into lower case search terms. gallerySearch.js splits queries
+  the same way.
+
+  Args:
+    text the unicode text to split.
+    minimum_length the length of the shortest term to keep.
+
+  Returns:
+    A list of the distinct terms, in order of first appearance.
+  """
+  terms = []
+  seen = set()
+  for term in TERM_RE.findall(text.lower()):
+    if len(term) >= minimum_length and term not in seen:
+      seen.add(term)
+      terms.append(term)
+  return terms
+
+
+def shard_key(term, prefix_length):
+  """
+  The name of the terms file that a term goes in, built from its first
+  characters. Characters other than lower case ASCII letters and digits are
+  spelled out as _ and their hex code point, so the name is always safe.
+  """
+  return ''.join(character if character in SAFE_CHARACTERS \
+      else '_%x' % ord(character) for character in term[:prefix_length])
+
+
+def delta_encode(numbers):
+  """ Replace each number in an increasing list with its distance from the
+  one before it, which keeps the JSON short. """
+  previous = 0
+  deltas = []
+  for number in numbers:
+    deltas.append(number - previous)
+    previous = number
+  return deltas
+
+
+class SearchIndexBuilder(object):
+  """
+  Collects the caption terms of the pictures in a gallery.
+  """
+  def __init__(self, prefix_length=2, documents_per_shard=1000):
+    """
+    Constructor for SearchIndexBuilder.
+
+    Args:
+      prefix_length the number of leading characters of a term that decide
+                    which terms file it goes in, and so the length of the
+                    shortest term that can be searched for.
+      documents_per_shard the number of pictures in each docs file.
+    """
+    assign_injectables(self, locals())
+    self.documents = []
+    self.postings = {}
+    # Maps each directory added to the ids of its own pictures.
+    self.directory_documents = {}
+
+  def add_directory_tree(self, top_directory):
+    """
+    Add every picture under a directory, in the order they are shown.
+
+    Args:
+      top_directory the JpegDirectory at the top of the gallery.
+    """
+    to_visit = [top_directory]
+    while to_visit:
+      directory = to_visit.pop()
+      self.add_directory(directory)
+      to_visit.extend(reversed([entry for entry in directory.get_contents() \
+          if isinstance(entry, JpegDirectory)]))
+
+  def add_directory(self, directory):
+    """
+    Add the pictures directly inside a directory, leaving out the ones in
+    its subdirectories.
+
+    Args:
+      directory the JpegDirectory to add.
+    """
+    first_document_id = len(self.documents)
+    for entry in directory.get_contents():
+      if not isinstance(entry, (JpegDirectory, DirectorySummary)):
+        self.add_picture(entry)
+    self.directory_documents[directory.get_name()] = \
+        range(first_document_id, len(self.documents))
+
+  def add_picture(self, picture):
+    """
+    Add a single picture, using the same metadata as its caption.
+
+    Args:
+      picture the JpegPicture to add.
+    """
+    caption_fields = picture.get_caption_fields()
+    caption_text = u', '.join(to_text(value) \
+        for name, value in caption_fields if value)
+    view = picture.as_entry_view()
+    # The file name without its extension is searchable too, since it is
+    # often all a picture has to go on.
+    searchable_text = u' '.join([caption_text,
+      to_text(os.path.splitext(picture.get_name())[0])])
+    self.add_document([view['href'], view['thumbnail_src'], caption_text],
+        extract_terms(searchable_text, self.prefix_length))
+
+  def add_document(self, document, terms):
+    """
+    Add a picture that has already been turned into a document.
+
+    Args:
+      document the [href, thumbnail_src, caption text] list to show.
+      terms the terms the picture should be found by.
+    """
+    document_id = len(self.documents)
+    self.documents.append(document)
+    for term in terms:
+      self.postings.setdefault(term, []).append(document_id)
+
+  def get_subtree_documents(self, top_directory_name):
+    """
+    Take the pictures under a directory back out of the index, so they can
+    be added to another one (see sharding).
+
+    Args:
+      top_directory_name the full name of a directory that was added.
+
+    Returns:
+      A list of (document, terms) tuples, in the order they were added.
+    """
+    prefix = os.path.join(top_directory_name, '')
+    document_ids = []
+    for name, ids in self.directory_documents.iteritems():
+      if name == top_directory_name or name.startswith(prefix):
+        document_ids.extend(ids)
+    document_ids.sort()
+    terms = dict((document_id, []) for document_id in document_ids)
+    for term, term_document_ids in self.postings.iteritems():
+      for document_id in term_document_ids:
+        if document_id in terms:
+          terms[document_id].append(term)
+    return [(self.documents[document_id], sorted(terms[document_id])) \
+        for document_id in document_ids]
+
+  def iter_files(self):
+    """
+    Lay the index out in files.
+
+    Returns:
+      A generator of HtmlFileNameAndContents, named relative to the search
+      directory.
+    """
+    yield HtmlFileNameAndContents('index.json', self.dump({
+      'version': INDEX_FORMAT_VERSION,
+      'document_count': len(self.documents),
+      'documents_per_shard': self.documents_per_shard,
+      'prefix_length': self.prefix_length}))
+    shards = {}
+    for term, document_ids in self.postings.iteritems():
+      shards.setdefault(shard_key(term, self.prefix_length), {})[term] = \
+          delta_encode(document_ids)
+    for key in sorted(shards):
+      yield HtmlFileNameAndContents('terms-%s.json' % key,
+          self.dump(shards[key]))
+    for start in range(0, len(self.documents), self.documents_per_shard):
+      yield HtmlFileNameAndContents(
+          'docs-%d.json' % (start // self.documents_per_shard),
+          self.dump(self.documents[start:start + self.documents_per_shard]))
+
+  def dump(self, value):
+    return json.dumps(value, separators=(',', ':'), sort_keys=True)
+
+
+class SearchIndexWriter(object):
+  """
+  Builds the search index of a gallery and writes it to the output
+  directory. Unchanged files are not rewritten, see TemplateWriter.
+  """
+  def __init__(self, output_directory, prefix_length=2,
+      documents_per_shard=1000):
+    """
+    Constructor for SearchIndexWriter.
+
+    Args:
+      output_directory the directory the gallery is written to.
+      prefix_length see SearchIndexBuilder.
+      documents_per_shard see SearchIndexBuilder.
+    """
+    assign_injectables(self, locals())
+
+  def write(self, top_directory):
+    """
+    Write the search index.
+
+    Args:
+      top_directory the JpegDirectory at the top of the gallery.
+
+    Returns:
+      The number of pictures in the index.
+    """
+    builder = self.create_builder()
+    builder.add_directory_tree(top_directory)
+    return self.write_index(builder)
+
+  def create_builder(self):
+    """ Returns an empty SearchIndexBuilder, to add the pictures to. """
+    return SearchIndexBuilder(self.prefix_length, self.documents_per_shard)
+
+  def write_index(self, builder):
+    """
+    Write the index that a SearchIndexBuilder has collected, see write.
+
+    Effects:
+      Deletes the shards left by earlier builds that this one didn't write,
+      whose document ids would point at the wrong pictures.
+    """
+    search_directory = os.path.join(self.output_directory,
+        SEARCH_DIRECTORY_NAME)
+    template_writer = create_template_writer(search_directory)
+    written_file_names = set()
+    template_writer.write_templates(builder.iter_files(),
+        written_file_names.add)
+    self.remove_stale_shards(search_directory, written_file_names)
+    return len(builder.documents)
+
+  def remove_stale_shards(self, search_directory, written_file_names):
+    """
+    Helper for write_index, deletes the shards (and their compressed
+    copies) that aren't among written_file_names.
+    """
+    for file_name in os.listdir(search_directory):
+      match = SHARD_FILE_RE.match(file_name)
+      if match is not None and match.group(1) not in written_file_names:
+        os.remove(os.path.join(search_directory, file_name))
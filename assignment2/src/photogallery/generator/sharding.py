@@ -0,0 +1,192 @@
+"""
+Module providing Shard, which splits the building of a gallery across
+several machines. The input tree is partitioned by top-level directory:
+each directory right under the input directory goes to the shard picked by
+a hash of its name, so every machine makes the same choice without talking
+to the others. Each shard builds the pages of its directories and leaves a
+summary file in the output directory, and a final merge step builds the
+input directory's own page and pictures from the summaries.
+
+Summary files are JSON objects of the form
+
+  {"version": 1, "shard": 2, "shard_count": 4,
+   "directories": [{"name": "2010", "documents": [...]}, ...]}
+
+where the names are relative to the input directory, so the shards don't
+need to see it at the same path, and the documents are the
+[[href, thumbnail_src, caption text], terms] pairs the directory adds to
+the search index (see searchindex), if there is one.
+"""
+import os
+import os.path
+import hashlib
+import simplejson as json
+from ..utils.inject import assign_injectables
+
+SUMMARY_FORMAT_VERSION = 1
+SUMMARY_FILE_FORMAT = '.shard-%d-of-%d.json'
+
+
+def parse_shard(text):
+  """
+  Parse the argument of --shard.
+
+  Args:
+    text a string of the form "i/N", where 1 <= i <= N.
+
+  Returns:
+    The (i, N) tuple.
+
+  Raises:
+    ValueError if text is not of that form.
+  """
+  parts = text.split('/')
+  if len(parts) != 2 or not parts[0].isdigit() or not parts[1].isdigit():
+    raise ValueError('%s is not of the form i/N.' % text)
+  number, count = int(parts[0]), int(parts[1])
+  if not 1 <= number <= count:
+    raise ValueError('%s is not a shard between 1/%d and %d/%d.' % \
+        (text, count, count, count))
+  return (number, count)
+
+
+def shard_of(directory_name, shard_count):
+  """
+  Pick the shard a top-level directory belongs to.
+
+  Args:
+    directory_name the name of the directory, relative to the input
+                   directory.
+    shard_count the number of shards.
+
+  Returns:
+    A shard number from 1 to shard_count.
+  """
+  if isinstance(directory_name, unicode):
+    directory_name = directory_name.encode('utf-8')
+  digest = hashlib.md5(directory_name).hexdigest()
+  return int(digest, 16) % shard_count + 1
+
+
+def get_summary_file_name(output_directory, number, count):
+  """ Returns the full name of the summary file of a shard. """
+  return os.path.join(output_directory, SUMMARY_FILE_FORMAT % (number, count))
+
+
+def is_merge_entry(full_name, is_directory):
+  """
+  The include_entry function (see scanner.FileIndex) for the merge step,
+  which only handles the files in the input directory itself.
+  """
+  return not is_directory
+
+
+class Shard(object):
+  """
+  One of the parts a gallery is built in.
+  """
+  def __init__(self, input_directory, number, count):
+    """
+    Constructor for Shard.
+
+    Args:
+      input_directory the directory at the top of the gallery.
+      number the number of this shard, from 1 to count.
+      count the number of shards.
+    """
+    assign_injectables(self, locals())
+    # So that "./in" and "in/" match the names joined onto either of them.
+    self.input_directory = os.path.normpath(input_directory)
+
+  def is_top_level(self, full_name):
+    """ Returns True if an entry is directly in the input directory. """
+    return os.path.normpath(os.path.dirname(full_name)) == self.input_directory
+
+  def include_entry(self, full_name, is_directory):
+    """
+    The include_entry function (see scanner.FileIndex) for this shard. The
+    files in the input directory itself are left to the merge step.
+    """
+    if not self.is_top_level(full_name):
+      return True
+    return is_directory \
+        and shard_of(os.path.basename(full_name), self.count) == self.number
+
+  def is_shard_page(self, gallery_item):
+    """
+    Returns False for the input directory, whose pages are left to the
+    merge step, and True for the items this shard renders.
+    """
+    return os.path.normpath(gallery_item.get_name()) != self.input_directory
+
+  def write_summary(self, output_directory, directory_names,
+      search_index_builder=None):
+    """
+    Write this shard's summary file.
+
+    Args:
+      output_directory the directory the gallery is written to.
+      directory_names the full names of this shard's top-level directories.
+      search_index_builder the searchindex.SearchIndexBuilder that the
+                           shard's pictures were added to, or None.
+
+    Effects:
+      Replaces the summary file in output_directory.
+    """
+    directories = []
+    for directory_name in directory_names:
+      documents = []
+      if search_index_builder is not None:
+        documents = \
+            search_index_builder.get_subtree_documents(directory_name)
+      directories.append({'name': os.path.basename(directory_name),
+        'documents': documents})
+    summary = {'version': SUMMARY_FORMAT_VERSION, 'shard': self.number,
+        'shard_count': self.count, 'directories': directories}
+    if not os.path.isdir(output_directory):
+      os.makedirs(output_directory)
+    file_name = get_summary_file_name(output_directory, self.number,
+        self.count)
+    temporary_name = file_name + '.tmp'
+    with open(temporary_name, 'wb') as summary_file:
+      json.dump(summary, summary_file, sort_keys=True)
+    os.rename(temporary_name, file_name)
+
+
+def read_shard_summaries(output_directory, shard_count):
+  """
+  Read the summary files left by all the shards of a build.
+
+  Args:
+    output_directory the directory the shards wrote the gallery to.
+    shard_count the number of shards.
+
+  Returns:
+    A dict mapping the names of the top-level directories, relative to the
+    input directory, to the lists of (document, terms) tuples they add to
+    the search index.
+
+  Raises:
+    IOError if a summary is missing, ValueError if one is malformed, was
+    written for a different number of shards, or names a directory that
+    another shard also built.
+  """
+  directories = {}
+  for number in range(1, shard_count + 1):
+    file_name = get_summary_file_name(output_directory, number, shard_count)
+    with open(file_name, 'rb') as summary_file:
+      summary = json.load(summary_file)
+    if not isinstance(summary, dict) \
+        or summary.get('version') != SUMMARY_FORMAT_VERSION \
+        or summary.get('shard') != number \
+        or summary.get('shard_count') != shard_count:
+      raise ValueError('%s is not the summary of shard %d/%d.' % \
+          (file_name, number, shard_count))
+    for directory in summary['directories']:
+      # Back to a byte string, like the paths read from the input directory.
+      name = directory['name'].encode('utf-8')
+      if name in directories:
+        raise ValueError('%s was built by more than one shard.' % name)
+      directories[name] = [(document, terms) for document, terms in \
+          directory['documents']]
+  return directories
@@ -1,45 +1,138 @@
 from ..utils.inject import assign_injectables
+from ..utils.getters import with_getters_for
 import os
 import os.path
+import hashlib
+import cPickle as pickle
+
+# Remembers the hash of every page in the output directory, see
+# TemplateWriter.write_templates.
+HASHES_FILE_NAME = '.page-hashes'
 
 class TemplateWriter(object):
   """
   Class to write populated templates to the disk.
   """
-  def __init__(self, output_directory):
+  def __init__(self, output_directory, hashes_file_name=HASHES_FILE_NAME):
     """
     Constructor for TemplateWriter
 
     Args:
       output_directory the directory in which to place output files.
+      hashes_file_name the name of the file in output_directory that the
+                       hashes are recorded in. Builds that write to the same
+                       directory at the same time (see sharding) need one
+                       each.
     """
     assign_injectables(self, locals())
+    self.written_count = 0
+    self.skipped_count = 0
 
-  def write_templates(self, templates):
+  def write_templates(self, templates, on_written=None):
     """
-    Given a list of HtmlFileNameAndContents, create files for all of them
-    and write the populated templates into the files.
+    Given HtmlFileNameAndContents, create files for all of them
+    and write the populated templates into the files. Pages whose contents
+    are the same as the file already on disk are left alone, so their
+    modification times don't change and sync tools can skip them.
 
     Args:
-      templates the HtmlFileNameAndContents describing the files to be made.
+      templates a list or other iterable of the HtmlFileNameAndContents
+                describing the files to be made. Each file is written as soon
+                as the iterable produces it.
+      on_written a function to call with the name of each file once it is
+                 on disk (whether it was written or already current), or
+                 None.
 
     Effects:
-      Performs IO by writing multiple files to disk.
+      Performs IO by writing multiple files to disk, and records the hashes
+      of their contents in the output directory.
+    """
+    hashes_file_name = os.path.join(self.output_directory,
+        self.hashes_file_name)
+    hashes = self.load_hashes(hashes_file_name)
+    try:
+      for template in templates:
+        self.write_template(template, hashes)
+        if on_written is not None:
+          on_written(template.get_file_name())
+    finally:
+      self.save_hashes(hashes_file_name, hashes)
+
+  def write_template(self, template, hashes):
     """
-    for template in templates:
-      output_file = os.path.join(self.output_directory,
-          template.get_file_name())
-      with open(output_file, 'w') as template_out_file:
-        template_out_file.write(template.get_contents())
+    Write a single page, unless it is already current. The page is written
+    under a temporary name and renamed into place, so that a reader never
+    sees half of it.
+
+    Args:
+      template the HtmlFileNameAndContents to write.
+      hashes the dict mapping page file names to the hashes of their
+             contents, which is updated.
+    """
+    file_name = template.get_file_name()
+    output_file = os.path.join(self.output_directory, file_name)
+    contents = template.get_contents()
+    if isinstance(contents, unicode):
+      contents = contents.encode('utf-8')
+    content_hash = hashlib.sha1(contents).hexdigest()
+    if self.is_current(output_file, contents, hashes.get(file_name),
+        content_hash):
+      self.skipped_count += 1
+    else:
+      temporary_name = output_file + '.tmp'
+      with open(temporary_name, 'wb') as template_out_file:
+        template_out_file.write(contents)
+      os.rename(temporary_name, output_file)
+      self.written_count += 1
+    hashes[file_name] = content_hash
+
+  def is_current(self, output_file, contents, old_hash, content_hash):
+    """
+    Decide whether a page on disk already has the given contents. The
+    recorded hash is trusted if the file's size matches; pages that have no
+    recorded hash are compared byte by byte.
+
+    Args:
+      output_file the full name of the page.
+      contents the new contents of the page.
+      old_hash the hash recorded when the page was last written, or None.
+      content_hash the hash of contents.
+    """
+    try:
+      if os.stat(output_file).st_size != len(contents):
+        return False
+    except OSError:
+      return False
+    if old_hash is not None:
+      return old_hash == content_hash
+    with open(output_file, 'rb') as existing_file:
+      return existing_file.read() == contents
+
+  def load_hashes(self, hashes_file_name):
+    """ Read the page hashes saved by the previous run, if any. """
+    try:
+      with open(hashes_file_name, 'rb') as hashes_file:
+        return pickle.load(hashes_file)
+    except (IOError, EOFError, pickle.UnpicklingError):
+      return {}
+
+  def save_hashes(self, hashes_file_name, hashes):
+    """ Save the page hashes for the next run. """
+    temporary_name = hashes_file_name + '.tmp'
+    with open(temporary_name, 'wb') as hashes_file:
+      pickle.dump(hashes, hashes_file, pickle.HIGHEST_PROTOCOL)
+    os.rename(temporary_name, hashes_file_name)
+with_getters_for(TemplateWriter, 'written_count', 'skipped_count')
 
-def create_template_writer(directory_name):
+def create_template_writer(directory_name, hashes_file_name=HASHES_FILE_NAME):
   """
   Factory function for TemplateWriter, ensures that the
   directory exists, and creates it if necessary.
 
   Args:
       directory_name the name of the directory to place output files.
+      hashes_file_name see TemplateWriter.
   """
   if not os.path.isdir(directory_name):
     os.makedirs(directory_name)
-  return TemplateWriter(directory_name)
+  return TemplateWriter(directory_name, hashes_file_name)
@@ -0,0 +1,242 @@
+"""
+Module providing Thumbnailer, which makes small copies of the JPEGs for the
+directory pages (thumbnails) and medium sized copies for the detail pages
+(web variants), so that browsers don't have to download the originals.
+
+Variants are named after a hash of the original's contents, so identical
+pictures share them and unchanged pictures are never resized twice. This
+needs the Python Imaging Library (Pillow); see is_available.
+"""
+import os
+import os.path
+import struct
+import hashlib
+import itertools
+import cPickle as pickle
+from ..utils.inject import assign_injectables
+from ..utils.immutabledict import ImmutableDict
+from progress import NullProgressReporter, THUMBNAILS
+from quarantine import describe_exception
+
+try:
+  from PIL import Image
+except ImportError:
+  Image = None
+
+# What Pillow raises for files it can open but not decode, such as
+# truncated or malformed JPEGs.
+DECODE_ERRORS = (SyntaxError, ValueError, TypeError, IndexError, struct.error)
+if Image is not None:
+  DECODE_ERRORS += (Image.DecompressionBombError,)
+
+VARIANTS_DIRECTORY_NAME = 'variants'
+HASHES_FILE_NAME = '.hashes'
+# (view key, file name suffix, bounding box) for every variant.
+VARIANT_SIZES = (('thumbnail_src', 'thumbnail', (200, 200)),
+    ('web_src', 'web', (1024, 1024)))
+JPEG_QUALITY = 85
+# The number of JPEGs sent to a worker process at a time.
+CHUNK_SIZE = 8
+
+
+def is_available():
+  """ Returns True if the imaging library needed for resizing is installed. """
+  return Image is not None
+
+
+def hash_file_contents(file_name):
+  """
+  Hash the contents of a file, reading it in blocks.
+
+  Args:
+    file_name the name of the file.
+
+  Returns:
+    The hex SHA-1 digest of the contents.
+  """
+  digest = hashlib.sha1()
+  with open(file_name, 'rb') as input_file:
+    while True:
+      block = input_file.read(1 << 16)
+      if not block:
+        break
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def variant_file_name(content_hash, suffix):
+  """
+  The name of a variant, relative to the output directory.
+
+  Args:
+    content_hash the hash of the original's contents.
+    suffix the name of the variant, from VARIANT_SIZES.
+  """
+  return '%s/%s-%s.jpg' % (VARIANTS_DIRECTORY_NAME, content_hash, suffix)
+
+
+def generate_variants(arguments):
+  """
+  Hashes a JPEG and writes any of its variants that don't exist yet. This is
+  a module level function so that it can be sent to the worker processes of
+  a multiprocessing.Pool.
+
+  Args:
+    arguments a tuple of (full_jpeg_name, content_hash, output_directory).
+              content_hash is None if the file has to be hashed first.
+
+  Returns:
+    A tuple of (full_jpeg_name, content_hash, exception), where content_hash
+    is None if the file could not be read as an image, and exception is the
+    one of DECODE_ERRORS that decoding it raised, if any.
+  """
+  full_jpeg_name, content_hash, output_directory = arguments
+  try:
+    if content_hash is None:
+      content_hash = hash_file_contents(full_jpeg_name)
+    for view_key, suffix, size in VARIANT_SIZES:
+      output_file_name = os.path.join(output_directory,
+          variant_file_name(content_hash, suffix))
+      if not os.path.isfile(output_file_name):
+        write_variant(full_jpeg_name, output_file_name, size)
+  except IOError:
+    return (full_jpeg_name, None, None)
+  except DECODE_ERRORS as decode_error:
+    return (full_jpeg_name, None, decode_error)
+  return (full_jpeg_name, content_hash, None)
+
+
+def write_variant(full_jpeg_name, output_file_name, size):
+  """
+  Write a shrunk copy of a JPEG. The JPEG decoder's draft mode is used so
+  that the image is decoded at the smallest scale that is still larger than
+  size, which is much faster than decoding it at full size.
+
+  Args:
+    full_jpeg_name the name of the original JPEG.
+    output_file_name the name of the file to write.
+    size the (width, height) box that the copy has to fit in.
+  """
+  image = Image.open(full_jpeg_name)
+  image.draft('RGB', size)
+  image = image.convert('RGB')
+  image.thumbnail(size, Image.ANTIALIAS)
+  # Write under a temporary name so that an interrupted run never leaves a
+  # truncated variant behind.
+  temporary_name = output_file_name + '.tmp'
+  image.save(temporary_name, 'JPEG', quality=JPEG_QUALITY)
+  os.rename(temporary_name, output_file_name)
+
+
+class Thumbnailer(object):
+  """
+  Generates the variants of a run's JPEGs and remembers where they are,
+  so that JpegPictures can link to them.
+  """
+  def __init__(self, output_directory, process_pool=None, stat_file=os.stat,
+      progress_reporter=None, quarantine=None):
+    """
+    Constructor for Thumbnailer.
+
+    Args:
+      output_directory the directory the gallery is written to. Variants go
+                       in a subdirectory of it.
+      process_pool the multiprocessing.Pool to resize pictures with, or None
+                   to resize them in this process.
+      stat_file the function used to stat the JPEGs, defaults to os.stat.
+      progress_reporter the progress.ProgressReporter that counts the JPEGs
+                        as they are done, or None to not report progress.
+      quarantine the quarantine.Quarantine to put the JPEGs that can't be
+                 decoded in, so they are left out of the gallery like the
+                 ones whose metadata can't be read. If it is None, they are
+                 only left without variants.
+    """
+    assign_injectables(self, locals())
+    if self.progress_reporter is None:
+      self.progress_reporter = NullProgressReporter()
+    self.variants = {}
+
+  def generate(self, file_names):
+    """
+    Make sure that every JPEG has its variants. Content hashes are
+    remembered between runs, keyed by path, modification time and size, so
+    unchanged files are not even read again.
+
+    Args:
+      file_names the full names of the JPEGs.
+
+    Effects:
+      Writes variants and the hashes file to the variants directory.
+    """
+    variants_directory = os.path.join(self.output_directory,
+        VARIANTS_DIRECTORY_NAME)
+    if not os.path.isdir(variants_directory):
+      os.makedirs(variants_directory)
+    hashes_file_name = os.path.join(variants_directory, HASHES_FILE_NAME)
+    old_hashes = self.load_hashes(hashes_file_name)
+    stamps = {}
+    arguments = []
+    for file_name in file_names:
+      stat_result = self.stat_file(file_name)
+      stamps[file_name] = (stat_result.st_mtime, stat_result.st_size)
+      content_hash = None
+      if file_name in old_hashes and old_hashes[file_name][0] == \
+          stamps[file_name]:
+        content_hash = old_hashes[file_name][1]
+      arguments.append((file_name, content_hash, self.output_directory))
+    if self.process_pool is None:
+      results = itertools.imap(generate_variants, arguments)
+    else:
+      results = self.process_pool.imap(generate_variants, arguments,
+          CHUNK_SIZE)
+    new_hashes = {}
+    for file_name, content_hash, decode_error in results:
+      self.progress_reporter.count(THUMBNAILS)
+      if decode_error is not None:
+        self.handle_decode_error(file_name, decode_error)
+      if content_hash is None:
+        continue
+      new_hashes[file_name] = (stamps[file_name], content_hash)
+      self.variants[file_name] = ImmutableDict((view_key,
+        variant_file_name(content_hash, suffix)) \
+            for view_key, suffix, size in VARIANT_SIZES)
+    self.save_hashes(hashes_file_name, new_hashes)
+
+  def handle_decode_error(self, full_jpeg_name, decode_error):
+    """
+    Put a JPEG that the imaging library couldn't decode in the quarantine,
+    or just report it if there is no quarantine.
+    """
+    if self.quarantine is not None:
+      self.quarantine.add(full_jpeg_name, decode_error)
+    else:
+      print "I was unable to make a thumbnail of %s (%s)." % (full_jpeg_name,
+          describe_exception(decode_error))
+      print "The original will be shown instead."
+
+  def load_hashes(self, hashes_file_name):
+    """ Read the content hashes saved by the previous run, if any. """
+    try:
+      with open(hashes_file_name, 'rb') as hashes_file:
+        return pickle.load(hashes_file)
+    except (IOError, EOFError, pickle.UnpicklingError):
+      return {}
+
+  def save_hashes(self, hashes_file_name, hashes):
+    """ Save the content hashes for the next run. """
+    with open(hashes_file_name, 'wb') as hashes_file:
+      pickle.dump(hashes, hashes_file, pickle.HIGHEST_PROTOCOL)
+
+  def get_variants(self, full_jpeg_name):
+    """
+    Find the variants of a JPEG.
+
+    Args:
+      full_jpeg_name the full name of the original JPEG.
+
+    Returns:
+      An ImmutableDict mapping 'thumbnail_src' and 'web_src' to the variants'
+      names relative to the output directory, or None if the JPEG has no
+      variants.
+    """
+    return self.variants.get(full_jpeg_name)
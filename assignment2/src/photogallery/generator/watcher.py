@@ -0,0 +1,261 @@
+"""
+Module providing watch mode, which rebuilds the gallery whenever the input
+tree or the manifest changes. Changes are picked up with inotify if
+pyinotify is installed, and by rescanning the tree every few seconds
+otherwise. Rebuilds are incremental, so only the pages and files affected by
+a change are rendered and copied again.
+"""
+import os
+import os.path
+import time
+import traceback
+from ..utils.inject import assign_injectables
+from scanner import FileIndex
+import gallerygenerator
+
+try:
+  import pyinotify
+except ImportError:
+  pyinotify = None
+
+POLL_INTERVAL_SECONDS = 2.0
+DEBOUNCE_SECONDS = 1.0
+
+
+def is_inotify_available():
+  """ Returns True if changes can be picked up with inotify. """
+  return pyinotify is not None
+
+
+def is_relevant_change(path, input_directory, manifest_file, output_directory):
+  """
+  Decide whether a changed path should trigger a rebuild: it has to be in
+  the input tree or be the manifest, and not be one of our own outputs.
+
+  Args:
+    path the full name of the changed file or directory.
+    input_directory the root of the input tree.
+    manifest_file the name of the manifest.
+    output_directory the directory the gallery is written to.
+  """
+  path = os.path.abspath(path)
+  if is_inside(path, os.path.abspath(output_directory)):
+    return False
+  return path == os.path.abspath(manifest_file) \
+      or is_inside(path, os.path.abspath(input_directory))
+
+
+def is_inside(path, directory):
+  """ Returns True if path is directory or something under it. """
+  return path == directory or path.startswith(directory + os.sep)
+
+
+class PollingChangeSource(object):
+  """
+  Finds changes by comparing the modification times and sizes of every file
+  in the input tree, and the manifest, with the last time it looked.
+  """
+  def __init__(self, input_directory, manifest_file,
+      poll_interval_seconds=POLL_INTERVAL_SECONDS, sleep=time.sleep):
+    """
+    Constructor for PollingChangeSource.
+
+    Args:
+      input_directory the root of the input tree.
+      manifest_file the name of the manifest.
+      poll_interval_seconds how long to wait between looks when nothing
+                            has changed.
+      sleep the function used to wait, defaults to time.sleep.
+    """
+    assign_injectables(self, locals())
+    self.snapshot = self.take_snapshot()
+
+  def take_snapshot(self):
+    """
+    Returns a dict mapping every path in the tree, and the manifest, to its
+    (modification time, size).
+    """
+    file_index = FileIndex(self.input_directory)
+    snapshot = {}
+    for directory in file_index.get_directory_names():
+      for name in file_index.list_directory_contents(directory):
+        full_name = os.path.join(directory, name)
+        try:
+          stat_result = file_index.stat(full_name)
+        except OSError:
+          continue
+        snapshot[full_name] = (stat_result.st_mtime, stat_result.st_size)
+    try:
+      stat_result = os.stat(self.manifest_file)
+      snapshot[self.manifest_file] = (stat_result.st_mtime,
+          stat_result.st_size)
+    except OSError:
+      pass
+    return snapshot
+
+  def poll(self, timeout_seconds):
+    """
+    Wait, then report what changed.
+
+    Args:
+      timeout_seconds how long to wait, or None to wait for the poll
+                      interval.
+
+    Returns:
+      The set of paths that were added, removed or modified.
+    """
+    if timeout_seconds is None:
+      timeout_seconds = self.poll_interval_seconds
+    self.sleep(timeout_seconds)
+    snapshot = self.take_snapshot()
+    changes = set(path for path in set(snapshot) | set(self.snapshot) \
+        if snapshot.get(path) != self.snapshot.get(path))
+    self.snapshot = snapshot
+    return changes
+
+
+class InotifyChangeSource(object):
+  """
+  Finds changes with inotify, watching every directory of the input tree
+  (including ones created later) and the directory holding the manifest.
+  """
+  def __init__(self, input_directory, manifest_file):
+    """
+    Constructor for InotifyChangeSource.
+
+    Args:
+      input_directory the root of the input tree.
+      manifest_file the name of the manifest.
+    """
+    assign_injectables(self, locals())
+    self.changes = set()
+    self.watch_manager = pyinotify.WatchManager()
+    self.notifier = pyinotify.Notifier(self.watch_manager,
+        default_proc_fun=self.record_event)
+    mask = pyinotify.IN_CREATE | pyinotify.IN_DELETE | \
+        pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_FROM | \
+        pyinotify.IN_MOVED_TO | pyinotify.IN_ATTRIB
+    self.watch_manager.add_watch(input_directory, mask, rec=True,
+        auto_add=True)
+    # Editors often save by renaming a new file over the old one, which
+    # only shows up as an event on the directory.
+    self.watch_manager.add_watch(
+        os.path.dirname(os.path.abspath(manifest_file)), mask)
+
+  def record_event(self, event):
+    self.changes.add(event.pathname)
+
+  def poll(self, timeout_seconds):
+    """
+    Wait for events, then report what changed.
+
+    Args:
+      timeout_seconds how long to wait, or None to wait until something
+                      happens.
+
+    Returns:
+      The set of paths that events were reported for.
+    """
+    timeout = None
+    if timeout_seconds is not None:
+      timeout = int(timeout_seconds * 1000)
+    if self.notifier.check_events(timeout):
+      self.notifier.read_events()
+      self.notifier.process_events()
+    changes = self.changes
+    self.changes = set()
+    return changes
+
+
+class GalleryWatcher(object):
+  """
+  Rebuilds the gallery every time a burst of relevant changes dies down.
+  """
+  def __init__(self, change_source, is_relevant, rebuild,
+      debounce_seconds=DEBOUNCE_SECONDS):
+    """
+    Constructor for GalleryWatcher.
+
+    Args:
+      change_source the PollingChangeSource or InotifyChangeSource to get
+                    changes from.
+      is_relevant a function that takes a changed path and returns True if
+                  it should trigger a rebuild.
+      rebuild the function that rebuilds the gallery.
+      debounce_seconds how long things have to stay quiet after a change
+                       before rebuilding.
+    """
+    assign_injectables(self, locals())
+
+  def wait_for_changes(self):
+    """
+    Block until there are relevant changes, and then until no more have
+    arrived for debounce_seconds.
+
+    Returns:
+      The set of changed paths.
+    """
+    changes = set()
+    while not changes:
+      changes = set(filter(self.is_relevant, self.change_source.poll(None)))
+    while True:
+      more_changes = set(filter(self.is_relevant,
+        self.change_source.poll(self.debounce_seconds)))
+      if not more_changes:
+        return changes
+      changes |= more_changes
+
+  def watch(self, rebuild_count=None):
+    """
+    Rebuild after every burst of changes. A rebuild that fails is reported
+    and the watch goes on, so a half-copied file doesn't end it.
+
+    Args:
+      rebuild_count how many rebuilds to do before returning, or None to
+                    keep going until interrupted.
+    """
+    while rebuild_count is None or rebuild_count > 0:
+      changes = self.wait_for_changes()
+      print '%d files changed, rebuilding...' % len(changes)
+      try:
+        self.rebuild()
+      except Exception:
+        traceback.print_exc()
+        print 'The rebuild failed, waiting for more changes.'
+      if rebuild_count is not None:
+        rebuild_count -= 1
+
+
+def watch_and_rebuild(command_line_arguments, css_directory):
+  """
+  Build the gallery, then keep rebuilding it as the input changes, until
+  interrupted. Every build is incremental and doesn't prompt for titles.
+
+  Args:
+    command_line_arguments the command line arguments with the program
+                           name removed.
+    css_directory the directory containing the CSS files.
+  """
+  input_data = gallerygenerator.parse_command_line_arguments(
+      command_line_arguments)
+  arguments = list(command_line_arguments) + ['--incremental', '--no-prompt']
+  def rebuild():
+    gallerygenerator.create_gallery_generator(arguments, css_directory).run()
+  rebuild()
+  if is_inotify_available():
+    change_source = InotifyChangeSource(input_data['input_directory'],
+        input_data['manifest_file'])
+  else:
+    print 'pyinotify is not installed, so the input will be checked ' + \
+        'for changes every %g seconds.' % POLL_INTERVAL_SECONDS
+    change_source = PollingChangeSource(input_data['input_directory'],
+        input_data['manifest_file'])
+  def is_relevant(path):
+    return is_relevant_change(path, input_data['input_directory'],
+        input_data['manifest_file'], input_data['output_directory'])
+  print 'Watching %s for changes, press Ctrl-C to stop.' % \
+      input_data['input_directory']
+  try:
+    GalleryWatcher(change_source, is_relevant, rebuild).watch()
+  except KeyboardInterrupt:
+    print 'Stopped watching.'
@@ -0,0 +1,150 @@
+import unittest
+from ..generator.buildcache import BuildCache
+from ..generator.galleryitem import JpegDirectory, JpegPicture, \
+    DirectorySummary
+from ..generator.galleryitemfactory import EXTRACTED, NO_IPTC_DATA, \
+    UNREADABLE, ExtractedIptcInfo
+
+class StubStatResult(object):
+  def __init__(self, st_mtime, st_size):
+    self.st_mtime = st_mtime
+    self.st_size = st_size
+
+class StubFileSystem(object):
+  def __init__(self):
+    self.stamps = {}
+    self.existing_files = set()
+
+  def stat(self, name):
+    if name not in self.stamps:
+      raise OSError(name)
+    return StubStatResult(*self.stamps[name])
+
+  def exists(self, name):
+    return name in self.existing_files
+
+def create_cache(file_system, pictures=None, pages=None):
+  return BuildCache('/not/real/cache', 'manifest-hash', pictures or {},
+      pages or {}, stat_file=file_system.stat, file_exists=file_system.exists)
+
+class BuildCacheMetadataTest(unittest.TestCase):
+  def setUp(self):
+    self.file_system = StubFileSystem()
+    self.file_system.stamps['/pics/a.jpg'] = (100, 2000)
+    self.file_system.stamps['/pics/b.jpg'] = (100, 3000)
+
+  def test_it_should_miss_files_it_has_never_seen(self):
+    cache = create_cache(self.file_system)
+    self.assertEquals(None, cache.lookup('/pics/a.jpg'))
+
+  def test_it_should_remember_extracted_metadata(self):
+    first_run = create_cache(self.file_system)
+    first_run.store('/pics/a.jpg',
+        (EXTRACTED, ExtractedIptcInfo({80: 'Daniel Jackson'})))
+    second_run = create_cache(self.file_system, first_run.new_pictures)
+    status, iptc_info = second_run.lookup('/pics/a.jpg')
+    self.assertEquals(EXTRACTED, status)
+    self.assertEquals('Daniel Jackson', iptc_info.get_data()[80])
+
+  def test_it_should_remember_files_without_iptc_data(self):
+    first_run = create_cache(self.file_system)
+    first_run.store('/pics/b.jpg', (NO_IPTC_DATA, None))
+    second_run = create_cache(self.file_system, first_run.new_pictures)
+    self.assertEquals((NO_IPTC_DATA, None), second_run.lookup('/pics/b.jpg'))
+
+  def test_it_should_not_remember_unreadable_files(self):
+    cache = create_cache(self.file_system)
+    cache.store('/pics/a.jpg', (UNREADABLE, None))
+    self.assertTrue('/pics/a.jpg' not in cache.new_pictures)
+
+  def test_it_should_miss_files_that_changed(self):
+    first_run = create_cache(self.file_system)
+    first_run.store('/pics/a.jpg',
+        (EXTRACTED, ExtractedIptcInfo({80: 'Daniel Jackson'})))
+    self.file_system.stamps['/pics/a.jpg'] = (200, 2000)
+    second_run = create_cache(self.file_system, first_run.new_pictures)
+    self.assertEquals(None, second_run.lookup('/pics/a.jpg'))
+
+class BuildCachePageFilterTest(unittest.TestCase):
+  def setUp(self):
+    self.file_system = StubFileSystem()
+    self.file_system.stamps['/top/a.jpg'] = (100, 2000)
+    self.file_system.stamps['/top/sub/b.jpg'] = (100, 3000)
+    self.file_system.stamps['/top/other/c.jpg'] = (100, 4000)
+    self.file_system.existing_files.update(['/out/top.html',
+      '/out/top-sub.html', '/out/top-other.html', '/out/a.html',
+      '/out/b.html', '/out/c.html'])
+
+  def create_tree(self):
+    def picture(name, back_href):
+      return JpegPicture(name, back_href, None, {})
+    sub = JpegDirectory('/top/sub', [picture('b.jpg', 'top-sub.html')],
+        False, back_href='top.html')
+    other = JpegDirectory('/top/other', [picture('c.jpg', 'top-other.html')],
+        False, back_href='top.html')
+    return JpegDirectory('/top', [picture('a.jpg', 'top.html'), sub, other],
+        False)
+
+  def rendered_pages(self, cache):
+    page_filter = cache.create_page_filter(self.create_tree(), '/out')
+    names = ['top.html', 'top-sub.html', 'top-other.html', 'a.html',
+        'b.html', 'c.html']
+    def stub_item(name):
+      return JpegDirectory(name.replace('.html', ''), [], False)
+    return sorted(name for name in names if page_filter(stub_item(name)))
+
+  def run_twice(self, change_between_runs):
+    first_run = create_cache(self.file_system)
+    self.rendered_pages(first_run)
+    change_between_runs()
+    second_run = create_cache(self.file_system, pages=first_run.new_pages)
+    return self.rendered_pages(second_run)
+
+  def test_it_should_render_everything_the_first_time(self):
+    self.assertEquals(6, len(self.rendered_pages(
+        create_cache(self.file_system))))
+
+  def test_it_should_render_nothing_if_nothing_changed(self):
+    self.assertEquals([], self.run_twice(lambda: None))
+
+  def test_it_should_render_a_changed_picture_and_its_ancestors(self):
+    def touch_b():
+      self.file_system.stamps['/top/sub/b.jpg'] = (200, 3000)
+    self.assertEquals(['b.html', 'top-sub.html', 'top.html'],
+        self.run_twice(touch_b))
+
+  def test_it_should_render_missing_pages(self):
+    def delete_c():
+      self.file_system.existing_files.remove('/out/c.html')
+    self.assertEquals(['c.html'], self.run_twice(delete_c))
+
+  def rendered_pages_one_directory_at_a_time(self, cache):
+    def picture(name, back_href):
+      return JpegPicture(name, back_href, None, {})
+    directories = [JpegDirectory('/top', [picture('a.jpg', 'top.html'),
+      DirectorySummary('/top/sub', 'top.html'),
+      DirectorySummary('/top/other', 'top.html')], False),
+      JpegDirectory('/top/sub', [picture('b.jpg', 'top-sub.html')],
+        False, back_href='top.html'),
+      JpegDirectory('/top/other', [picture('c.jpg', 'top-other.html')],
+        False, back_href='top.html')]
+    page_filter = cache.create_fingerprint_filter('/out')
+    rendered = []
+    for directory in directories:
+      cache.add_directory(directory)
+      rendered.extend(entry.get_output_file_name() for entry in
+          [directory] + directory.get_contents() if page_filter(entry) \
+              and not isinstance(entry, DirectorySummary))
+    return sorted(rendered)
+
+  def test_it_should_only_render_the_changed_directory_when_streaming(self):
+    first_run = create_cache(self.file_system)
+    self.rendered_pages_one_directory_at_a_time(first_run)
+    self.file_system.stamps['/top/sub/b.jpg'] = (200, 3000)
+    second_run = create_cache(self.file_system, pages=first_run.new_pages)
+    # The top page only shows an entry for sub, which hasn't changed.
+    self.assertEquals(['b.html', 'top-sub.html'],
+        self.rendered_pages_one_directory_at_a_time(second_run))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from ..generator.directorytitles import DirectoryTitles
+
+class StubInput(object):
+  def __init__(self, answers):
+    self.answers = list(answers)
+    self.prompts = []
+
+  def __call__(self, prompt):
+    self.prompts.append(prompt)
+    return self.answers.pop(0)
+
+class DirectoryTitlesTest(unittest.TestCase):
+  def setUp(self):
+    self.read_input = StubInput(['  Summer at the beach ', ''])
+    self.titles = DirectoryTitles('/photos',
+        {u'.': u'All my photos', u'2010': u'The year 2010'},
+        should_prompt=True, read_input=self.read_input)
+
+  def test_it_should_key_titles_by_relative_path(self):
+    self.assertEquals(u'.', self.titles.get_key('/photos'))
+    self.assertEquals(u'2010/beach', self.titles.get_key('/photos/2010/beach'))
+    self.assertEquals(u'The year 2010', self.titles.get_title('/photos/2010'))
+    self.assertEquals(None, self.titles.get_title('/photos/2011'))
+
+  def test_it_should_only_ask_for_missing_titles(self):
+    asked = self.titles.resolve_titles(['/photos', '/photos/2010',
+      '/photos/2010/beach', '/photos/2011_ski_trip'])
+    self.assertEquals(2, asked)
+    self.assertEquals(2, len(self.read_input.prompts))
+    self.assertTrue('/photos/2010/beach' in self.read_input.prompts[0])
+    self.assertEquals(u'Summer at the beach',
+        self.titles.get_title('/photos/2010/beach'))
+
+  def test_it_should_keep_the_inferred_title_on_an_empty_answer(self):
+    self.read_input.answers = ['']
+    self.titles.resolve_titles(['/photos/2011_ski_trip'])
+    self.assertEquals(u'Photos 2011 ski trip',
+        self.titles.get_title('/photos/2011_ski_trip'))
+    self.assertEquals(0, self.titles.resolve_titles(['/photos/2011_ski_trip']))
+
+  def test_it_should_not_ask_if_prompting_is_off(self):
+    self.titles.should_prompt = False
+    self.assertEquals(0, self.titles.resolve_titles(['/photos/2011']))
+    self.assertEquals([], self.read_input.prompts)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from ..utils.inject import assign_injectables
 from ..utils.immutabledict import ImmutableDict
 from ..generator.exporter import Exporter
+from ..generator.galleryitem import GalleryItem, JpegDirectory
 
 directory_values = ['title', 'images']
 picture_values = ['alt_text', 'src', 'caption_data']
@@ -14,7 +15,7 @@ class MockJinja2Template(object):
     for argument in template_arguments:
       assert (argument in self.required_values)
 
-class StubJpegPicture(object):
+class StubJpegPicture(GalleryItem):
   def __init__(self, alt_text, src, caption_data):
     assign_injectables(self, locals())
 
@@ -34,7 +35,7 @@ class StubJpegPicture(object):
   def get_output_file_name(self):
     return self.src
 
-class StubJpegDirectory(object):
+class StubJpegDirectory(GalleryItem):
   def __init__(self, title, images):
     assign_injectables(self, locals())
 
@@ -74,5 +75,65 @@ class DirectoryExporterTest(unittest.TestCase):
   def test_it_should_populate_the_jinja2_template(self):
     self.exporter.export(self.stub_directory)
 
+class CountingJinja2Template(object):
+  def __init__(self):
+    self.render_count = 0
+
+  def render(self, template_arguments):
+    self.render_count += 1
+    return 'page %d' % self.render_count
+
+class CountingStubJpegDirectory(StubJpegDirectory):
+  def __init__(self, title, images, template):
+    StubJpegDirectory.__init__(self, title, images)
+    self.template = template
+
+  def get_exporter(self):
+    return Exporter(self.template)
+
+class StreamingExporterTest(unittest.TestCase):
+  def setUp(self):
+    self.template = CountingJinja2Template()
+    self.inner_directory = CountingStubJpegDirectory('Inner', [],
+        self.template)
+    self.outer_directory = CountingStubJpegDirectory('Outer',
+        [self.inner_directory], self.template)
+    self.exporter = Exporter(self.template)
+
+  def test_it_should_render_pages_only_when_they_are_asked_for(self):
+    pages = self.exporter.iter_export(self.outer_directory)
+    self.assertEquals(0, self.template.render_count)
+    first_page = pages.next()
+    self.assertEquals('Outer', first_page.get_file_name())
+    self.assertEquals(1, self.template.render_count)
+
+  def test_it_should_produce_the_same_pages_as_export(self):
+    streamed = [(page.get_file_name(), page.get_contents()) for page in
+        self.exporter.iter_export(self.outer_directory)]
+    self.template.render_count = 0
+    exported = [(page.get_file_name(), page.get_contents()) for page in
+        self.exporter.export(self.outer_directory)]
+    self.assertEquals(exported, streamed)
+
+  def test_it_should_skip_pages_rejected_by_the_page_filter(self):
+    page_filter = lambda item: item.get_name() != 'Outer'
+    pages = self.exporter.export(self.outer_directory, page_filter)
+    self.assertEquals(['Inner'], [page.get_file_name() for page in pages])
+
+class PaginatedExporterTest(unittest.TestCase):
+  def setUp(self):
+    self.template = CountingJinja2Template()
+    pictures = [StubJpegPicture('picture %d' % index, 'picture%d.jpg' % index,
+        'Caption') for index in range(5)]
+    self.directory = JpegDirectory('pictures', pictures, should_prompt=False,
+        page_size=2)
+    self.exporter = Exporter(self.template)
+
+  def test_it_should_render_a_page_per_page_size_items(self):
+    pages = self.exporter.export(self.directory,
+        page_filter=lambda item: item is self.directory)
+    self.assertEquals(['pictures.html', 'pictures.page-2.html',
+      'pictures.page-3.html'], [page.get_file_name() for page in pages])
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from ..generator.gallerygenerator import GalleryGenerator, \
+    is_published_text_file
+from ..generator.profiler import NullProfiler
+from ..generator.progress import NullProgressReporter
+
+class FailingFileIndex(object):
+  """ A file index whose scan fails, so the build stops right away. """
+  def scan(self):
+    raise OSError('The input directory is gone')
+
+class RecordingProgressReporter(NullProgressReporter):
+  def __init__(self):
+    self.finished_with = []
+
+  def finish(self, succeeded=True):
+    self.finished_with.append(succeeded)
+
+class RecordingProfiler(NullProfiler):
+  def __init__(self):
+    self.finished_with = []
+
+  def finish(self, succeeded=True):
+    self.finished_with.append(succeeded)
+
+class IsPublishedTextFileTest(unittest.TestCase):
+  def published(self, relative_name):
+    return is_published_text_file('/out', '/out/' + relative_name)
+
+  def test_it_should_publish_pages_styles_and_scripts(self):
+    for name in ['index.html', 'trip.html', 'style.css', 'search.js']:
+      self.assertTrue(self.published(name))
+
+  def test_only_the_search_index_json_should_be_published(self):
+    self.assertTrue(self.published('search/index.json'))
+    self.assertTrue(self.published('search/terms-ab.json'))
+    self.assertFalse(self.published('build-profile.json'))
+    self.assertFalse(self.published('titles.json'))
+
+  def test_dotfiles_should_not_be_published(self):
+    for name in ['.quarantine.json', '.directory-titles.json',
+        '.shard-1-of-2.json', '.hidden/page.html']:
+      self.assertFalse(self.published(name))
+
+class GalleryGeneratorRunTest(unittest.TestCase):
+  def setUp(self):
+    self.reporter = RecordingProgressReporter()
+    self.profiler = RecordingProfiler()
+    self.generator = GalleryGenerator(None, '/in', '/out', '/static', None,
+        None, input_index=FailingFileIndex(),
+        static_files_index=FailingFileIndex(), profiler=self.profiler,
+        progress_reporter=self.reporter)
+
+  def test_a_failed_build_should_still_finish_the_progress_report(self):
+    self.assertRaises(OSError, self.generator.run)
+    self.assertEquals([False], self.reporter.finished_with)
+
+  def test_a_failed_build_should_still_write_its_profile(self):
+    self.assertRaises(OSError, self.generator.run)
+    self.assertEquals([False], self.profiler.finished_with)
+
+if __name__ == '__main__':
+  unittest.main()
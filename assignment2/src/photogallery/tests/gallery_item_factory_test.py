@@ -1,7 +1,15 @@
+import sys
+import itertools
 import unittest
-from ..generator.galleryitemfactory import GalleryItemFactory
-from ..generator.galleryitem import JpegDirectory, JpegPicture
+import multiprocessing
+from ..generator.galleryitemfactory import GalleryItemFactory, \
+    natural_sort_key
+from ..generator.galleryitem import JpegDirectory, JpegPicture, \
+    LazyJpegPicture, DirectorySummary
+from ..generator.quarantine import Quarantine
+from ..generator.progress import NullProgressReporter, IMAGES
 from ..utils.inject import assign_injectables
+from .quarantine_test import StubStatResult
 
 class SimpleStubOsModule(object):
   def __init__(self, stub_list):
@@ -64,6 +72,31 @@ class GalleryItemFactoryTest(unittest.TestCase):
     self.assertTrue(directory[0].get_name().endswith(self.directory_names[0]))
 
 
+class SortedGalleryItemFactoryTest(unittest.TestCase):
+  def setUp(self):
+    self.list_directory = SimpleStubOsModule(['IMG_10.jpg', 'IMG_2.jpg',
+      'IMG_1.jpg']).listdir
+
+  def create_factory(self, **kwargs):
+    return GalleryItemFactory(lookup_table={}, should_prompt=False,
+        iptc_info_constructor=StubIptcInfoConstructor,
+        list_directory=self.list_directory, is_directory=lambda name: False,
+        **kwargs)
+
+  def names(self, directory):
+    return [entry.get_name() for entry in directory.get_contents()]
+
+  def test_it_should_sort_the_contents_by_name(self):
+    directory = self.create_factory().create_directory('/not/real')
+    self.assertEquals(['IMG_1.jpg', 'IMG_10.jpg', 'IMG_2.jpg'],
+        self.names(directory))
+
+  def test_it_should_sort_numbers_naturally_if_asked_to(self):
+    factory = self.create_factory(sort_key=natural_sort_key)
+    directory = factory.create_directory('/not/real')
+    self.assertEquals(['IMG_1.jpg', 'IMG_2.jpg', 'IMG_10.jpg'],
+        self.names(directory))
+
 class NestedDirectoryOsModule(object):
   def __init__(self, first_list, second_list):
     assign_injectables(self, locals())
@@ -128,5 +161,221 @@ class NestedDirectoryGalleryItemFactoryTest(unittest.TestCase):
     self.assertTrue('first' in view['back_href'])
     self.assertTrue('.html' in view['back_href'])
 
+  def test_it_should_create_directories_one_at_a_time(self):
+    first_directory, second_directory = \
+        list(self.factory.iter_directories(self.top_directory))
+    self.assertEquals('/first', first_directory.get_name())
+    summaries = [entry for entry in first_directory.get_contents() \
+        if isinstance(entry, DirectorySummary)]
+    self.assertEquals(['/first/second'],
+        [summary.get_name() for summary in summaries])
+    self.assertEquals('first.html', summaries[0].get_back_href())
+    self.assertEquals('/first/second', second_directory.get_name())
+    self.assertEquals('first.html', second_directory.get_back_href())
+    self.assertEquals(['a_jpeg.jpg', 'another_jpeg.jpg'],
+        [jpeg.get_name() for jpeg in second_directory.get_contents()])
+
+  def test_summaries_should_look_like_the_directories_they_stand_for(self):
+    created = self.factory.create_directory(self.top_directory)
+    streamed = self.factory.iter_directories(self.top_directory).next()
+    self.assertEquals([entry.as_entry_view() for entry in
+      created.get_contents()], [entry.as_entry_view() for entry in
+        streamed.get_contents()])
+
+  def test_it_should_show_subdirectories_it_was_given(self):
+    merged = self.factory.create_summarized_directory('/first',
+        ['6170_sample_image_01.jpg', 'notes.txt'], ['/first/elsewhere'])
+    self.assertEquals(['/first/elsewhere', '6170_sample_image_01.jpg'],
+        [entry.get_name() for entry in merged.get_contents()])
+    self.assertTrue(isinstance(merged.get_contents()[0], DirectorySummary))
+
+class DeepDirectoryGalleryItemFactoryTest(unittest.TestCase):
+  def test_it_should_not_recurse_into_deep_trees(self):
+    depth = sys.getrecursionlimit() + 100
+    def list_directory(path):
+      if path.count('/') < depth:
+        return ['d']
+      return []
+    factory = GalleryItemFactory(lookup_table={}, should_prompt=False,
+        iptc_info_constructor=StubIptcInfoConstructor,
+        list_directory=list_directory, is_directory=lambda name: True)
+    directory_count = 0
+    for directory in factory.iter_directories('/d'):
+      directory_count += 1
+    self.assertEquals(depth, directory_count)
+
+class StubIptcInfoWithData(object):
+  """
+  Defined at module level so that it can be pickled and sent to the worker
+  processes. File names decide how reading the metadata goes.
+  """
+  def __init__(self, file_name):
+    if 'unreadable' in file_name:
+      raise IOError
+    elif 'no_iptc' in file_name:
+      raise Exception('No IPTC data found.')
+    elif 'broken' in file_name:
+      raise ValueError('Something unexpected')
+    self.data = {80: 'Photographer of ' + file_name, 90: None}
+
+
+class InProcessPool(object):
+  """ Stands in for multiprocessing.Pool without starting processes. """
+  def map(self, function, arguments):
+    return map(function, arguments)
+
+  def imap(self, function, arguments, chunk_size=1):
+    return itertools.imap(function, arguments)
+
+
+class RecordingProgressReporter(NullProgressReporter):
+  """ Keeps the count of images, and nothing else. """
+  def __init__(self):
+    self.images = 0
+
+  def count(self, counter, amount=1):
+    if counter == IMAGES:
+      self.images += amount
+
+  def iterate(self, counter, iterable):
+    for item in iterable:
+      self.count(counter)
+      yield item
+
+
+class ParallelGalleryItemFactoryTest(unittest.TestCase):
+  def setUp(self):
+    self.files = ['first.jpg', 'unreadable.jpg', 'no_iptc.jpg', 'second.jpg']
+    self.list_directory = SimpleStubOsModule(self.files).listdir
+    self.lookup_table = {'Photographer': 80, 'City': 90}
+
+  def create_factory(self, process_pool):
+    return GalleryItemFactory(lookup_table=self.lookup_table,
+        should_prompt=False, iptc_info_constructor=StubIptcInfoWithData,
+        list_directory=self.list_directory, is_directory=lambda name: False,
+        process_pool=process_pool)
+
+  def test_it_should_skip_files_like_the_serial_factory(self):
+    factory = self.create_factory(InProcessPool())
+    contents = factory.create_directory('/not/real').get_contents()
+    self.assertEquals(['first.jpg', 'second.jpg'],
+        [picture.get_name() for picture in contents])
+
+  def test_it_should_keep_the_manifest_metadata(self):
+    factory = self.create_factory(InProcessPool())
+    first = factory.create_directory('/not/real').get_contents()[0]
+    self.assertEquals('Photographer of /not/real/first.jpg',
+        first.lookup('Photographer'))
+    self.assertEquals(None, first.lookup('City'))
+
+  def test_it_should_raise_unexpected_exceptions(self):
+    self.files.append('broken.jpg')
+    factory = self.create_factory(InProcessPool())
+    self.assertRaises(ValueError, factory.create_directory, '/not/real')
+
+  def test_it_should_quarantine_unexpected_exceptions_if_asked_to(self):
+    self.files.append('broken.jpg')
+    file_quarantine = Quarantine(None,
+        stat_file=lambda name: StubStatResult(100, 2000))
+    factory = GalleryItemFactory(lookup_table=self.lookup_table,
+        should_prompt=False, iptc_info_constructor=StubIptcInfoWithData,
+        list_directory=self.list_directory, is_directory=lambda name: False,
+        process_pool=InProcessPool(), quarantine=file_quarantine)
+    contents = factory.create_directory('/not/real').get_contents()
+    self.assertEquals(['first.jpg', 'second.jpg'],
+        [picture.get_name() for picture in contents])
+    self.assertTrue(file_quarantine.is_quarantined('/not/real/broken.jpg'))
+
+  def test_it_should_count_each_image_when_it_has_been_read(self):
+    reporter = RecordingProgressReporter()
+    counts_at_reads = []
+    def iptc_info_constructor(file_name):
+      counts_at_reads.append(reporter.images)
+      return StubIptcInfoWithData(file_name)
+    self.files.append('broken.jpg')
+    file_quarantine = Quarantine(None, {'/not/real/broken.jpg':
+      {'error': 'ValueError', 'stamp': [100, 2000]}},
+      stat_file=lambda name: StubStatResult(100, 2000))
+    for process_pool in [None, InProcessPool()]:
+      reporter.images = 0
+      del counts_at_reads[:]
+      factory = GalleryItemFactory(lookup_table=self.lookup_table,
+          should_prompt=False, iptc_info_constructor=iptc_info_constructor,
+          list_directory=self.list_directory, is_directory=lambda name: False,
+          process_pool=process_pool, quarantine=file_quarantine,
+          progress_reporter=reporter)
+      factory.create_directory('/not/real')
+      self.assertEquals([0, 1, 2, 3], counts_at_reads)
+      self.assertEquals(4, reporter.images)
+
+  def test_it_should_read_metadata_in_worker_processes(self):
+    process_pool = multiprocessing.Pool(2)
+    try:
+      factory = self.create_factory(process_pool)
+      contents = factory.create_directory('/not/real').get_contents()
+    finally:
+      process_pool.close()
+      process_pool.join()
+    self.assertEquals(['first.jpg', 'second.jpg'],
+        [picture.get_name() for picture in contents])
+    self.assertEquals('Photographer of /not/real/second.jpg',
+        contents[1].lookup('Photographer'))
+
+
+class LazyGalleryItemFactoryTest(unittest.TestCase):
+  def setUp(self):
+    self.files = ['first.jpg', 'no_iptc.jpg']
+    self.constructed_files = []
+    def iptc_info_constructor(file_name):
+      self.constructed_files.append(file_name)
+      return StubIptcInfoWithData(file_name)
+    self.factory = GalleryItemFactory(
+        lookup_table={'Photographer': 80, 'City': 90}, should_prompt=False,
+        iptc_info_constructor=iptc_info_constructor,
+        list_directory=SimpleStubOsModule(self.files).listdir,
+        is_directory=lambda name: False, lazy_metadata=True)
+
+  def test_it_should_not_read_any_files_up_front(self):
+    contents = self.factory.create_directory('/not/real').get_contents()
+    self.assertEquals(2, len(contents))
+    self.assertTrue(all(isinstance(picture, LazyJpegPicture) \
+        for picture in contents))
+    self.assertEquals([], self.constructed_files)
+
+  def test_it_should_read_the_metadata_when_it_is_looked_up(self):
+    first = self.factory.create_directory('/not/real').get_contents()[0]
+    self.assertEquals('Photographer of /not/real/first.jpg',
+        first.lookup('Photographer'))
+    self.assertEquals(['/not/real/first.jpg'], self.constructed_files)
+
+  def test_files_without_iptc_data_should_have_no_caption_data(self):
+    no_iptc = self.factory.create_directory('/not/real').get_contents()[1]
+    self.assertEquals(None, no_iptc.lookup('Photographer'))
+
+  def test_unexpected_exceptions_should_keep_the_picture_without_a_caption(self):
+    self.files.append('broken.jpg')
+    file_quarantine = Quarantine(None,
+        stat_file=lambda name: StubStatResult(100, 2000))
+    factory = GalleryItemFactory(lookup_table={'Photographer': 80},
+        should_prompt=False, iptc_info_constructor=StubIptcInfoWithData,
+        list_directory=SimpleStubOsModule(self.files).listdir,
+        is_directory=lambda name: False, lazy_metadata=True,
+        quarantine=file_quarantine)
+    directory = factory.create_directory('/not/real')
+    captions = [picture.lookup('Photographer') \
+        for picture in directory.get_contents()]
+    self.assertEquals([None, 'Photographer of /not/real/first.jpg', None],
+        captions)
+    self.assertEquals(['broken.html', 'first.html', 'no_iptc.html'],
+        [picture.get_output_file_name() \
+          for picture in directory.get_contents()])
+    self.assertEquals(0, file_quarantine.get_size())
+
+  def test_unexpected_exceptions_should_be_raised_without_a_quarantine(self):
+    self.files.append('broken.jpg')
+    broken = self.factory.create_directory('/not/real').get_contents()[0]
+    self.assertRaises(ValueError, broken.lookup, 'Photographer')
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -1,6 +1,8 @@
 import unittest
-from ..generator.galleryitem import JpegPicture, NoSuchMetadata, JpegDirectory
+from ..generator.galleryitem import JpegPicture, NoSuchMetadata, \
+    JpegDirectory, LazyJpegPicture
 from ..utils.immutabledict import ImmutableDict
+from ..generator.manifestparser import LookupPlan
 
 class StubIptcInfo(object):
   """
@@ -59,6 +61,82 @@ class JpegPictureTest(unittest.TestCase):
     self.assertTrue(any(map(lambda line: 'Israel' in line, caption)))
     self.assertTrue(any(map(lambda line: 'Hike in Ein Kerem' in line, caption)))
 
+class CountingIptcData(dict):
+  def __init__(self, data):
+    dict.__init__(self, data)
+    self.lookup_count = 0
+
+  def __getitem__(self, key):
+    self.lookup_count += 1
+    return dict.__getitem__(self, key)
+
+class JpegPictureLookupPlanTest(unittest.TestCase):
+  def setUp(self):
+    self.iptc_info = StubIptcInfo()
+    self.iptc_info.data = CountingIptcData(self.iptc_info.data)
+    self.plan = LookupPlan([('Photographer', 80), ('alt_text', 120),
+      ('City', 90)])
+    self.jpeg_picture = JpegPicture('file_name.jpg', 'jpegs', self.iptc_info,
+        self.plan)
+
+  def test_the_caption_should_follow_the_plan_order(self):
+    self.assertEquals(['Photographer: Daniel Jackson\n',
+      'alt_text: Hike in Ein Kerem\n', 'City: Jerusalem\n'],
+      self.jpeg_picture.build_caption())
+
+  def test_the_view_should_read_each_dataset_once(self):
+    view = self.jpeg_picture.as_view()
+    self.assertEquals('Hike in Ein Kerem', view['alt_text'])
+    self.assertEquals(3, self.iptc_info.data.lookup_count)
+
+class JpegPictureVariantsTest(unittest.TestCase):
+  def setUp(self):
+    self.metadata_dict = ImmutableDict({'Photographer': 80})
+
+  def test_it_should_show_the_original_without_variants(self):
+    view = JpegPicture('file_name.jpg', 'jpegs', StubIptcInfo(),
+        self.metadata_dict).as_view()
+    self.assertEquals('file_name.jpg', view['thumbnail_src'])
+    self.assertEquals('file_name.jpg', view['web_src'])
+
+  def test_it_should_show_its_variants(self):
+    variants = ImmutableDict.of(thumbnail_src='variants/abc-thumbnail.jpg',
+        web_src='variants/abc-web.jpg')
+    view = JpegPicture('file_name.jpg', 'jpegs', StubIptcInfo(),
+        self.metadata_dict, variants).as_view()
+    self.assertEquals('file_name.jpg', view['src'])
+    self.assertEquals('variants/abc-thumbnail.jpg', view['thumbnail_src'])
+    self.assertEquals('variants/abc-web.jpg', view['web_src'])
+
+class CountingMetadataLoader(object):
+  def __init__(self):
+    self.loaded_files = []
+
+  def __call__(self, full_jpeg_name):
+    self.loaded_files.append(full_jpeg_name)
+    return StubIptcInfo()
+
+class LazyJpegPictureTest(unittest.TestCase):
+  def setUp(self):
+    self.loader = CountingMetadataLoader()
+    self.metadata_dict = ImmutableDict({'Photographer': 80, 'City': 90})
+    self.jpeg_picture = LazyJpegPicture('file_name.jpg', 'jpegs',
+        '/pictures/file_name.jpg', self.loader, self.metadata_dict)
+
+  def test_it_should_not_read_the_file_when_created(self):
+    self.assertEquals([], self.loader.loaded_files)
+
+  def test_it_should_read_the_file_once_on_the_first_lookup(self):
+    self.assertEquals('Daniel Jackson',
+        self.jpeg_picture.lookup('Photographer'))
+    self.assertEquals('Jerusalem', self.jpeg_picture.lookup('City'))
+    self.assertEquals(['/pictures/file_name.jpg'], self.loader.loaded_files)
+
+  def test_it_should_not_read_the_file_for_invalid_attributes(self):
+    self.assertRaises(NoSuchMetadata, self.jpeg_picture.lookup,
+        'not_real_attribute')
+    self.assertEquals([], self.loader.loaded_files)
+
 class JpegPictureOutputFileNameTest(unittest.TestCase):
   def setUp(self):
     self.stub_iptc_info = StubIptcInfo()
@@ -111,6 +189,45 @@ class JpegDirectoryOutputFileNameTest(unittest.TestCase):
     output_name = jpeg_directory.get_output_file_name()
     self.assertEquals('directory-name.html', output_name)
 
+class StubEntry(object):
+  def __init__(self, name):
+    self.name = name
+
+  def as_entry_view(self):
+    return self.name
+
+class JpegDirectoryPaginationTest(unittest.TestCase):
+  def setUp(self):
+    self.entries = [StubEntry('entry%d' % index) for index in range(5)]
+    self.jpeg_directory = JpegDirectory('directory', self.entries,
+        should_prompt=False, page_size=2)
+
+  def test_it_should_split_its_contents_over_pages(self):
+    views = list(self.jpeg_directory.as_views())
+    self.assertEquals(['directory.html', 'directory.page-2.html',
+      'directory.page-3.html'], [file_name for file_name, view in views])
+    self.assertEquals([['entry0', 'entry1'], ['entry2', 'entry3'],
+      ['entry4']], [view['images'] for file_name, view in views])
+
+  def test_it_should_link_neighbouring_pages(self):
+    views = [view for file_name, view in self.jpeg_directory.as_views()]
+    self.assertEquals(None, views[0]['prev_href'])
+    self.assertEquals('directory.page-2.html', views[0]['next_href'])
+    self.assertEquals('directory.html', views[1]['prev_href'])
+    self.assertEquals(None, views[2]['next_href'])
+    self.assertEquals(3, views[2]['page_count'])
+
+  def test_it_should_use_a_single_page_without_a_page_size(self):
+    jpeg_directory = JpegDirectory('directory', self.entries,
+        should_prompt=False)
+    views = list(jpeg_directory.as_views())
+    self.assertEquals(['directory.html'],
+        [file_name for file_name, view in views])
+    self.assertEquals(5, len(views[0][1]['images']))
+
+  def test_it_should_leave_out_its_contents_as_an_entry(self):
+    self.assertTrue('images' not in self.jpeg_directory.as_entry_view())
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import os
+import shutil
+import tempfile
+from ...generator.buildcache import BuildJournal
+from ...generator.galleryitemfactory import EXTRACTED, NO_IPTC_DATA
+
+class BuildJournalTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.file_name = os.path.join(self.directory, 'journal')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write_journal(self):
+    journal = BuildJournal(self.file_name, 'manifest-hash')
+    journal.open()
+    journal.record_picture('/pics/a.jpg', ((100, 2000), EXTRACTED,
+      [(80, 'Daniel Jackson')]))
+    journal.record_picture('/pics/b.jpg', ((100, 3000), NO_IPTC_DATA, None))
+    journal.record_page('pics.html', 'fingerprint')
+    return journal
+
+  def test_it_should_replay_what_was_recorded(self):
+    self.write_journal()
+    pictures, pages = BuildJournal(self.file_name, 'manifest-hash').replay()
+    self.assertEquals(['/pics/a.jpg', '/pics/b.jpg'], sorted(pictures))
+    self.assertEquals(((100, 3000), NO_IPTC_DATA, None),
+        pictures['/pics/b.jpg'])
+    self.assertEquals({'pics.html': 'fingerprint'}, pages)
+
+  def test_it_should_ignore_a_journal_for_another_manifest(self):
+    self.write_journal()
+    pictures, pages = BuildJournal(self.file_name, 'other-hash').replay()
+    self.assertEquals(({}, {}), (pictures, pages))
+
+  def test_it_should_drop_a_half_written_record_when_resuming(self):
+    self.write_journal()
+    with open(self.file_name, 'ab') as journal_file:
+      journal_file.write('\x80\x02(U\x04pag')
+    journal = BuildJournal(self.file_name, 'manifest-hash')
+    pictures, pages = journal.replay()
+    self.assertEquals(2, len(pictures))
+    self.assertEquals(1, len(pages))
+    journal.open(keep_records=True)
+    journal.record_page('other.html', 'other-fingerprint')
+    pictures, pages = BuildJournal(self.file_name, 'manifest-hash').replay()
+    self.assertEquals({'pics.html': 'fingerprint',
+      'other.html': 'other-fingerprint'}, pages)
+
+  def test_it_should_start_over_unless_resuming(self):
+    self.write_journal()
+    journal = BuildJournal(self.file_name, 'manifest-hash')
+    journal.replay()
+    journal.open()
+    self.assertEquals(({}, {}),
+        BuildJournal(self.file_name, 'manifest-hash').replay())
+
+  def test_it_should_delete_the_journal_when_removed(self):
+    self.write_journal().remove()
+    self.assertFalse(os.path.exists(self.file_name))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import os
+import gzip
+import shutil
+import tempfile
+from ...generator import compressor
+from ...generator.compressor import Compressor, GZIP, BROTLI
+
+class CompressorTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.file_names = []
+    for name in ['page.html', 'gallery-style.css', 'lightsOff.js']:
+      file_name = os.path.join(self.directory, name)
+      with open(file_name, 'w') as output_file:
+        output_file.write('<p>%s</p>\n' % name * 100)
+      self.file_names.append(file_name)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_it_should_write_gzip_copies(self):
+    self.assertEquals(3, Compressor(formats=[GZIP]).compress_files(
+      self.file_names))
+    with open(self.file_names[0], 'rb') as original:
+      gzipped = gzip.open(self.file_names[0] + '.gz', 'rb')
+      try:
+        self.assertEquals(original.read(), gzipped.read())
+      finally:
+        gzipped.close()
+
+  def test_it_should_skip_copies_that_are_current(self):
+    engine = Compressor(thread_count=2, formats=[GZIP])
+    self.assertEquals(3, engine.compress_files(self.file_names))
+    self.assertEquals(0, engine.compress_files(self.file_names))
+    os.utime(self.file_names[1], (1000, 1000))
+    self.assertEquals(1, engine.compress_files(self.file_names))
+
+  def test_gzip_output_should_be_deterministic(self):
+    first = compressor.gzip_contents('contents', 1000)
+    self.assertEquals(first, compressor.gzip_contents('contents', 1000))
+
+  def test_it_should_write_brotli_copies_if_brotli_is_installed(self):
+    if BROTLI not in compressor.available_formats():
+      return
+    Compressor(formats=[BROTLI]).compress_files(self.file_names[:1])
+    with open(self.file_names[0] + '.br', 'rb') as compressed_file:
+      with open(self.file_names[0], 'rb') as original:
+        self.assertEquals(original.read(),
+            compressor.brotli.decompress(compressed_file.read()))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -30,6 +30,42 @@ class TestCopier(unittest.TestCase):
     self.assertTrue(os.path.isfile('/tmp/second/bar.jpg'))
     self.assertTrue(os.path.isfile('/tmp/second/baz.jpg'))
 
+  def test_copier_should_copy_with_a_thread_pool(self):
+    copier.copy_jpegs('/tmp/first', '/tmp/second', copier.CopyEngine(3))
+    self.assertEquals(['bar.jpg', 'baz.jpg', 'foo.jpg'],
+        sorted(os.listdir('/tmp/second')))
+    with open('/tmp/second/baz.jpg') as copied_jpg:
+      self.assertEquals('even more jpeg data', copied_jpg.read())
+
+  def test_copier_should_skip_files_that_are_already_current(self):
+    engine = copier.CopyEngine()
+    file_names = ['/tmp/first/foo.jpg', '/tmp/first/bar.jpg',
+        '/tmp/first/first_sub/baz.jpg']
+    self.assertEquals(3, engine.copy_files(file_names, '/tmp/second'))
+    self.assertEquals(0, engine.copy_files(file_names, '/tmp/second'))
+    with open('/tmp/first/foo.jpg', 'w') as first_jpg:
+      first_jpg.write('changed jpeg data')
+    os.utime('/tmp/first/foo.jpg', (0, 0))
+    self.assertEquals(1,
+        engine.copy_files(['/tmp/first/foo.jpg', '/tmp/first/bar.jpg'],
+          '/tmp/second'))
+    with open('/tmp/second/foo.jpg') as copied_jpg:
+      self.assertEquals('changed jpeg data', copied_jpg.read())
+
+  def test_copier_should_hardlink_files(self):
+    copier.copy_jpegs('/tmp/first', '/tmp/second',
+        copier.CopyEngine(copy_mode=copier.HARDLINK))
+    self.assertTrue(os.path.samefile('/tmp/first/first_sub/baz.jpg',
+      '/tmp/second/baz.jpg'))
+
+  def test_copier_should_reflink_or_copy_files(self):
+    copier.copy_jpegs('/tmp/first', '/tmp/second',
+        copier.CopyEngine(copy_mode=copier.REFLINK))
+    with open('/tmp/second/bar.jpg') as copied_jpg:
+      self.assertEquals('some more jpeg data', copied_jpg.read())
+    self.assertTrue(copier.destination_is_current('/tmp/first/bar.jpg',
+      '/tmp/second/bar.jpg'))
+
   def tearDown(self):
     shutil.rmtree('/tmp/first')
     shutil.rmtree('/tmp/second')
@@ -0,0 +1,48 @@
+import unittest
+import os
+import shutil
+import tempfile
+from ...generator.directorytitles import DirectoryTitles, \
+    load_directory_titles, read_titles_file
+
+class DirectoryTitlesFileTest(unittest.TestCase):
+  """
+  Saves and loads titles files in a temporary directory.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def round_trip(self, file_name):
+    full_name = os.path.join(self.directory, 'output', file_name)
+    titles = DirectoryTitles('/photos', file_name=full_name)
+    titles.set_title('/photos', 'My photos')
+    titles.set_title('/photos/paris', 'Caf\xc3\xa9s of Paris')
+    titles.save()
+    loaded = load_directory_titles('/photos', full_name, False)
+    self.assertEquals(u'My photos', loaded.get_title('/photos'))
+    self.assertEquals(u'Caf\xe9s of Paris', loaded.get_title('/photos/paris'))
+
+  def test_it_should_round_trip_json(self):
+    self.round_trip('titles.json')
+
+  def test_it_should_round_trip_csv(self):
+    self.round_trip('titles.csv')
+
+  def test_it_should_start_empty_without_a_file(self):
+    full_name = os.path.join(self.directory, 'missing.json')
+    titles = load_directory_titles('/photos', full_name, False)
+    self.assertEquals(None, titles.get_title('/photos'))
+    titles.save()
+    self.assertFalse(os.path.exists(full_name))
+
+  def test_it_should_reject_malformed_files(self):
+    full_name = os.path.join(self.directory, 'titles.csv')
+    with open(full_name, 'wb') as titles_file:
+      titles_file.write('paris,Paris,extra\n')
+    self.assertRaises(ValueError, read_titles_file, full_name)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+import shutil
+import tempfile
+from ...benchmarks.synthesizer import GalleryTreeSynthesizer
+from ...benchmarks.harness import Benchmark, PipelineError
+
+class BenchmarkTest(unittest.TestCase):
+  """
+  Runs the full pipeline on a tiny tree in a temporary directory.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_it_should_report_a_pipeline_that_fails(self):
+    benchmark = Benchmark(GalleryTreeSynthesizer(1, 1, 2), self.directory,
+        ['--no-such-option'])
+    benchmark.prepare()
+    self.assertRaises(PipelineError, benchmark.time_full_pipeline)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import os
+import tempfile
+from iptcinfo import IPTCInfo
+from ..iptc_reader_test import jpeg_with_iptc, SAMPLE_IPTC_BLOCK
+from ...generator.iptcreader import NativeIptcInfo, NativeIptcInfoConstructor
+
+class NativeIptcInfoTest(unittest.TestCase):
+  """
+  Reads files written to a temporary directory, and checks the results
+  against IPTCInfo.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.with_iptc = os.path.join(self.directory, 'with_iptc.jpg')
+    with open(self.with_iptc, 'wb') as jpeg_file:
+      jpeg_file.write(jpeg_with_iptc(SAMPLE_IPTC_BLOCK))
+    self.without_iptc = os.path.join(self.directory, 'without_iptc.jpg')
+    with open(self.without_iptc, 'wb') as jpeg_file:
+      jpeg_file.write('\xff\xd8\xff\xda\x00\x04ab')
+
+  def test_it_should_agree_with_IPTCInfo(self):
+    expected = IPTCInfo(self.with_iptc).data
+    actual = NativeIptcInfo(self.with_iptc).data
+    for dataset in [25, 80, 90, 101, 118, 120]:
+      self.assertEquals(expected[dataset], actual[dataset])
+
+  def test_the_constructor_should_only_decode_the_given_datasets(self):
+    actual = NativeIptcInfoConstructor([80])(self.with_iptc).data
+    self.assertEquals({80: 'Daniel Jackson'}, actual)
+
+  def test_it_should_raise_like_IPTCInfo_without_iptc_data(self):
+    try:
+      NativeIptcInfo(self.without_iptc)
+      self.fail()
+    except Exception as exception:
+      self.assertEquals('No IPTC data found.', str(exception))
+
+  def test_it_should_raise_IOError_for_missing_files(self):
+    self.assertRaises(IOError, NativeIptcInfo,
+        os.path.join(self.directory, 'missing.jpg'))
+
+  def tearDown(self):
+    for name in os.listdir(self.directory):
+      os.remove(os.path.join(self.directory, name))
+    os.rmdir(self.directory)
+
+if __name__ == '__main__':
+  unittest.main()
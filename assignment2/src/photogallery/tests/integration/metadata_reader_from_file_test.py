@@ -0,0 +1,91 @@
+import unittest
+import os
+import tempfile
+from iptcinfo import IPTCInfo
+from ..iptc_reader_test import jpeg_segment, jpeg_with_iptc, \
+    SAMPLE_IPTC_BLOCK
+from ..metadata_reader_test import tiff_structure, ascii_entry, SAMPLE_XMP
+from ...generator.metadatareader import NativeMetadata, \
+    NativeMetadataConstructor, canonical_key
+from ...generator.iptcreader import NativeIptcInfoConstructor
+from ...generator.manifestparser import parse_manifest_data, LookupPlan
+from ...generator.galleryitem import JpegPicture
+
+class NativeMetadataTest(unittest.TestCase):
+  """
+  Reads files with EXIF and XMP but no IPTC data, written to a temporary
+  directory.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.with_metadata = os.path.join(self.directory, 'with_metadata.jpg')
+    with open(self.with_metadata, 'wb') as jpeg_file:
+      jpeg_file.write('\xff\xd8' +
+          jpeg_segment(0xe1, 'Exif\0\0' + tiff_structure('MM',
+            [ascii_entry(0x013b, 'Daniel Jackson')], [])) +
+          jpeg_segment(0xe1, 'http://ns.adobe.com/xap/1.0/\0' + SAMPLE_XMP) +
+          jpeg_segment(0xda, 'image data'))
+    self.without_metadata = os.path.join(self.directory, 'without.jpg')
+    with open(self.without_metadata, 'wb') as jpeg_file:
+      jpeg_file.write('\xff\xd8\xff\xda\x00\x04ab')
+
+  def test_it_should_key_the_values_by_manifest_key(self):
+    data = NativeMetadata(self.with_metadata,
+        ['exif:Artist', 'xmp:photoshop:City', 120]).data
+    self.assertEquals({'exif:Artist': 'Daniel Jackson',
+      'xmp:photoshop:City': 'Jerusalem', 120: None}, data)
+
+  def test_the_constructor_should_check_the_keys_up_front(self):
+    self.assertRaises(ValueError, NativeMetadataConstructor,
+        ['exif:NoSuchTag'])
+    self.assertEquals({'exif:Model': None},
+        NativeMetadataConstructor(['exif:Model'])(self.with_metadata).data)
+
+  def test_it_should_raise_like_IPTCInfo_without_any_metadata(self):
+    try:
+      NativeMetadata(self.without_metadata, ['exif:Artist'])
+      self.fail()
+    except Exception as exception:
+      self.assertEquals('No IPTC data found.', str(exception))
+
+  def tearDown(self):
+    for name in os.listdir(self.directory):
+      os.remove(os.path.join(self.directory, name))
+    os.rmdir(self.directory)
+
+class IptcManifestKeysTest(unittest.TestCase):
+  """
+  Checks that the ways of writing an IPTC key in the manifest read the same
+  values with every reader.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.with_iptc = os.path.join(self.directory, 'with_iptc.jpg')
+    with open(self.with_iptc, 'wb') as jpeg_file:
+      jpeg_file.write(jpeg_with_iptc(SAMPLE_IPTC_BLOCK))
+    self.plan = LookupPlan(parse_manifest_data('{"Photographer": ' +
+      '"by-line", "City": "iptc:90", "Description": 120}'), canonical_key)
+
+  def lookup_all(self, iptc_info_constructor):
+    picture = JpegPicture('with_iptc.jpg', 'index.html',
+        iptc_info_constructor(self.with_iptc), self.plan)
+    return [picture.lookup(name) for name in
+        ['Photographer', 'City', 'Description']]
+
+  def test_iptcinfo_should_read_named_and_prefixed_keys(self):
+    self.assertEquals(['Daniel Jackson', 'Jerusalem', 'Hike in Ein Kerem'],
+        self.lookup_all(IPTCInfo))
+
+  def test_the_native_readers_should_read_named_and_prefixed_keys(self):
+    for constructor in [NativeIptcInfoConstructor(self.plan.values()),
+        NativeMetadataConstructor(self.plan.values())]:
+      self.assertEquals(['Daniel Jackson', 'Jerusalem', 'Hike in Ein Kerem'],
+          self.lookup_all(constructor))
+
+  def tearDown(self):
+    for name in os.listdir(self.directory):
+      os.remove(os.path.join(self.directory, name))
+    os.rmdir(self.directory)
+
+if __name__ == '__main__':
+  unittest.main()
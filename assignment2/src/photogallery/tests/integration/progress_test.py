@@ -0,0 +1,49 @@
+import unittest
+import os
+import shutil
+import tempfile
+import simplejson as json
+from ...generator.progress import ProgressReporter, IMAGES
+
+class ProgressJsonLinesTest(unittest.TestCase):
+  """
+  Writes progress reports to a file in a temporary directory.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.file_name = os.path.join(self.directory, 'progress.jsonl')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def build(self, image_count, succeeded=True):
+    reporter = ProgressReporter(None, self.file_name)
+    reporter.start()
+    with reporter.stage('read metadata', IMAGES, image_count):
+      reporter.count(IMAGES, image_count)
+    reporter.finish(succeeded)
+    return reporter
+
+  def read_reports(self):
+    with open(self.file_name) as json_lines_file:
+      return [json.loads(line) for line in json_lines_file]
+
+  def test_it_should_append_a_json_object_per_report(self):
+    self.build(3)
+    self.build(4)
+    reports = self.read_reports()
+    self.assertEquals(['read metadata', None, 'read metadata', None],
+        [report['stage'] for report in reports])
+    self.assertEquals([False, True, False, True],
+        [report['finished'] for report in reports])
+    self.assertEquals(4, reports[-1]['images'])
+
+  def test_a_failed_build_should_end_with_a_failed_report(self):
+    reporter = self.build(3, succeeded=False)
+    self.assertEquals(None, reporter.json_lines_file)
+    final_report = self.read_reports()[-1]
+    self.assertEquals((False, True),
+        (final_report['finished'], final_report['failed']))
+
+if __name__ == '__main__':
+  unittest.main()
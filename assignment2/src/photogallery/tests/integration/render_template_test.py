@@ -1,5 +1,12 @@
 import unittest
+import os
+import shutil
+import tempfile
+import multiprocessing
 from jinja2 import Environment, PackageLoader
+from ...generator import exporter
+from ...generator.galleryitem import JpegPicture, JpegDirectory
+from ...generator.galleryitemfactory import ExtractedIptcInfo
 
 class Jinja2EnvironmentTest(unittest.TestCase):
   """ 
@@ -17,5 +24,55 @@ class Jinja2EnvironmentTest(unittest.TestCase):
     """
     self.environment.get_template('photo-directory.html')
 
+class ExporterRegistryTest(unittest.TestCase):
+  def tearDown(self):
+    exporter.configure_exporters()
+
+  def test_it_should_compile_each_template_once(self):
+    exporter.configure_exporters()
+    first = exporter.create_photo_detail_exporter()
+    second = exporter.create_photo_detail_exporter()
+    self.assertTrue(first is second)
+    self.assertTrue(first is not exporter.create_photo_directory_exporter())
+
+  def test_it_should_keep_compiled_templates_in_the_bytecode_cache(self):
+    cache_directory = tempfile.mkdtemp()
+    try:
+      exporter.configure_exporters(os.path.join(cache_directory, 'templates'))
+      exporter.create_photo_directory_exporter()
+      self.assertEquals(1,
+          len(os.listdir(os.path.join(cache_directory, 'templates'))))
+    finally:
+      shutil.rmtree(cache_directory)
+
+class ParallelRenderTest(unittest.TestCase):
+  def setUp(self):
+    exporter.configure_exporters()
+    lookup_table = {'Photographer': 80, 'Description': 120}
+    def create_directory(name, picture_count, subdirectories, back_href=None):
+      pictures = [JpegPicture('%s_%d.jpg' % (name, index), name + '.html',
+        ExtractedIptcInfo({80: 'Photographer %d' % index,
+          120: u'Caf\xe9 %d' % index}), lookup_table) \
+            for index in range(picture_count)]
+      return JpegDirectory(name, pictures + subdirectories,
+          should_prompt=False, back_href=back_href, page_size=3)
+    inner = create_directory('inner', 4, [], back_href='outer.html')
+    self.top_directory = create_directory('outer', 7, [inner])
+    self.exporter = exporter.create_photo_directory_exporter()
+
+  def test_it_should_render_the_same_pages_as_the_serial_path(self):
+    serial = [(page.get_file_name(), page.get_contents()) for page in
+        self.exporter.iter_export(self.top_directory)]
+    process_pool = multiprocessing.Pool(2)
+    try:
+      parallel = [(page.get_file_name(), page.get_contents()) for page in
+          self.exporter.iter_export_parallel(self.top_directory,
+            process_pool)]
+    finally:
+      process_pool.close()
+      process_pool.join()
+    self.assertEquals(len(serial), len(parallel))
+    self.assertEquals(serial, parallel)
+
 if __name__ == '__main__':
   unittest.main()
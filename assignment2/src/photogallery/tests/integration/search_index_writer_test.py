@@ -0,0 +1,42 @@
+import unittest
+import os
+import shutil
+import tempfile
+import simplejson as json
+from ..search_index_test import StubPicture
+from ...generator.galleryitem import JpegDirectory
+from ...generator.searchindex import SearchIndexWriter
+
+class SearchIndexWriterTest(unittest.TestCase):
+  """
+  Writes search indexes to a temporary directory.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.search_directory = os.path.join(self.directory, 'search')
+    self.writer = SearchIndexWriter(self.directory, documents_per_shard=1)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, pictures):
+    self.writer.write(JpegDirectory('/top', pictures, False))
+
+  def read(self, file_name):
+    with open(os.path.join(self.search_directory, file_name)) as index_file:
+      return json.load(index_file)
+
+  def test_it_should_remove_the_shards_of_pictures_that_are_gone(self):
+    self.write([StubPicture('a.jpg', [('title', 'zebra')]),
+      StubPicture('b.jpg', [('title', 'lion')])])
+    with open(os.path.join(self.search_directory, 'terms-ze.json.gz'),
+        'wb') as compressed_file:
+      compressed_file.write('compressed')
+    self.write([StubPicture('b.jpg', [('title', 'lion')])])
+    self.assertEquals(['docs-0.json', 'index.json', 'terms-li.json'], sorted(name for name in
+        os.listdir(self.search_directory) if not name.startswith('.')))
+    self.assertEquals({'lion': [0]}, self.read('terms-li.json'))
+    self.assertEquals('b.html', self.read('docs-0.json')[0][0])
+
+if __name__ == '__main__':
+  unittest.main()
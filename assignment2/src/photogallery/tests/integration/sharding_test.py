@@ -0,0 +1,39 @@
+import unittest
+import shutil
+import tempfile
+from ...generator.sharding import Shard, read_shard_summaries
+from ...generator.galleryitem import JpegDirectory
+from ...generator.searchindex import SearchIndexBuilder
+from ..search_index_test import StubPicture
+
+class ShardSummaryTest(unittest.TestCase):
+  """
+  Writes and reads shard summaries in a temporary directory.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    builder = SearchIndexBuilder()
+    builder.add_directory(JpegDirectory('/photos/2010',
+      [StubPicture('a.jpg', [('title', 'Sunset')])], False))
+    Shard('/photos', 1, 2).write_summary(self.directory, ['/photos/2010'],
+        builder)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_it_should_need_every_summary(self):
+    self.assertRaises(IOError, read_shard_summaries, self.directory, 2)
+
+  def test_it_should_read_the_directories_of_all_the_shards(self):
+    Shard('/elsewhere/photos', 2, 2).write_summary(self.directory,
+        ['/elsewhere/photos/paris'])
+    summaries = read_shard_summaries(self.directory, 2)
+    self.assertEquals({'2010': [(['a.html', 'a.jpg', u'Sunset'],
+      [u'sunset'])], 'paris': []}, summaries)
+
+  def test_it_should_reject_directories_built_twice(self):
+    Shard('/photos', 2, 2).write_summary(self.directory, ['/photos/2010'])
+    self.assertRaises(ValueError, read_shard_summaries, self.directory, 2)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+import os
+import shutil
+import tempfile
+from iptcinfo import IPTCInfo
+from ...benchmarks.synthesizer import GalleryTreeSynthesizer
+
+class GalleryTreeSynthesizerTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.synthesizer = GalleryTreeSynthesizer(depth=1, width=2,
+        pictures_per_directory=3)
+    self.synthesizer.write_tree(self.directory)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_it_should_write_the_promised_number_of_pictures(self):
+    file_names = [name for directory, subdirectories, names in
+        os.walk(self.directory) for name in names]
+    self.assertEquals(self.synthesizer.count_pictures(), len(file_names))
+    self.assertEquals(9, len(file_names))
+
+  def test_the_pictures_should_have_iptc_data(self):
+    iptc_info = IPTCInfo(os.path.join(self.directory, 'album 1',
+      'IMG_00002.jpg'))
+    self.assertEquals('Picture 2 of album 1', iptc_info.data[120])
+
+if __name__ == '__main__':
+  unittest.main()
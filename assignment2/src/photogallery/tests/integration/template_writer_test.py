@@ -0,0 +1,52 @@
+import unittest
+import os
+import shutil
+import tempfile
+from ...generator.exporter import HtmlFileNameAndContents
+from ...generator.templatewriter import TemplateWriter
+
+class TemplateWriterTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.pages = [HtmlFileNameAndContents('first.html', u'<p>first</p>'),
+        HtmlFileNameAndContents('second.html', u'<p>second</p>')]
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def read(self, file_name):
+    with open(os.path.join(self.directory, file_name), 'rb') as page_file:
+      return page_file.read()
+
+  def test_it_should_write_every_page(self):
+    writer = TemplateWriter(self.directory)
+    writer.write_templates(iter(self.pages))
+    self.assertEquals('<p>first</p>', self.read('first.html'))
+    self.assertEquals(2, writer.get_written_count())
+
+  def test_it_should_skip_pages_that_did_not_change(self):
+    TemplateWriter(self.directory).write_templates(self.pages)
+    first_page = os.path.join(self.directory, 'first.html')
+    os.utime(first_page, (1000, 1000))
+    writer = TemplateWriter(self.directory)
+    writer.write_templates([self.pages[0],
+      HtmlFileNameAndContents('second.html', u'<p>changed</p>')])
+    self.assertEquals(1, writer.get_skipped_count())
+    self.assertEquals(1, writer.get_written_count())
+    self.assertEquals(1000, os.stat(first_page).st_mtime)
+    self.assertEquals('<p>changed</p>', self.read('second.html'))
+
+  def test_it_should_compare_pages_written_without_a_hash(self):
+    with open(os.path.join(self.directory, 'first.html'), 'wb') as page_file:
+      page_file.write('<p>first</p>')
+    writer = TemplateWriter(self.directory)
+    writer.write_templates(self.pages)
+    self.assertEquals(1, writer.get_skipped_count())
+
+  def test_it_should_write_unicode_as_utf8(self):
+    TemplateWriter(self.directory).write_templates(
+        [HtmlFileNameAndContents('caf.html', u'caf\xe9')])
+    self.assertEquals('caf\xc3\xa9', self.read('caf.html'))
+
+if __name__ == '__main__':
+  unittest.main()
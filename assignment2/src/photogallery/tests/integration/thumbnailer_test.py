@@ -0,0 +1,81 @@
+import unittest
+import os
+import shutil
+import tempfile
+from PIL import Image
+from ...generator.thumbnailer import Thumbnailer
+from ...generator.quarantine import Quarantine
+
+class ThumbnailerTest(unittest.TestCase):
+  """
+  Resizes real JPEGs in a temporary directory. Needs Pillow.
+  """
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.input_directory = os.path.join(self.directory, 'input')
+    self.output_directory = os.path.join(self.directory, 'output')
+    os.makedirs(self.input_directory)
+    self.big = os.path.join(self.input_directory, 'big.jpg')
+    Image.new('RGB', (2400, 1800), (10, 20, 30)).save(self.big, 'JPEG')
+    self.same_as_big = os.path.join(self.input_directory, 'same_as_big.jpg')
+    shutil.copyfile(self.big, self.same_as_big)
+    self.not_a_jpeg = os.path.join(self.input_directory, 'not_a_jpeg.jpg')
+    with open(self.not_a_jpeg, 'w') as text_file:
+      text_file.write('some jpeg data')
+    # A JPEG whose header claims it is 65535 pixels square.
+    self.malformed = os.path.join(self.input_directory, 'malformed.jpg')
+    Image.new('RGB', (64, 48)).save(self.malformed, 'JPEG')
+    with open(self.malformed, 'rb') as jpeg_file:
+      jpeg_data = jpeg_file.read()
+    frame_start = jpeg_data.find('\xff\xc0')
+    with open(self.malformed, 'wb') as jpeg_file:
+      jpeg_file.write(jpeg_data[:frame_start + 5] + '\xff' * 4 +
+          jpeg_data[frame_start + 9:])
+
+  def generate(self, file_names, quarantine=None):
+    thumbnailer = Thumbnailer(self.output_directory, quarantine=quarantine)
+    thumbnailer.generate(file_names)
+    return thumbnailer
+
+  def test_it_should_shrink_pictures_to_fit(self):
+    variants = self.generate([self.big]).get_variants(self.big)
+    thumbnail = Image.open(os.path.join(self.output_directory,
+        variants['thumbnail_src']))
+    self.assertEquals((200, 150), thumbnail.size)
+    web = Image.open(os.path.join(self.output_directory, variants['web_src']))
+    self.assertEquals((1024, 768), web.size)
+
+  def test_identical_pictures_should_share_variants(self):
+    thumbnailer = self.generate([self.big, self.same_as_big])
+    self.assertEquals(thumbnailer.get_variants(self.big),
+        thumbnailer.get_variants(self.same_as_big))
+
+  def test_it_should_not_resize_pictures_twice(self):
+    variants = self.generate([self.big]).get_variants(self.big)
+    thumbnail_name = os.path.join(self.output_directory,
+        variants['thumbnail_src'])
+    os.utime(thumbnail_name, (0, 0))
+    self.assertEquals(variants,
+        self.generate([self.big]).get_variants(self.big))
+    self.assertEquals(0, os.stat(thumbnail_name).st_mtime)
+
+  def test_files_that_are_not_images_should_have_no_variants(self):
+    thumbnailer = self.generate([self.not_a_jpeg])
+    self.assertEquals(None, thumbnailer.get_variants(self.not_a_jpeg))
+
+  def test_pictures_that_cannot_be_decoded_should_have_no_variants(self):
+    thumbnailer = self.generate([self.malformed, self.big])
+    self.assertEquals(None, thumbnailer.get_variants(self.malformed))
+    self.assertNotEquals(None, thumbnailer.get_variants(self.big))
+
+  def test_pictures_that_cannot_be_decoded_should_be_quarantined(self):
+    quarantine = Quarantine(None)
+    self.generate([self.malformed, self.not_a_jpeg], quarantine)
+    self.assertTrue(quarantine.is_quarantined(self.malformed))
+    self.assertFalse(quarantine.is_quarantined(self.not_a_jpeg))
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import os
+import shutil
+import tempfile
+from ...generator.watcher import PollingChangeSource
+
+class PollingChangeSourceTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.input_directory = os.path.join(self.directory, 'input')
+    os.makedirs(os.path.join(self.input_directory, 'trip'))
+    self.manifest_file = os.path.join(self.directory, 'manifest.json')
+    self.write(self.manifest_file, '{}')
+    self.write(os.path.join(self.input_directory, 'trip', 'a.jpg'), 'a')
+    self.change_source = PollingChangeSource(self.input_directory,
+        self.manifest_file, sleep=lambda seconds: None)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, file_name, contents):
+    with open(file_name, 'w') as output_file:
+      output_file.write(contents)
+
+  def test_it_should_report_nothing_if_nothing_changed(self):
+    self.assertEquals(set(), self.change_source.poll(None))
+
+  def test_it_should_report_new_and_changed_files(self):
+    new_file = os.path.join(self.input_directory, 'trip', 'b.jpg')
+    self.write(new_file, 'b')
+    self.write(self.manifest_file, '{"City": 90}')
+    # The directory holding the new file may have changed too.
+    changes = self.change_source.poll(None)
+    self.assertTrue(set([new_file, self.manifest_file]) <= changes)
+    self.assertEquals(set(), self.change_source.poll(None))
+
+  def test_it_should_report_removed_files(self):
+    removed_file = os.path.join(self.input_directory, 'trip', 'a.jpg')
+    os.remove(removed_file)
+    self.assertTrue(removed_file in self.change_source.poll(None))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import struct
+from ..generator.iptcreader import find_iptc_block, parse_iptc_datasets
+
+def iim_dataset(record, dataset, value):
+  return struct.pack('>BBBH', 0x1c, record, dataset, len(value)) + value
+
+def photoshop_resource(resource_id, data, name=''):
+  name_field = chr(len(name)) + name
+  if len(name_field) % 2:
+    name_field += '\0'
+  padding = '\0' if len(data) % 2 else ''
+  return '8BIM' + struct.pack('>H', resource_id) + name_field + \
+      struct.pack('>I', len(data)) + data + padding
+
+def jpeg_segment(marker, payload):
+  return '\xff' + chr(marker) + struct.pack('>H', len(payload) + 2) + payload
+
+def jpeg_with_iptc(iptc_block, extra_resources=''):
+  """
+  Builds the start of a JPEG file: SOI, an APP0 segment, an APP13 segment
+  holding iptc_block, and the start of the image data.
+  """
+  app13 = 'Photoshop 3.0\0' + extra_resources + \
+      photoshop_resource(0x0404, iptc_block)
+  return '\xff\xd8' + jpeg_segment(0xe0, 'JFIF\0\1\1\0\0\1\0\1\0\0') + \
+      jpeg_segment(0xed, app13) + jpeg_segment(0xda, 'image data')
+
+SAMPLE_IPTC_BLOCK = iim_dataset(1, 90, '\x1b%G') + \
+    iim_dataset(2, 0, '\0\2') + \
+    iim_dataset(2, 25, 'Jerusalem') + \
+    iim_dataset(2, 25, 'Hiking') + \
+    iim_dataset(2, 80, 'Daniel Jackson') + \
+    iim_dataset(2, 90, 'Jerusalem') + \
+    iim_dataset(2, 120, 'Hike in Ein Kerem')
+
+class FindIptcBlockTest(unittest.TestCase):
+  def test_it_should_find_the_iptc_block_in_app13(self):
+    jpeg_data = jpeg_with_iptc(SAMPLE_IPTC_BLOCK)
+    self.assertEquals(SAMPLE_IPTC_BLOCK, find_iptc_block(jpeg_data))
+
+  def test_it_should_skip_other_photoshop_resources(self):
+    other_resource = photoshop_resource(0x03ed, 'resolution', name='res')
+    jpeg_data = jpeg_with_iptc(SAMPLE_IPTC_BLOCK, other_resource)
+    self.assertEquals(SAMPLE_IPTC_BLOCK, find_iptc_block(jpeg_data))
+
+  def test_it_should_stop_at_the_image_data(self):
+    jpeg_data = '\xff\xd8' + jpeg_segment(0xda, 'image data') + \
+        jpeg_segment(0xed, 'Photoshop 3.0\0' +
+          photoshop_resource(0x0404, SAMPLE_IPTC_BLOCK))
+    self.assertEquals(None, find_iptc_block(jpeg_data))
+
+  def test_it_should_reject_files_that_are_not_jpegs(self):
+    self.assertEquals(None, find_iptc_block('some jpeg data'))
+
+  def test_it_should_stop_at_padding_that_runs_to_the_end(self):
+    self.assertEquals(None, find_iptc_block('\xff\xd8\xff\xff\xff\xff'))
+
+  def test_it_should_stop_at_a_truncated_length_field(self):
+    self.assertEquals(None, find_iptc_block('\xff\xd8\xff\xff\xff\xe1\x00'))
+
+  def test_it_should_stop_at_a_truncated_segment(self):
+    jpeg_data = jpeg_with_iptc(SAMPLE_IPTC_BLOCK)
+    truncated = jpeg_data[:jpeg_data.index('Hike in')]
+    self.assertEquals(None, find_iptc_block(truncated))
+
+class ParseIptcDatasetsTest(unittest.TestCase):
+  def test_it_should_decode_the_requested_datasets(self):
+    data = parse_iptc_datasets(SAMPLE_IPTC_BLOCK, [80, 120])
+    self.assertEquals({80: 'Daniel Jackson', 120: 'Hike in Ein Kerem'}, data)
+
+  def test_repeatable_datasets_should_be_lists(self):
+    data = parse_iptc_datasets(SAMPLE_IPTC_BLOCK, [25])
+    self.assertEquals(['Jerusalem', 'Hiking'], data[25])
+
+  def test_missing_datasets_should_be_none(self):
+    data = parse_iptc_datasets(SAMPLE_IPTC_BLOCK, [101, 20])
+    self.assertEquals(None, data[101])
+    self.assertEquals([], data[20])
+
+  def test_it_should_decode_every_dataset_if_none_are_requested(self):
+    data = parse_iptc_datasets(SAMPLE_IPTC_BLOCK)
+    self.assertEquals('Jerusalem', data[90])
+    self.assertEquals(None, data[101])
+    self.assertTrue(90 not in parse_iptc_datasets(iim_dataset(1, 90, 'x')))
+
+if __name__ == '__main__':
+  unittest.main()
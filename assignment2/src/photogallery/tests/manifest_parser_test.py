@@ -1,5 +1,7 @@
 import unittest
-from ..generator.manifestparser import parse_manifest_data
+import cPickle as pickle
+from ..generator.manifestparser import parse_manifest_data, LookupPlan
+from ..generator.metadatareader import canonical_key
 
 class ManifestParserTest(unittest.TestCase):
   def test_it_should_extract_data_from_the_json_text(self):
@@ -13,5 +15,40 @@ class ManifestParserTest(unittest.TestCase):
     self.assertTrue(result['Country'] == 101)
     self.assertTrue(result['Description'] == 120)
 
+  def test_it_should_keep_the_attributes_in_order(self):
+    result = parse_manifest_data('{"Photographer": 80, "City": 90, ' +
+        '"Country": 101, "Description": 120, "alt_text": 5}')
+    self.assertEquals(['Photographer', 'City', 'Country', 'Description',
+      'alt_text'], result.keys())
+
+class LookupPlanTest(unittest.TestCase):
+  def setUp(self):
+    self.plan = LookupPlan(parse_manifest_data(
+      '{"Photographer": 80, "alt_text": 5, "City": 90}'))
+
+  def test_it_should_list_its_entries_in_manifest_order(self):
+    self.assertEquals((('Photographer', 80), ('alt_text', 5), ('City', 90)),
+        self.plan.get_entries())
+    self.assertEquals(1, self.plan.get_alt_text_index())
+
+  def test_it_should_still_be_a_lookup_table(self):
+    self.assertEquals(90, self.plan['City'])
+    self.assertTrue('Country' not in self.plan)
+
+  def test_it_should_survive_pickling(self):
+    copy = pickle.loads(pickle.dumps(self.plan, pickle.HIGHEST_PROTOCOL))
+    self.assertEquals(self.plan.get_entries(), copy.get_entries())
+    self.assertEquals(dict(self.plan), dict(copy))
+
+  def test_it_should_convert_the_keys_it_is_given_a_function_for(self):
+    plan = LookupPlan(parse_manifest_data('{"Photographer": "by-line", ' +
+      '"City": "iptc:90", "Artist": "exif:Artist"}'), canonical_key)
+    self.assertEquals((('Photographer', 80), ('City', 90),
+      ('Artist', 'exif:Artist')), plan.get_entries())
+
+  def test_it_should_reject_keys_the_function_rejects(self):
+    self.assertRaises(ValueError, LookupPlan,
+        parse_manifest_data('{"Photographer": "Photographer"}'), canonical_key)
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,162 @@
+import unittest
+import struct
+from ..generator.metadatareader import parse_key, canonical_key, \
+    needs_metadata_reader, find_metadata_segments, parse_exif, parse_xmp, \
+    EXIF, XMP, IPTC, EXIF_TAGS, XMP_NAMESPACES
+from iptc_reader_test import jpeg_segment, photoshop_resource, iim_dataset
+
+def tiff_structure(byte_order, ifd0_entries, exif_entries):
+  """
+  Builds an EXIF TIFF structure with IFD0 pointing to an EXIF IFD. Entries
+  are (tag, type, count, value bytes) tuples.
+  """
+  prefix = '<' if byte_order == 'II' else '>'
+  def ifd_size(entries):
+    return 2 + 12 * len(entries) + 4
+  ifd0_entries = ifd0_entries + [(0x8769, 4, 1, None)]
+  ifd0_offset = 8
+  exif_offset = ifd0_offset + ifd_size(ifd0_entries)
+  data_offset = exif_offset + ifd_size(exif_entries)
+  data_area = []
+  def pack_ifd(entries):
+    packed = struct.pack(prefix + 'H', len(entries))
+    for tag, value_type, count, value in entries:
+      if value is None:
+        value = struct.pack(prefix + 'I', exif_offset)
+      if len(value) <= 4:
+        field = value.ljust(4, '\0')
+      else:
+        field = struct.pack(prefix + 'I',
+            data_offset + len(''.join(data_area)))
+        data_area.append(value)
+      packed += struct.pack(prefix + 'HHI', tag, value_type, count) + field
+    return packed + struct.pack(prefix + 'I', 0)
+  ifds = pack_ifd(ifd0_entries) + pack_ifd(exif_entries)
+  return byte_order + struct.pack(prefix + 'HI', 42, ifd0_offset) + ifds + \
+      ''.join(data_area)
+
+def ascii_entry(tag, text):
+  return (tag, 2, len(text) + 1, text + '\0')
+
+SAMPLE_XMP = '''<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description rdf:about=""
+    xmlns:dc="http://purl.org/dc/elements/1.1/"
+    xmlns:photoshop="http://ns.adobe.com/photoshop/1.0/"
+    photoshop:City="Jerusalem">
+   <dc:title><rdf:Alt>
+    <rdf:li xml:lang="he">Tiyul</rdf:li>
+    <rdf:li xml:lang="x-default">Hike in Ein Kerem</rdf:li>
+   </rdf:Alt></dc:title>
+   <dc:subject><rdf:Bag>
+    <rdf:li>Jerusalem</rdf:li><rdf:li>Hiking</rdf:li>
+   </rdf:Bag></dc:subject>
+  </rdf:Description>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>'''
+
+def xmp_name(prefix, name):
+  return '{%s}%s' % (XMP_NAMESPACES[prefix], name)
+
+class ParseKeyTest(unittest.TestCase):
+  def test_numbers_should_be_iptc_datasets(self):
+    self.assertEquals((IPTC, 80), parse_key(80))
+    self.assertEquals((IPTC, 80), parse_key('iptc:80'))
+
+  def test_it_should_look_up_iptc_datasets_by_name(self):
+    self.assertEquals((IPTC, 80), parse_key('by-line'))
+    self.assertEquals((IPTC, 90), parse_key(u'iptc:city'))
+
+  def test_canonical_iptc_keys_should_be_dataset_numbers(self):
+    self.assertEquals([80, 80, 80, 'exif:Artist'], [canonical_key(key) \
+        for key in [80, 'iptc:80', 'by-line', 'exif:Artist']])
+    self.assertRaises(ValueError, canonical_key, 'Photographer')
+
+  def test_it_should_look_up_exif_tags_by_name_or_number(self):
+    self.assertEquals((EXIF, 0x013b), parse_key('exif:Artist'))
+    self.assertEquals((EXIF, 0x013b), parse_key('exif:0x013b'))
+
+  def test_it_should_expand_xmp_prefixes(self):
+    self.assertEquals((XMP, xmp_name('dc', 'creator')),
+        parse_key(u'xmp:dc:creator'))
+
+  def test_it_should_reject_keys_it_does_not_understand(self):
+    self.assertRaises(ValueError, parse_key, 'exif:NoSuchTag')
+    self.assertRaises(ValueError, parse_key, 'xmp:nosuchprefix:title')
+    self.assertRaises(ValueError, parse_key, 'Photographer')
+
+  def test_only_exif_and_xmp_keys_need_the_metadata_reader(self):
+    self.assertFalse(needs_metadata_reader([80, 120]))
+    self.assertTrue(needs_metadata_reader([80, 'exif:Artist']))
+
+class FindMetadataSegmentsTest(unittest.TestCase):
+  def setUp(self):
+    self.tiff = tiff_structure('II', [ascii_entry(0x013b, 'Daniel')], [])
+    self.iptc_block = iim_dataset(2, 80, 'Daniel Jackson')
+    self.jpeg_data = '\xff\xd8' + \
+        jpeg_segment(0xe1, 'Exif\0\0' + self.tiff) + \
+        jpeg_segment(0xe1, 'http://ns.adobe.com/xap/1.0/\0' + SAMPLE_XMP) + \
+        jpeg_segment(0xed, 'Photoshop 3.0\0' +
+          photoshop_resource(0x0404, self.iptc_block)) + \
+        jpeg_segment(0xda, 'image data')
+
+  def test_it_should_find_every_kind_in_one_walk(self):
+    segments = find_metadata_segments(self.jpeg_data,
+        frozenset([EXIF, XMP, IPTC]))
+    self.assertEquals(self.tiff, segments[EXIF])
+    self.assertEquals(SAMPLE_XMP, segments[XMP])
+    self.assertEquals(self.iptc_block, segments[IPTC])
+
+  def test_it_should_only_keep_the_kinds_asked_for(self):
+    self.assertEquals([XMP], find_metadata_segments(self.jpeg_data,
+      frozenset([XMP])).keys())
+
+  def test_it_should_stop_at_the_image_data(self):
+    jpeg_data = '\xff\xd8' + jpeg_segment(0xda, 'image data') + \
+        jpeg_segment(0xe1, 'Exif\0\0' + self.tiff)
+    self.assertEquals({}, find_metadata_segments(jpeg_data,
+      frozenset([EXIF])))
+
+class ParseExifTest(unittest.TestCase):
+  def create_tiff(self, byte_order):
+    prefix = '<' if byte_order == 'II' else '>'
+    return tiff_structure(byte_order,
+        [ascii_entry(0x013b, 'Daniel Jackson'),
+          (0x0112, 3, 1, struct.pack(prefix + 'H', 6))],
+        [(0x829a, 5, 1, struct.pack(prefix + 'II', 1, 250)),
+          (0x829d, 5, 1, struct.pack(prefix + 'II', 28, 10)),
+          (0x9286, 7, 13, 'ASCII\0\0\0Hello')])
+
+  def test_it_should_decode_tags_from_both_directories(self):
+    for byte_order in ('II', 'MM'):
+      tags = [EXIF_TAGS[name] for name in ('Artist', 'Orientation',
+        'ExposureTime', 'FNumber', 'UserComment')]
+      values = parse_exif(self.create_tiff(byte_order), tags)
+      self.assertEquals(['Daniel Jackson', '6', '1/250', '2.8', 'Hello'],
+          [values[tag] for tag in tags])
+
+  def test_missing_tags_should_be_left_out(self):
+    self.assertEquals({}, parse_exif(self.create_tiff('II'),
+      [EXIF_TAGS['LensModel']]))
+
+  def test_it_should_survive_damaged_structures(self):
+    tiff = self.create_tiff('II')
+    self.assertEquals({}, parse_exif(tiff[:20], [EXIF_TAGS['Artist']]))
+    self.assertEquals({}, parse_exif('not a tiff', [EXIF_TAGS['Artist']]))
+
+class ParseXmpTest(unittest.TestCase):
+  def test_it_should_read_attributes_and_elements(self):
+    properties = [xmp_name('photoshop', 'City'), xmp_name('dc', 'title'),
+        xmp_name('dc', 'subject'), xmp_name('dc', 'creator')]
+    values = parse_xmp(SAMPLE_XMP, properties)
+    self.assertEquals({xmp_name('photoshop', 'City'): 'Jerusalem',
+      xmp_name('dc', 'title'): 'Hike in Ein Kerem',
+      xmp_name('dc', 'subject'): 'Jerusalem, Hiking'}, values)
+
+  def test_it_should_ignore_malformed_packets(self):
+    self.assertEquals({}, parse_xmp('<x:xmpmeta', [xmp_name('dc', 'title')]))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from ..generator.profiler import BuildProfiler, NullProfiler
+
+class StubClock(object):
+  """ A clock that only moves when it is told to. """
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+  def advance(self, seconds):
+    self.now += seconds
+
+class StubPage(object):
+  def __init__(self, contents):
+    self.contents = contents
+
+  def get_contents(self):
+    return self.contents
+
+def phases_by_name(profiler):
+  return dict((phase['name'], phase) \
+      for phase in profiler.create_report()['phases'])
+
+class BuildProfilerTest(unittest.TestCase):
+  def setUp(self):
+    self.clock = StubClock()
+    self.profiler = BuildProfiler('/not/real', clock=self.clock)
+    self.profiler.start()
+
+  def test_it_should_time_each_phase(self):
+    with self.profiler.phase('scan'):
+      self.clock.advance(2)
+      self.profiler.count(files=5, bytes=100)
+    with self.profiler.phase('copy files'):
+      self.clock.advance(3)
+    self.profiler.finished_at = self.clock()
+    report = self.profiler.create_report()
+    self.assertEquals(['scan', 'copy files'],
+        [phase['name'] for phase in report['phases']])
+    self.assertEquals(5, report['total_seconds'])
+    scan = phases_by_name(self.profiler)['scan']
+    self.assertEquals((2, 5, 100),
+        (scan['seconds'], scan['files'], scan['bytes']))
+
+  def test_it_should_charge_iteration_time_to_the_nested_phase(self):
+    def render_pages():
+      for contents in ['<html>', '<html></html>']:
+        self.clock.advance(1)
+        yield StubPage(contents)
+    with self.profiler.phase('write pages'):
+      for page in self.profiler.iterate_phase('render pages', render_pages()):
+        self.clock.advance(0.5)
+    self.profiler.finished_at = self.clock()
+    phases = phases_by_name(self.profiler)
+    self.assertEquals(2, phases['render pages']['seconds'])
+    self.assertEquals(1, phases['write pages']['seconds'])
+    self.assertEquals(2, phases['render pages']['files'])
+    self.assertEquals(19, phases['write pages']['bytes'])
+
+  def test_it_should_count_unicode_contents_in_utf8_bytes(self):
+    with self.profiler.phase('write pages'):
+      list(self.profiler.iterate_phase('render pages',
+        [StubPage(u'<p>J\u00e9rusalem</p>')]))
+    self.profiler.finished_at = self.clock()
+    self.assertEquals(17, phases_by_name(self.profiler)['render pages']['bytes'])
+
+  def test_it_should_keep_only_the_slowest_iptc_reads(self):
+    self.profiler.slowest_count = 2
+    for index, seconds in enumerate([0.1, 0.5, 0.2, 0.4]):
+      self.profiler.record_iptc_read('/pics/%d.jpg' % index, seconds)
+    self.profiler.finished_at = self.clock()
+    report = self.profiler.create_report()
+    self.assertEquals(4, report['iptc_reads'])
+    self.assertEquals(['/pics/1.jpg', '/pics/3.jpg'],
+        [read['file'] for read in report['slowest_iptc_reads']])
+
+class NullProfilerTest(unittest.TestCase):
+  def test_it_should_pass_iterables_through(self):
+    profiler = NullProfiler()
+    profiler.start()
+    with profiler.phase('scan'):
+      profiler.count(files=1)
+    self.assertEquals([1, 2], list(profiler.iterate_phase('render', [1, 2])))
+    profiler.finish()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from StringIO import StringIO
+from ..generator.progress import ProgressReporter, NullProgressReporter, \
+    format_duration, format_bytes, IMAGES, PAGES, COPIED_BYTES
+
+class StubClock(object):
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+class ProgressReporterTest(unittest.TestCase):
+  def setUp(self):
+    self.clock = StubClock()
+    self.stream = StringIO()
+    self.reporter = ProgressReporter(self.stream, interval_seconds=10,
+        clock=self.clock)
+    self.reporter.start()
+
+  def lines(self):
+    return self.stream.getvalue().splitlines()
+
+  def test_it_should_estimate_the_time_left_in_a_stage(self):
+    with self.reporter.stage('read metadata', IMAGES, 100):
+      self.clock.now += 20
+      self.reporter.count(IMAGES, 25)
+      report = self.reporter.create_report()
+    self.assertEquals(25, report['done'])
+    self.assertEquals(1.25, report['rate'])
+    self.assertEquals(60, report['eta_seconds'])
+
+  def test_it_should_only_report_every_interval(self):
+    with self.reporter.stage('write pages', PAGES):
+      for index in range(30):
+        self.clock.now += 1
+        self.reporter.count(PAGES)
+      self.assertEquals(3, len(self.lines()))
+    self.assertEquals(4, len(self.lines()))
+    self.assertEquals('[0:00:30] write pages: 30 pages (1.0/s) | 0 images, ' +
+        '0 thumbnails, 30 pages, 0 files (0 B) copied', self.lines()[-1])
+    self.assertEquals(None, self.reporter.create_report()['stage'])
+
+  def test_stages_should_learn_their_totals_as_they_go(self):
+    with self.reporter.stage('copy files', COPIED_BYTES):
+      self.reporter.add_to_total(3000)
+      self.clock.now += 2
+      self.reporter.count(COPIED_BYTES, 1000)
+      self.reporter.add_to_total(1000)
+      report = self.reporter.create_report()
+    self.assertEquals(4000, report['total'])
+    self.assertEquals(6, report['eta_seconds'])
+    self.assertTrue(self.lines()[-1].startswith(
+        '[0:00:02] copy files: 1000 B of 3.9 KiB copied (500 B/s) ETA'))
+
+  def test_it_should_count_the_items_it_iterates_over(self):
+    self.assertEquals(['a', 'b'],
+        list(self.reporter.iterate(PAGES, iter(['a', 'b']))))
+    self.assertEquals(2, self.reporter.create_report()[PAGES])
+
+  def test_it_should_say_when_the_build_failed(self):
+    self.reporter.finish(succeeded=False)
+    self.assertTrue(self.lines()[-1].startswith('[0:00:00] failed: '))
+
+  def test_null_reporter_should_pass_items_through(self):
+    reporter = NullProgressReporter()
+    reporter.start()
+    with reporter.stage('read metadata', IMAGES, 10):
+      reporter.count(IMAGES)
+    self.assertEquals([1], list(reporter.iterate(PAGES, [1])))
+    reporter.finish()
+
+  def test_it_should_format_durations_and_sizes(self):
+    self.assertEquals('1:01:05', format_duration(3665))
+    self.assertEquals('512 B', format_bytes(512))
+    self.assertEquals('1.5 MiB', format_bytes(1572864))
+
+if __name__ == '__main__':
+  unittest.main()
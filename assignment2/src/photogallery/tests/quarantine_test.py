@@ -0,0 +1,53 @@
+import unittest
+from ..generator.quarantine import Quarantine, describe_exception
+
+class StubStatResult(object):
+  def __init__(self, st_mtime, st_size):
+    self.st_mtime = st_mtime
+    self.st_size = st_size
+
+class QuarantineTest(unittest.TestCase):
+  def setUp(self):
+    self.stamps = {'/pics/a.jpg': (100, 2000)}
+    self.quarantine = Quarantine(None, stat_file=self.stat)
+
+  def stat(self, name):
+    if name not in self.stamps:
+      raise OSError(name)
+    return StubStatResult(*self.stamps[name])
+
+  def test_it_should_describe_exceptions_in_one_line(self):
+    self.assertEquals("KeyError: 'garbled'",
+        describe_exception(KeyError('garbled')))
+
+  def test_it_should_quarantine_added_files(self):
+    self.assertFalse(self.quarantine.is_quarantined('/pics/a.jpg'))
+    self.quarantine.add('/pics/a.jpg', ValueError('Something unexpected'))
+    self.assertTrue(self.quarantine.is_quarantined('/pics/a.jpg'))
+    self.assertEquals(1, self.quarantine.get_added_count())
+    self.assertEquals(1, self.quarantine.get_size())
+
+  def test_it_should_release_files_that_changed(self):
+    self.quarantine.add('/pics/a.jpg', ValueError('Something unexpected'))
+    self.stamps['/pics/a.jpg'] = (200, 2000)
+    self.assertFalse(self.quarantine.is_quarantined('/pics/a.jpg'))
+    self.assertEquals(0, self.quarantine.get_size())
+
+  def test_it_should_release_files_that_are_gone(self):
+    self.quarantine.add('/pics/a.jpg', ValueError('Something unexpected'))
+    del self.stamps['/pics/a.jpg']
+    self.assertFalse(self.quarantine.is_quarantined('/pics/a.jpg'))
+
+  def test_pruning_should_only_keep_files_that_are_still_quarantined(self):
+    self.stamps['/pics/b.jpg'] = (100, 3000)
+    self.stamps['/pics/c.jpg'] = (100, 4000)
+    for name in ['/pics/a.jpg', '/pics/b.jpg', '/pics/c.jpg']:
+      self.quarantine.add(name, ValueError('Something unexpected'))
+    self.stamps['/pics/b.jpg'] = (200, 3000)
+    del self.stamps['/pics/c.jpg']
+    self.assertEquals(2, self.quarantine.prune())
+    self.assertEquals(1, self.quarantine.get_size())
+    self.assertTrue(self.quarantine.is_quarantined('/pics/a.jpg'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import stat
+from ..generator.scanner import FileIndex
+
+class StubStatResult(object):
+  def __init__(self, st_mode):
+    self.st_mode = st_mode
+
+class StubFileSystem(object):
+  """
+  A tree with a file and a subdirectory in the root, and a file in the
+  subdirectory. Counts how often each path is touched.
+  """
+  def __init__(self):
+    self.listings = {'/root': ['b.jpg', 'sub', 'style.css', 'dangling.jpg'],
+        '/root/sub': ['a.jpg']}
+    self.list_counts = {}
+    self.stat_counts = {}
+
+  def listdir(self, path):
+    self.list_counts[path] = self.list_counts.get(path, 0) + 1
+    return self.listings[path]
+
+  def stat(self, path):
+    self.stat_counts[path] = self.stat_counts.get(path, 0) + 1
+    if path.endswith('dangling.jpg'):
+      raise OSError(path)
+    if path in self.listings:
+      return StubStatResult(stat.S_IFDIR)
+    return StubStatResult(stat.S_IFREG)
+
+def is_jpeg(name):
+  return name.endswith('.jpg')
+
+class FileIndexTest(unittest.TestCase):
+  def setUp(self):
+    self.file_system = StubFileSystem()
+    self.index = FileIndex('/root', list_directory=self.file_system.listdir,
+        stat_file=self.file_system.stat)
+
+  def test_it_should_list_directories_like_listdir(self):
+    self.assertEquals(['b.jpg', 'sub', 'style.css', 'dangling.jpg'],
+        self.index.list_directory_contents('/root'))
+    self.assertEquals(['a.jpg'], self.index.list_directory_contents('/root/sub'))
+
+  def test_it_should_know_which_entries_are_directories(self):
+    self.assertTrue(self.index.is_directory('/root/sub'))
+    self.assertFalse(self.index.is_directory('/root/b.jpg'))
+    self.assertFalse(self.index.is_directory('/root/dangling.jpg'))
+
+  def test_it_should_find_files_by_type(self):
+    self.assertEquals(['/root/b.jpg', '/root/sub/a.jpg'],
+        self.index.find_files(is_jpeg))
+
+  def test_it_should_raise_OSError_for_entries_it_could_not_stat(self):
+    self.assertRaises(OSError, self.index.stat, '/root/dangling.jpg')
+
+  def test_it_should_touch_each_entry_only_once(self):
+    self.index.find_files(is_jpeg)
+    self.index.find_files(lambda name: name.endswith('.css'))
+    for name in ['/root/b.jpg', '/root/sub', '/root/sub/a.jpg']:
+      self.index.stat(name)
+      self.index.is_directory(name)
+    self.index.list_directory_contents('/root/sub')
+    self.assertEquals({'/root': 1, '/root/sub': 1},
+        self.file_system.list_counts)
+    self.assertTrue(all(count == 1 for count in
+      self.file_system.stat_counts.values()))
+
+  def test_it_should_list_directories_before_their_subdirectories(self):
+    self.assertEquals(['/root', '/root/sub'],
+        self.index.get_directory_names())
+
+  def test_it_should_leave_out_the_entries_it_is_told_to(self):
+    index = FileIndex('/root', list_directory=self.file_system.listdir,
+        stat_file=self.file_system.stat,
+        include_entry=lambda name, is_directory: not is_directory)
+    self.assertEquals(['b.jpg', 'style.css', 'dangling.jpg'],
+        index.list_directory_contents('/root'))
+    self.assertEquals(['/root/b.jpg'], index.find_files(is_jpeg))
+    self.assertEquals(['/root'], index.get_directory_names())
+    self.assertFalse('/root/sub' in self.file_system.list_counts)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import unittest
+import simplejson as json
+from ..generator.galleryitem import JpegDirectory
+from ..generator.searchindex import SearchIndexBuilder, extract_terms, \
+    shard_key, delta_encode, to_text
+
+class StubPicture(object):
+  def __init__(self, name, caption_fields):
+    self.name = name
+    self.caption_fields = caption_fields
+
+  def get_name(self):
+    return self.name
+
+  def get_caption_fields(self):
+    return self.caption_fields
+
+  def as_entry_view(self):
+    return {'href': self.name.replace('.jpg', '.html'),
+        'thumbnail_src': self.name}
+
+def files_by_name(builder):
+  return dict((html_file.get_file_name(), json.loads(html_file.get_contents()))
+      for html_file in builder.iter_files())
+
+class TermTest(unittest.TestCase):
+  def test_it_should_split_text_into_distinct_lower_case_terms(self):
+    self.assertEquals([u'sunset', u'over', u'the', u'bay', u'at'],
+        extract_terms(u'Sunset over the bay, THE BAY at 6'))
+
+  def test_it_should_decode_utf8_and_fall_back_to_latin1(self):
+    self.assertEquals(u'caf\xe9', to_text('caf\xc3\xa9'))
+    self.assertEquals(u'caf\xe9', to_text('caf\xe9'))
+    self.assertEquals(u'red blue', to_text(['red', 'blue']))
+
+  def test_it_should_spell_out_unsafe_characters_in_shard_keys(self):
+    self.assertEquals('ca', shard_key(u'cat', 2))
+    self.assertEquals('_e9t', shard_key(u'\xe9t\xe9', 2))
+
+  def test_it_should_delta_encode(self):
+    self.assertEquals([3, 1, 5], delta_encode([3, 4, 9]))
+
+class SearchIndexBuilderTest(unittest.TestCase):
+  def setUp(self):
+    self.builder = SearchIndexBuilder(documents_per_shard=2)
+    subdirectory = JpegDirectory('/top/sub', [
+      StubPicture('c.jpg', [('title', 'Bay at dusk')])], False)
+    self.top_directory = JpegDirectory('/top', [
+      StubPicture('a.jpg', [('title', 'Sunset'), ('keywords', ['bay', 'sea'])]),
+      subdirectory,
+      StubPicture('b.jpg', [('title', None)])], False)
+    self.builder.add_directory_tree(self.top_directory)
+
+  def test_it_should_describe_the_layout_in_the_index_file(self):
+    index = files_by_name(self.builder)['index.json']
+    self.assertEquals(3, index['document_count'])
+    self.assertEquals(2, index['documents_per_shard'])
+    self.assertEquals(2, index['prefix_length'])
+
+  def test_it_should_shard_the_documents_in_display_order(self):
+    files = files_by_name(self.builder)
+    self.assertEquals([['a.html', 'a.jpg', 'Sunset, bay sea'],
+      ['b.html', 'b.jpg', '']], files['docs-0.json'])
+    self.assertEquals([['c.html', 'c.jpg', 'Bay at dusk']],
+        files['docs-1.json'])
+
+  def test_it_should_shard_the_terms_by_prefix(self):
+    files = files_by_name(self.builder)
+    self.assertEquals({'bay': [0, 2]}, files['terms-ba.json'])
+    self.assertEquals({'sunset': [0]}, files['terms-su.json'])
+    self.assertFalse('terms-jp.json' in files)
+
+  def test_it_should_index_file_names_without_their_extension(self):
+    builder = SearchIndexBuilder()
+    builder.add_picture(StubPicture('IMG_0042.jpg', []))
+    self.assertEquals({'img_0042': [0]},
+        files_by_name(builder)['terms-im.json'])
+
+  def test_it_should_hand_back_the_documents_under_a_directory(self):
+    self.assertEquals([(['c.html', 'c.jpg', u'Bay at dusk'],
+      [u'at', u'bay', u'dusk'])],
+      self.builder.get_subtree_documents('/top/sub'))
+    self.assertEquals(3, len(self.builder.get_subtree_documents('/top')))
+
+  def test_it_should_add_documents_from_another_index(self):
+    builder = SearchIndexBuilder()
+    for document, terms in self.builder.get_subtree_documents('/top/sub'):
+      builder.add_document(document, terms)
+    self.assertEquals({'bay': [0]}, files_by_name(builder)['terms-ba.json'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from ..generator.galleryitem import DirectorySummary
+from ..generator.sharding import Shard, parse_shard, shard_of, is_merge_entry
+
+class ShardTest(unittest.TestCase):
+  def setUp(self):
+    self.shards = [Shard('/photos/', number, 3) for number in range(1, 4)]
+
+  def test_it_should_parse_shards(self):
+    self.assertEquals((2, 4), parse_shard('2/4'))
+    for text in ['0/4', '5/4', '2', 'a/b', '1/2/3']:
+      self.assertRaises(ValueError, parse_shard, text)
+
+  def test_it_should_pick_the_same_shard_every_time(self):
+    self.assertEquals(shard_of('2010', 3), shard_of(u'2010', 3))
+    self.assertTrue(1 <= shard_of('2010', 3) <= 3)
+    self.assertEquals(1, shard_of('2010', 1))
+
+  def test_each_top_level_directory_should_go_to_exactly_one_shard(self):
+    for name in ['/photos/2010', '/photos/2011', '/photos/paris']:
+      owners = [shard for shard in self.shards \
+          if shard.include_entry(name, True)]
+      self.assertEquals(1, len(owners))
+      self.assertEquals(shard_of(name.split('/')[-1], 3), owners[0].number)
+
+  def test_it_should_normalize_the_input_directory(self):
+    for input_directory in ['./photos', 'photos/.', 'photos/']:
+      shards = [Shard(input_directory, number, 3) for number in range(1, 4)]
+      owners = [shard for shard in shards \
+          if shard.include_entry(input_directory + '/2010', True)]
+      self.assertEquals(1, len(owners))
+      self.assertFalse(shards[0].include_entry(input_directory + '/cover.jpg',
+        False))
+      self.assertFalse(shards[0].is_shard_page(
+        DirectorySummary(input_directory, None)))
+
+  def test_it_should_leave_the_top_level_files_to_the_merge_step(self):
+    for shard in self.shards:
+      self.assertFalse(shard.include_entry('/photos/cover.jpg', False))
+      self.assertTrue(shard.include_entry('/photos/2010/a.jpg', False))
+    self.assertTrue(is_merge_entry('/photos/cover.jpg', False))
+    self.assertFalse(is_merge_entry('/photos/2010', True))
+
+  def test_it_should_leave_the_top_level_page_to_the_merge_step(self):
+    shard = self.shards[0]
+    self.assertFalse(shard.is_shard_page(DirectorySummary('/photos', None)))
+    self.assertTrue(shard.is_shard_page(
+      DirectorySummary('/photos/2010', 'photos.html')))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from ..generator.watcher import GalleryWatcher, is_relevant_change
+
+class StubChangeSource(object):
+  """ Returns a scripted set of changes from each call to poll. """
+  def __init__(self, batches):
+    self.batches = list(batches)
+    self.timeouts = []
+
+  def poll(self, timeout_seconds):
+    self.timeouts.append(timeout_seconds)
+    if not self.batches:
+      return set()
+    return set(self.batches.pop(0))
+
+class GalleryWatcherTest(unittest.TestCase):
+  def setUp(self):
+    self.rebuild_count = 0
+
+  def rebuild(self):
+    self.rebuild_count += 1
+
+  def create_watcher(self, batches):
+    self.change_source = StubChangeSource(batches)
+    return GalleryWatcher(self.change_source,
+        lambda path: not path.endswith('.swp'), self.rebuild,
+        debounce_seconds=0.5)
+
+  def test_it_should_collect_a_burst_of_changes(self):
+    watcher = self.create_watcher([[], ['/in/a.jpg'], ['/in/b.jpg'], []])
+    self.assertEquals(set(['/in/a.jpg', '/in/b.jpg']),
+        watcher.wait_for_changes())
+    self.assertEquals([None, None, 0.5, 0.5], self.change_source.timeouts)
+
+  def test_it_should_ignore_irrelevant_changes(self):
+    watcher = self.create_watcher([['/in/.a.jpg.swp'], ['/in/a.jpg'], []])
+    self.assertEquals(set(['/in/a.jpg']), watcher.wait_for_changes())
+
+  def test_it_should_rebuild_once_per_burst(self):
+    watcher = self.create_watcher([['/in/a.jpg'], ['/in/b.jpg'], [],
+      ['/in/c.jpg'], []])
+    watcher.watch(rebuild_count=2)
+    self.assertEquals(2, self.rebuild_count)
+
+  def test_it_should_keep_watching_after_a_failed_rebuild(self):
+    def failing_rebuild():
+      self.rebuild_count += 1
+      raise IOError('half copied')
+    watcher = GalleryWatcher(StubChangeSource([['/in/a.jpg'], [],
+      ['/in/a.jpg'], []]), lambda path: True, failing_rebuild)
+    watcher.watch(rebuild_count=2)
+    self.assertEquals(2, self.rebuild_count)
+
+class IsRelevantChangeTest(unittest.TestCase):
+  def test_input_files_and_the_manifest_are_relevant(self):
+    self.assertTrue(is_relevant_change('/in/trip/a.jpg', '/in',
+      '/etc/manifest.json', '/out'))
+    self.assertTrue(is_relevant_change('/etc/manifest.json', '/in',
+      '/etc/manifest.json', '/out'))
+
+  def test_other_files_are_not(self):
+    self.assertFalse(is_relevant_change('/etc/other.json', '/in',
+      '/etc/manifest.json', '/out'))
+    self.assertFalse(is_relevant_change('/input/a.jpg', '/in',
+      '/etc/manifest.json', '/out'))
+
+  def test_output_inside_the_input_is_not_relevant(self):
+    self.assertFalse(is_relevant_change('/in/site/a.html', '/in',
+      '/etc/manifest.json', '/in/site'))
+
+if __name__ == '__main__':
+  unittest.main()